@@ -10,6 +10,7 @@
     Library for Line Loss Analysis and Calculation of Electric Power Systems
 '''
 
+import os
 import numpy as np
 # import scipy.integrate as integrate
 # import matplotlib.pyplot as plt
@@ -34,6 +35,7 @@ class Conductor:
     # Rac0 # AC resistance of conductor at the temperature T0 [Ohms/km]
     # Rac1 # AC resistance of conductor at the temperature T1 [Ohms/km]
     # Found_cable # 0: default. 1: NameConductor found in the .xml library
+    # LibraryCache # Parsed .xml libraries, shared by all the instances
     
     version = r'Line Loss Analysis Library. v0.05'
     Rdc: float
@@ -52,6 +54,7 @@ class Conductor:
     Rac1: float
     NameConductor: str
     LibraryConductor = r'cable_library.xml'
+    LibraryCache = {}
     Found_cable: int
     
     
@@ -137,8 +140,11 @@ class Conductor:
         self.NameConductor = NameConductor
         self.Found_cable = 0
         
-        cable_library = ET.ElementTree( file=r'./cable_library.xml')
-        cable_library_root = cable_library.getroot()
+        #La librería .xml se lee una sola vez y se guarda a nivel de clase, el resto de instancias reutilizan el árbol ya leído.
+        ruta_library = os.path.abspath( r'./cable_library.xml')
+        if ruta_library not in Conductor.LibraryCache:
+            Conductor.LibraryCache[ruta_library] = ET.ElementTree( file=ruta_library).getroot()
+        cable_library_root = Conductor.LibraryCache[ruta_library]
 
         for children in cable_library_root:
         #print( childrem.tag, childrem.attrib)
@@ -21,6 +21,7 @@ import networkx as nx
 import math
 import pyodbc 
 import sys, os
+import gzip
 import time
 import datetime
 import logging
@@ -29,6 +30,105 @@ import os.path as path
 import cable # UC Library for Line Loss Analysis and Calculation of Electric Power Systems. Add in the same folder
 
 
+def nodos_en_bucles(G):
+    """
+    
+    Función para obtener los nodos que pueden formar parte de un bucle. Se eliminan de forma iterativa los nodos con un único vecino (ramas en árbol) y quedan solo
+    los bucles y los caminos que los unen (2-core del grafo). En una red de distribución, casi en árbol, es una parte muy pequeña del grafo.
+    
+    Parámetros
+    ----------
+    G : Grafo a analizar.
+    
+    Retorno
+    -------
+    Lista de nodos del grafo que no se han eliminado.
+    """
+    grado = {nodo: len([vecino for vecino in G[nodo] if vecino != nodo]) for nodo in G}
+    hojas = [nodo for nodo in grado if grado[nodo] <= 1]
+    eliminados = set()
+    while hojas:
+        nodo = hojas.pop()
+        if nodo in eliminados:
+            continue
+        eliminados.add(nodo)
+        for vecino in G[nodo]:
+            if vecino != nodo and vecino not in eliminados:
+                grado[vecino] -= 1
+                if grado[vecino] == 1:
+                    hojas.append(vecino)
+    return [nodo for nodo in G if nodo not in eliminados]
+
+
+def get_hashable_cycle(cycle):
+    """cycle as a tuple in a deterministic order."""
+    m = min(cycle)
+    mi = cycle.index(m)
+    mi_plus_1 = mi + 1 if mi < len(cycle) - 1 else 0
+    if cycle[mi-1] > cycle[mi_plus_1]:
+        result = cycle[mi:] + cycle[:mi]
+    else:
+        result = list(reversed(cycle[:mi_plus_1])) + list(reversed(cycle[mi_plus_1:]))
+    return tuple(result)
+
+
+def find_all_cycles(adj):
+    """
+    
+    Función para encontrar todos los ciclos existentes en un grafo. Código adaptado de https://gist.github.com/joe-jordan/6548029
+    La búsqueda recorre todos los caminos desde el nodo inicial, por lo que encuentra todos los bucles de su componente conexa. Se parte de un único nodo por componente.
+    
+    Parámetros
+    ----------
+    adj : Diccionario con la lista de vecinos de cada nodo {nodo: [vecinos]}.
+    
+    Retorno
+    -------
+    list_bucles : Lista de bucles (listas de nodos) ordenados de menor a mayor número de enlaces.
+    """
+    #La búsqueda se hace con identificadores enteros de los nodos (posición en la lista nodos) y listas en lugar de diccionarios. Los nombres solo se recuperan al guardar un bucle.
+    nodos = list(adj)
+    id_nodo = {nodo: i for i, nodo in enumerate(nodos)}
+    vecinos = [[id_nodo[vecino] for vecino in adj[nodo]] for nodo in nodos]
+    # extra variables for cycle detection:
+    cycle_stack = []
+    #Posición de cada nodo en cycle_stack (-1 si no está). Sustituye a las búsquedas lineales 'in cycle_stack' y cycle_stack.index().
+    stack_pos = [-1] * len(nodos)
+    #Nodos ya recorridos. La búsqueda desde un nodo alcanza toda su componente, por lo que no se vuelve a empezar desde ellos.
+    visitados = [False] * len(nodos)
+    output_cycles = set()
+    
+    for start in range(len(nodos)):
+        if visitados[start]:
+            continue
+        visitados[start] = True
+        stack_pos[start] = len(cycle_stack)
+        cycle_stack.append(start)
+        
+        stack = [iter(vecinos[start])]
+        while stack:
+            try:
+                child = next(stack[-1])
+                
+                i = stack_pos[child]
+                if i < 0:
+                    visitados[child] = True
+                    stack_pos[child] = len(cycle_stack)
+                    cycle_stack.append(child)
+                    stack.append(iter(vecinos[child]))
+                elif i < len(cycle_stack) - 2: 
+                    output_cycles.add(get_hashable_cycle([nodos[k] for k in cycle_stack[i:]]))
+                
+            except StopIteration:
+                stack.pop()
+                stack_pos[cycle_stack.pop()] = -1
+    
+    list_bucles = ([list(i) for i in output_cycles])
+    list_bucles = sorted(list_bucles, key=lambda x: len(x))
+    return list_bucles
+
+
+
 class Solve_Graph:
     """
     
@@ -142,6 +242,10 @@ class Solve_Graph:
         self.log_mode = log_mode
         self.upper_limit = upper_limit
         self.lower_limit = lower_limit
+        self.cups_nodo_grafo = {} #Nodo del grafo al que está conectado cada CUPS. Se rellena en main una vez definido el grafo.
+        self.rutas_ct = {} #Rutas desde el CT hasta los nodos finales y de bifurcación, se reutilizan en todas las horas al resolver el grafo.
+        self.conductores_cable = {} #Conductores de la librería cable.py ya cargados, por tipo de cable.
+        self.splitting_ordenados = [] #Splitting nodes ordenados de mayor a menor profundidad desde el CT, se reutilizan en todas las horas al resolver el grafo.
         
         print(Nombre_CT)
         print('ID_CT: ' + str(id_ct))
@@ -535,32 +639,7 @@ class Solve_Graph:
             
             
             
-            try:
-                #Hay que comprobar que todas las coordenadas son mayores que 0. Hay casos de trazas con mismas coordenadas de origen y destino y no hay que considerarlo como valor erróneo en el cálculo de trazas con longitud 0.
-                if float(df_traza_ct.loc[index, 'X_ORIGEN']) > 0 and float(df_traza_ct.loc[index, 'Y_ORIGEN']) > 0 and float(df_traza_ct.loc[index, 'X_DESTINO']) > 0 and float(df_traza_ct.loc[index, 'Y_DESTINO']) > 0:
-                    long_calc = math.sqrt((float(df_traza_ct.loc[index, 'X_DESTINO']) - float(df_traza_ct.loc[index, 'X_ORIGEN']))**2 + (float(df_traza_ct.loc[index, 'Y_DESTINO']) - float(df_traza_ct.loc[index, 'Y_ORIGEN']))**2)
-                else:
-                    long_calc = 0
-                    if graph_data_error <= 1: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
-                        graph_data_error = 1
-                    logger.warning('TRAZAS: Error al calcular la longitud para la traza ' + str(df_traza_ct.loc[index, 'NODO_ORIGEN']) + ' - ' + str(df_traza_ct.loc[index, 'NODO_DESTINO']) + '. Valor obtenido: ' + str(long_calc) + '. Asignado valor 0.')
-                    if index not in borrar_fila:
-                        trazas_cero += 1
-                        # borrar_fila.append(index)
-                    
-                if long_calc >= 0:
-                    df_traza_ct.loc[index, 'Longitud'] = long_calc
-                else:
-                    df_traza_ct.loc[index, 'Longitud'] = 0
-                    logger.warning('TRAZAS: Error al calcular la longitud para la traza ' + str(df_traza_ct.loc[index, 'NODO_ORIGEN']) + ' - ' + str(df_traza_ct.loc[index, 'NODO_DESTINO']) + '. Valor obtenido: ' + str(long_calc) + '. Asignado valor 0.')
-                    if graph_data_error <= 1: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
-                        graph_data_error = 1
-            except:
-                df_traza_ct.loc[index, 'Longitud'] = 0
-                logger.warning('TRAZAS: Error de código al calcular longitud para la traza ' + str(df_traza_ct.loc[index, 'NODO_ORIGEN']) + ' - ' + str(df_traza_ct.loc[index, 'NODO_DESTINO']) + '. Valor obtenido: ' + str(long_calc) + '. Asignado valor 0.')
-                if graph_data_error <= 1: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
-                    graph_data_error = 1
-                #continue
+            #La longitud de las trazas se calcula después del ciclo, de una sola vez para todas las trazas.
             
             try:
                 if int(row.LBT_ID) > 0:
@@ -649,6 +728,25 @@ class Solve_Graph:
             
         df_traza_ct = df_traza_ct.reset_index(drop=True)
         
+        #Se calcula la longitud en línea recta de todas las trazas con las coordenadas ya corregidas, como una única operación vectorizada.
+        #Hay que comprobar que todas las coordenadas son mayores que 0. Hay casos de trazas con mismas coordenadas de origen y destino y no hay que considerarlo como valor erróneo en el cálculo de trazas con longitud 0.
+        #Las filas de borrar_fila ya no están: en el ciclo saltaban al siguiente índice antes de llegar al cálculo de la longitud.
+        coord_trazas = df_traza_ct[['X_ORIGEN', 'Y_ORIGEN', 'X_DESTINO', 'Y_DESTINO']].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        #Coordenadas que no se pueden convertir a número (error de código): longitud 0 con su propio aviso y sin contar como traza de longitud 0.
+        coord_error = np.isnan(coord_trazas).any(axis=1)
+        coord_ok = ~coord_error & (np.nan_to_num(coord_trazas) > 0).all(axis=1)
+        coord_cero = ~coord_error & ~coord_ok
+        df_traza_ct['Longitud'] = np.where(coord_ok, np.hypot(coord_trazas[:, 2] - coord_trazas[:, 0], coord_trazas[:, 3] - coord_trazas[:, 1]), 0)
+        for index in np.flatnonzero(coord_cero):
+            logger.warning('TRAZAS: Error al calcular la longitud para la traza ' + str(df_traza_ct.loc[index, 'NODO_ORIGEN']) + ' - ' + str(df_traza_ct.loc[index, 'NODO_DESTINO']) + '. Valor obtenido: 0. Asignado valor 0.')
+        for index in np.flatnonzero(coord_error):
+            logger.warning('TRAZAS: Error de código al calcular longitud para la traza ' + str(df_traza_ct.loc[index, 'NODO_ORIGEN']) + ' - ' + str(df_traza_ct.loc[index, 'NODO_DESTINO']) + '. Asignado valor 0.')
+        trazas_cero += int(coord_cero.sum())
+        if coord_cero.any() or coord_error.any():
+            if graph_data_error <= 1: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
+                graph_data_error = 1
+        del coord_trazas, coord_ok, coord_cero, coord_error
+        
         
         #Se comprueban las coordenadas del DF nodos
         for index,row in df_nodos_ct.iterrows():
@@ -943,11 +1041,12 @@ class Solve_Graph:
                             del aa
                         else:
                             #Se intenta dar al nuevo nodo las coordenadas del CUPS, y se crea una traza entre ese nodo y el CT. Si hay errores de coordenadas se intenta primero asignar al nodo las coordenadas del CT (longitud de traza 0) y sino directamente coordenadas 0.
+                            #CUIDADO: CUPS_X[0] se lee por etiqueta (primera fila del DF), ordenar antes no cambia el valor obtenido.
                             try:
                                 coord_X = row.CUPS_X
                                 coord_Y = row.CUPS_Y
-                                coord_X_CT = cups_agregado_CT.sort_values('CUPS_X', ascending=False).CUPS_X[0]
-                                coord_Y_CT = cups_agregado_CT.sort_values('CUPS_Y', ascending=False).CUPS_Y[0]
+                                coord_X_CT = cups_agregado_CT.CUPS_X[0]
+                                coord_Y_CT = cups_agregado_CT.CUPS_Y[0]
                                 if coord_X > 0 and coord_Y > 0:
                                     aa = 'Todo ok'
                                     del aa
@@ -962,10 +1061,10 @@ class Solve_Graph:
                                         coord_Y = 0
                             except:
                                 try:
-                                    coord_X = cups_agregado_CT.sort_values('CUPS_X', ascending=False).CUPS_X[0]
-                                    coord_Y = cups_agregado_CT.sort_values('CUPS_Y', ascending=False).CUPS_Y[0]
-                                    coord_X_CT = cups_agregado_CT.sort_values('CUPS_X', ascending=False).CUPS_X[0]
-                                    coord_Y_CT = cups_agregado_CT.sort_values('CUPS_Y', ascending=False).CUPS_Y[0]
+                                    coord_X = cups_agregado_CT.CUPS_X[0]
+                                    coord_Y = cups_agregado_CT.CUPS_Y[0]
+                                    coord_X_CT = cups_agregado_CT.CUPS_X[0]
+                                    coord_Y_CT = cups_agregado_CT.CUPS_Y[0]
                                     if coord_X > 0 and coord_Y > 0:
                                         aa = 'Todo ok'
                                         del aa
@@ -1200,10 +1299,13 @@ class Solve_Graph:
         -------
         G : Grafo definido. 
         graph_data_error : Valor actualizado.
+        df_traza_ct : DataFrame de trazas con los enlaces añadidos al corregir los errores del grafo.
             Atributos de los nodos: ID_NODO_LBT_ID, TR, P_R_0, Q_R_0, P_S_0, Q_S_0, P_T_0, Q_T_0, Tipo_Nodo, pos(NUDO_X, NUDO_Y), color_nodo, QBT_TENSION.
             Atributos de los enlaces: NODO_ORIGEN_LBT_ID, NODO_DESTINO_LBT_ID, TR, Long, P_R_Linea, Q_R_Linea, P_S_Linea, Q_S_Linea, P_T_Linea, Q_T_Linea, CABLE, QBT_TENSION.
         """
         logger = logging.getLogger('genera_grafo')
+        #Cable por defecto para los enlaces virtuales del CT y los enlaces creados por error. Se obtiene una sola vez, ya que no cambia.
+        default_cable = df_traza_ct['CABLE'].iloc[0] if len(df_traza_ct) else None
         #Primero se genera un grafo que contiene todos los subgrafos por separado en función de los LBT_ID que haya.
         #Se unen todos los subgrafos en un CT 'ficticio'.
         
@@ -1213,20 +1315,18 @@ class Solve_Graph:
         #     G.add_node(row['ID_NODO_LBT_ID'], P_R = 0, Q_R = 0, P_S = 0, Q_S = 0, P_T = 0, Q_T = 0, Tipo_Nodo = row['TIPO_NODO'], pos = (float(str(row['NUDO_X']).replace(',','.')), float(str(row['NUDO_Y']).replace(',','.'))), color_nodo = 'blue')
         
         #Se añaden los atributos al nodo id_ct y un nodo virtual por cada Trafo de la red.
-        for index, row in cups_agregado_CT.iterrows():
-            try:
-                id_ct_coord_x = row.CUPS_X
-            except:
-                id_ct_coord_x = 0
-            try:
-                id_ct_coord_y = row.CUPS_Y
-            except:
-                id_ct_coord_y = 0
+        #Se comprueba una sola vez si existen las columnas de coordenadas, en lugar de capturar la excepción en cada fila.
+        has_x = 'CUPS_X' in cups_agregado_CT.columns
+        has_y = 'CUPS_Y' in cups_agregado_CT.columns
+        for row in cups_agregado_CT.itertuples():
+            id_ct_coord_x = row.CUPS_X if has_x else 0
+            id_ct_coord_y = row.CUPS_Y if has_y else 0
+            pos_ct = (float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))) #Posición común a todos los nodos que se crean con esta fila.
                 
-            G.add_node(str(self.id_ct), TR='CT', P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', QBT_TENSION=400)
-            G.add_node(str(self.id_ct) + '_' + str(row.TRAFO), TR=str(row.TRAFO), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=400)
-            if (str(self.id_ct), str(self.id_ct) + '_' + str(row.TRAFO),0) not in G.edges:
-                G.add_edge(str(self.id_ct), str(self.id_ct) + '_' + str(row.TRAFO), TR=str(row.TRAFO), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=400)
+            G.add_node(str(self.id_ct), TR='CT', P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT', pos=pos_ct, color_nodo='red', QBT_TENSION=400)
+            G.add_node(str(self.id_ct) + '_' + str(row.TRAFO), TR=str(row.TRAFO), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=400)
+            if not G.has_edge(str(self.id_ct), str(self.id_ct) + '_' + str(row.TRAFO),0):
+                G.add_edge(str(self.id_ct), str(self.id_ct) + '_' + str(row.TRAFO), TR=str(row.TRAFO), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=400)
             #Se añaden los niveles de tensión existentes:
             QBT_tension = row.TRAFO.replace('R','')
             if row.CUPS.find(QBT_tension + '1') >= 0:
@@ -1236,9 +1336,9 @@ class Solve_Graph:
             else:
                 logger.error('Error al encontrar el nivel de tensión del CUPS ' + str(row.CUPS) + '. Trafo ' + str(row.TRAFO))
                 tension_tr = 0
-            G.add_node(str(row.TRAFO) + '_' + str(tension_tr), TR=str(row.TRAFO), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=tension_tr)
-            if (str(self.id_ct) + '_' + str(row.TRAFO), str(row.TRAFO) + '_' + str(tension_tr), 0) not in G.edges:
-                G.add_edge(str(self.id_ct) + '_' + str(row.TRAFO), str(row.TRAFO) + '_' + str(tension_tr), TR=str(row.TRAFO), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=tension_tr)
+            G.add_node(str(row.TRAFO) + '_' + str(tension_tr), TR=str(row.TRAFO), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=tension_tr)
+            if not G.has_edge(str(self.id_ct) + '_' + str(row.TRAFO), str(row.TRAFO) + '_' + str(tension_tr), 0):
+                G.add_edge(str(self.id_ct) + '_' + str(row.TRAFO), str(row.TRAFO) + '_' + str(tension_tr), TR=str(row.TRAFO), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=tension_tr)
             
             
         #Si no hay CUPS de agregado en el CT no se agregan los nodos correspondientes, por lo que hay que añadir al menos el CT y los trafos.
@@ -1249,70 +1349,84 @@ class Solve_Graph:
             id_ct_coord_x = df_nodos_ct[df_nodos_ct.CT_X>0].CT_X.drop_duplicates(keep='first').reset_index(drop=True)[0]
             # id_ct_coord_y = df_nodos_ct.CT_Y.drop_duplicates(keep='first').reset_index(drop=True)
             id_ct_coord_y = df_nodos_ct[df_nodos_ct.CT_Y>0].CT_Y.drop_duplicates(keep='first').reset_index(drop=True)[0]
+            pos_ct = (float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.')))
             
             #Se agrega el CT
-            G.add_node(str(self.id_ct), TR='CT', P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', QBT_TENSION=400)
+            G.add_node(str(self.id_ct), TR='CT', P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT', pos=pos_ct, color_nodo='red', QBT_TENSION=400)
             
             #Se agregan los trafos
             for row in prov:
-                G.add_node(str(self.id_ct) + '_' + str(row), TR=str(row), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=400)
-                if (str(self.id_ct), str(self.id_ct) + '_' + str(row),0) not in G.edges:
-                    G.add_edge(str(self.id_ct), str(self.id_ct) + '_' + str(row), TR=str(row), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=400)
+                G.add_node(str(self.id_ct) + '_' + str(row), TR=str(row), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=400)
+                if not G.has_edge(str(self.id_ct), str(self.id_ct) + '_' + str(row),0):
+                    G.add_edge(str(self.id_ct), str(self.id_ct) + '_' + str(row), TR=str(row), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=400)
                 #Se añaden los niveles de tensión existentes. En este caso solo de 400V, porque no se sabe si hay CUPS en 230.
                 tension_tr = 400
-                G.add_node(str(row) + '_' + str(tension_tr), TR=str(row), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=tension_tr)
-                if (str(self.id_ct) + '_' + str(row), str(row) + '_' + str(tension_tr), 0) not in G.edges:
-                    G.add_edge(str(self.id_ct) + '_' + str(row), str(row) + '_' + str(tension_tr), TR=str(row), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=tension_tr)
+                G.add_node(str(row) + '_' + str(tension_tr), TR=str(row), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=tension_tr)
+                if not G.has_edge(str(self.id_ct) + '_' + str(row), str(row) + '_' + str(tension_tr), 0):
+                    G.add_edge(str(self.id_ct) + '_' + str(row), str(row) + '_' + str(tension_tr), TR=str(row), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=tension_tr)
          
             del prov
         
         
         #Se añade el CT_TR y se crean los enlaces virtuales entre el ID_CT_TR y los correspondientes ID_CT_LBT_ID  
+        #La posición del CT no depende de la LBT_ID, se calcula solo en la primera iteración.
+        pos_ct = None
         for i in range(0,len(LBT_ID_list)):  
-            try:
-                id_ct_coord_x = df_nodos_ct.sort_values('CT_X', ascending=False).reset_index(drop=True).CT_X[0]
-                id_ct_coord_y = df_nodos_ct.sort_values('CT_Y', ascending=False).reset_index(drop=True).CT_Y[0]
-            except:
-                id_ct_coord_x = cups_agregado_CT.sort_values('CUPS_X', ascending=False).reset_index(drop=True).CUPS_X[0]
-                id_ct_coord_y = cups_agregado_CT.sort_values('CUPS_Y', ascending=False).reset_index(drop=True).CUPS_Y[0]
+            if pos_ct is None:
+                try:
+                    id_ct_coord_x = df_nodos_ct.sort_values('CT_X', ascending=False).reset_index(drop=True).CT_X[0]
+                    id_ct_coord_y = df_nodos_ct.sort_values('CT_Y', ascending=False).reset_index(drop=True).CT_Y[0]
+                except:
+                    id_ct_coord_x = cups_agregado_CT.sort_values('CUPS_X', ascending=False).reset_index(drop=True).CUPS_X[0]
+                    id_ct_coord_y = cups_agregado_CT.sort_values('CUPS_Y', ascending=False).reset_index(drop=True).CUPS_Y[0]
+                pos_ct = (float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.')))
             #Por si acaso no se han agregado el CT y loc CT_TR se comprueba si existen los nodos y los enlaces.
-            if str(self.id_ct) not in G.nodes():
-                G.add_node(str(self.id_ct), TR='CT', P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', QBT_TENSION=400)
+            if str(self.id_ct) not in G:
+                G.add_node(str(self.id_ct), TR='CT', P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT', pos=pos_ct, color_nodo='red', QBT_TENSION=400)
             
-            if str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]) not in G.nodes():
-                G.add_node(str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), TR=str(LBT_ID_list['TRAFO'][i]), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=400)
+            if str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]) not in G:
+                G.add_node(str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), TR=str(LBT_ID_list['TRAFO'][i]), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=400)
             
-            if (str(self.id_ct), str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]),0) not in G.edges:
-                G.add_edge(str(self.id_ct), str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=400)
+            if not G.has_edge(str(self.id_ct), str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]),0):
+                G.add_edge(str(self.id_ct), str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=400)
             
             #Se añaden los niveles de tensión existentes. En este caso solo de 400V, porque no se sabe si hay CUPS en 230.
             tension_tr = 400
-            if str(LBT_ID_list['TRAFO'][i] + '_' + str(tension_tr)) not in G.nodes:
-                G.add_node(str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), TR=str(LBT_ID_list['TRAFO'][i]), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=tension_tr)
-                if (str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), 0) not in G.edges:
-                    G.add_edge(str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=tension_tr)
+            if str(LBT_ID_list['TRAFO'][i] + '_' + str(tension_tr)) not in G:
+                G.add_node(str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), TR=str(LBT_ID_list['TRAFO'][i]), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=tension_tr)
+                if not G.has_edge(str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), 0):
+                    G.add_edge(str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=tension_tr)
          
             
             # G.add_edge(self.id_ct, str(self.id_ct) + '_' + str(LBT_ID_list['LBT_ID'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0])
             # G.add_edge(str(self.id_ct) + '_' + str(LBT_ID_list['TRAFO'][i]), str(self.id_ct) + '_' + str(LBT_ID_list['LBT_ID'][i]), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0])
-            G.add_edge(str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), str(self.id_ct) + '_' + str(LBT_ID_list['LBT_ID'][i]), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=df_traza_ct['CABLE'][0], QBT_TENSION=tension_tr)
+            G.add_edge(str(LBT_ID_list['TRAFO'][i]) + '_' + str(tension_tr), str(self.id_ct) + '_' + str(LBT_ID_list['LBT_ID'][i]), TR=str(LBT_ID_list['TRAFO'][i]), Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=default_cable, QBT_TENSION=tension_tr)
             
             #Se añaden también los atributos del nodo que se acaba de crear con idct_lbt
-            G.add_node(str(self.id_ct) + '_' + str(LBT_ID_list['LBT_ID'][i]), TR=str(LBT_ID_list['TRAFO'][i]), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=(float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.'))), color_nodo='red', N_ant = 1, QBT_TENSION=400)
+            G.add_node(str(self.id_ct) + '_' + str(LBT_ID_list['LBT_ID'][i]), TR=str(LBT_ID_list['TRAFO'][i]), P_R_0=0, Q_R_0=0, P_S_0=0, Q_S_0=0, P_T_0=0, Q_T_0=0, Tipo_Nodo='CT_Virtual', pos=pos_ct, color_nodo='red', N_ant = 1, QBT_TENSION=400)
             
             
             
         
         
         #Se añaden las diferentes trazas definidas.
-        for index, row in df_traza_ct.iterrows():
+        #Se comprueba una sola vez si existen las columnas de trafo y coordenadas, en lugar de capturar la excepción en cada fila.
+        has_trafo = 'TRAFO' in df_traza_ct.columns
+        has_coord_origen = 'X_ORIGEN' in df_traza_ct.columns and 'Y_ORIGEN' in df_traza_ct.columns
+        has_coord_destino = 'X_DESTINO' in df_traza_ct.columns and 'Y_DESTINO' in df_traza_ct.columns
+        if not has_trafo:
+            logger.error('Error al buscar el trafo al que pertenecen los nodos de las trazas. No existe la columna TRAFO.')
+        if not has_coord_origen or not has_coord_destino:
+            logger.error('Error al buscar las coordenadas de traza. No existen las columnas X_ORIGEN, Y_ORIGEN, X_DESTINO, Y_DESTINO. Se asignan coordenadas 0.')
+        for row in df_traza_ct.itertuples():
+            trafo = str(row.TRAFO) if has_trafo else ''
             #Se añaden los atributos a los dos nodos. Si no se encuentran atributos en el DF de nodos se asignan los de las trazas.
-            if row['NODO_ORIGEN_LBT_ID'] not in G.nodes():
+            if row.NODO_ORIGEN_LBT_ID not in G:
                 try:
-                    tipo_nodo_prov = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_ORIGEN_LBT_ID']]['TIPO_NODO'].reset_index(drop=True)[0] #Número de la línea
+                    tipo_nodo_prov = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row.NODO_ORIGEN_LBT_ID]['TIPO_NODO'].reset_index(drop=True)[0] #Número de la línea
                 except:
                     tipo_nodo_prov = 'NODO_DESCONOCIDO'
-                    logger.error('Nodo ' + row['NODO_ORIGEN_LBT_ID'] + ', error de tipo de nodo. Asignado: ' + tipo_nodo_prov)
+                    logger.error('Nodo ' + row.NODO_ORIGEN_LBT_ID + ', error de tipo de nodo. Asignado: ' + tipo_nodo_prov)
                     #continue
                 try:
                     color_nodo_graph = str(dicc_colors.get(tipo_nodo_prov))
@@ -1322,31 +1436,24 @@ class Solve_Graph:
                     color_nodo_graph = 'white'
                     #continue
                     
+                # nodo_coord_x = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_ORIGEN_LBT_ID']]['NUDO_X'].reset_index(drop=True)[0]
+                nodo_coord_x = row.X_ORIGEN if has_coord_origen else 0
+                # nodo_coord_y = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_ORIGEN_LBT_ID']]['NUDO_Y'].reset_index(drop=True)[0]
+                nodo_coord_y = row.Y_ORIGEN if has_coord_origen else 0
+                #Una coordenada con formato incorrecto no aborta la generación del grafo, se asigna la posición (0, 0).
                 try:
-                    trafo = str(row.TRAFO)
-                except:
-                    logger.error('Error al buscar el trafo al que pertenece el NODO_ORIGEN ' + str(row['NODO_ORIGEN_LBT_ID']))
-                    #continue
-                    
-                try:
-                    # nodo_coord_x = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_ORIGEN_LBT_ID']]['NUDO_X'].reset_index(drop=True)[0]
-                    nodo_coord_x = row.X_ORIGEN
-                    # nodo_coord_y = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_ORIGEN_LBT_ID']]['NUDO_Y'].reset_index(drop=True)[0]
-                    nodo_coord_y = row.Y_ORIGEN
-                    G.add_node(row['NODO_ORIGEN_LBT_ID'], TR=trafo, P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = tipo_nodo_prov, pos = (float(str(nodo_coord_x).replace(',','.')), float(str(nodo_coord_y).replace(',','.'))), color_nodo = str(color_nodo_graph), N_ant = 0, N_suc = 0, QBT_TENSION=400)
-                except:
-                    nodo_coord_x = 0
-                    nodo_coord_y = 0
-                    G.add_node(row['NODO_ORIGEN_LBT_ID'], TR=trafo, P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = tipo_nodo_prov, pos = (float(str(nodo_coord_x).replace(',','.')), float(str(nodo_coord_y).replace(',','.'))), color_nodo = str(color_nodo_graph), N_ant = 0, N_suc = 0, QBT_TENSION=400)
-                    logger.error('Error al buscar las coordenadas de traza para el NODO_ORIGEN_LBT_ID' + str(row['NODO_ORIGEN_LBT_ID']))
-                    #continue
+                    pos_nodo = (float(str(nodo_coord_x).replace(',','.')), float(str(nodo_coord_y).replace(',','.')))
+                except ValueError:
+                    pos_nodo = (0.0, 0.0)
+                    logger.error('Error al buscar las coordenadas de traza para el NODO_ORIGEN_LBT_ID' + str(row.NODO_ORIGEN_LBT_ID))
+                G.add_node(row.NODO_ORIGEN_LBT_ID, TR=trafo, P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = tipo_nodo_prov, pos = pos_nodo, color_nodo = str(color_nodo_graph), N_ant = 0, N_suc = 0, QBT_TENSION=400)
                 
-            if row['NODO_DESTINO_LBT_ID'] not in G.nodes():
+            if row.NODO_DESTINO_LBT_ID not in G:
                 try:
-                    tipo_nodo_prov = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_DESTINO_LBT_ID']]['TIPO_NODO'].reset_index(drop=True)[0] #Número de la línea
+                    tipo_nodo_prov = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row.NODO_DESTINO_LBT_ID]['TIPO_NODO'].reset_index(drop=True)[0] #Número de la línea
                 except:
                     tipo_nodo_prov = 'NODO_DESCONOCIDO'
-                    logger.error('Nodo ' + row['NODO_DESTINO_LBT_ID'] + ', error de tipo de nodo. Asignado: ' + tipo_nodo_prov)
+                    logger.error('Nodo ' + row.NODO_DESTINO_LBT_ID + ', error de tipo de nodo. Asignado: ' + tipo_nodo_prov)
                     #continue
                 try:
                     color_nodo_graph = str(dicc_colors.get(tipo_nodo_prov))
@@ -1356,61 +1463,54 @@ class Solve_Graph:
                     color_nodo_graph = 'white'
                     #continue
                 
+                # nodo_coord_x = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_DESTINO_LBT_ID']]['NUDO_X'].reset_index(drop=True)[0]
+                nodo_coord_x = row.X_DESTINO if has_coord_destino else 0
+                # nodo_coord_y = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_DESTINO_LBT_ID']]['NUDO_Y'].reset_index(drop=True)[0] 
+                nodo_coord_y = row.Y_DESTINO if has_coord_destino else 0
+                #Una coordenada con formato incorrecto no aborta la generación del grafo, se asigna la posición (0, 0).
                 try:
-                    trafo = str(row.TRAFO)
-                except:
-                    logger.error('Error al buscar el trafo al que pertenece el NODO_DESTINO_LBT_ID ' + str(row['NODO_DESTINO_LBT_ID']))
-                    #continue
-                try:   
-                    # nodo_coord_x = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_DESTINO_LBT_ID']]['NUDO_X'].reset_index(drop=True)[0]
-                    nodo_coord_x =  row.X_DESTINO
-                    # nodo_coord_y = df_nodos_ct.loc[df_nodos_ct['ID_NODO_LBT_ID'] == row['NODO_DESTINO_LBT_ID']]['NUDO_Y'].reset_index(drop=True)[0] 
-                    nodo_coord_y =  row.Y_DESTINO
-                    G.add_node(row['NODO_DESTINO_LBT_ID'], TR=trafo, P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = tipo_nodo_prov, pos = (float(str(nodo_coord_x).replace(',','.')), float(str(nodo_coord_y).replace(',','.'))), color_nodo = str(color_nodo_graph), N_ant = 0, N_suc = 0, QBT_TENSION=400)
-                except:
-                    nodo_coord_x = 0
-                    nodo_coord_y = 0
-                    G.add_node(row['NODO_DESTINO_LBT_ID'], TR=trafo, P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = tipo_nodo_prov, pos = (float(str(nodo_coord_x).replace(',','.')), float(str(nodo_coord_y).replace(',','.'))), color_nodo = str(color_nodo_graph), N_ant = 0, N_suc = 0, QBT_TENSION=400)
-                    logger.error('Error al buscar las coordenadas de traza para el NODO_DESTINO_LBT_ID ' + str(row['NODO_DESTINO_LBT_ID']))
-                    #continue
+                    pos_nodo = (float(str(nodo_coord_x).replace(',','.')), float(str(nodo_coord_y).replace(',','.')))
+                except ValueError:
+                    pos_nodo = (0.0, 0.0)
+                    logger.error('Error al buscar las coordenadas de traza para el NODO_DESTINO_LBT_ID ' + str(row.NODO_DESTINO_LBT_ID))
+                G.add_node(row.NODO_DESTINO_LBT_ID, TR=trafo, P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = tipo_nodo_prov, pos = pos_nodo, color_nodo = str(color_nodo_graph), N_ant = 0, N_suc = 0, QBT_TENSION=400)
                 
             #Se añaden los enlaces y los atributos
             #Se comprueba si el enlace ya se añadió antes, si es así serán otras ramificaciones. Se cambia el ID de los existentes y se añade uno más
-            if (row['NODO_ORIGEN_LBT_ID'], row['NODO_DESTINO_LBT_ID']) not in G.edges():
-                trafo = str(row.TRAFO)
-                G.add_edge(row['NODO_ORIGEN_LBT_ID'], row['NODO_DESTINO_LBT_ID'], 0, ID_traza = 0, TR=trafo, Long=row['Longitud'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=row['CABLE'], QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
+            if not G.has_edge(row.NODO_ORIGEN_LBT_ID, row.NODO_DESTINO_LBT_ID):
+                G.add_edge(row.NODO_ORIGEN_LBT_ID, row.NODO_DESTINO_LBT_ID, 0, ID_traza = 0, TR=trafo, Long=row.Longitud, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=row.CABLE, QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
                 #En los nodos origen y destino se crea el atributo de número de antecesores y de sucesores, para comprobar posibles errores futuros
-                if (G.nodes[row['NODO_ORIGEN_LBT_ID']]['Tipo_Nodo'] != 'CT') and (G.nodes[row['NODO_ORIGEN_LBT_ID']]['Tipo_Nodo'] != 'CT_Virtual'):
-                    G.nodes[row['NODO_ORIGEN_LBT_ID']]['N_suc'] += 1
-                if (G.nodes[row['NODO_DESTINO_LBT_ID']]['Tipo_Nodo'] != 'CT') and (G.nodes[row['NODO_DESTINO_LBT_ID']]['Tipo_Nodo'] != 'CT_Virtual'):
-                    G.nodes[row['NODO_DESTINO_LBT_ID']]['N_ant'] += 1
+                datos_origen = G.nodes[row.NODO_ORIGEN_LBT_ID]
+                if (datos_origen['Tipo_Nodo'] != 'CT') and (datos_origen['Tipo_Nodo'] != 'CT_Virtual'):
+                    datos_origen['N_suc'] += 1
+                datos_destino = G.nodes[row.NODO_DESTINO_LBT_ID]
+                if (datos_destino['Tipo_Nodo'] != 'CT') and (datos_destino['Tipo_Nodo'] != 'CT_Virtual'):
+                    datos_destino['N_ant'] += 1
             else:
                 #Se listan todos los enlaces del nodo origen, después se enumeran las posiciones donde se repite el enlace de interés y se calcula el número de repeticiones
                 # N_enlaces = len([i for i,x in enumerate(list(G.edges(row['NODO_ORIGEN_LBT_ID']))) if x==(row['NODO_ORIGEN_LBT_ID'], row['NODO_DESTINO_LBT_ID'])])
                 #La expresión anterior no sirve porque puede haber errores y tener el mismo enlace pero cambiar nodo origen por nodo destino.
+                #Se cuentan las claves consecutivas ya usadas entre los dos nodos comprobando su existencia, sin provocar una excepción para salir del bucle.
                 N_enlaces = 0
-                for i in range(0,1000000):
-                    try:
-                        G.edges[(row['NODO_ORIGEN_LBT_ID'], row['NODO_DESTINO_LBT_ID'], i)]
-                        N_enlaces += 1
-                    except:
-                        break
+                while G.has_edge(row.NODO_ORIGEN_LBT_ID, row.NODO_DESTINO_LBT_ID, N_enlaces):
+                    N_enlaces += 1
                     
                 #Se añade el nuevo enlace
-                trafo = str(row.TRAFO)
-                G.add_edge(row['NODO_ORIGEN_LBT_ID'], row['NODO_DESTINO_LBT_ID'], N_enlaces, ID_traza = N_enlaces, TR=trafo, Long=row['Longitud'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=row['CABLE'], QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
+                G.add_edge(row.NODO_ORIGEN_LBT_ID, row.NODO_DESTINO_LBT_ID, N_enlaces, ID_traza = N_enlaces, TR=trafo, Long=row.Longitud, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=row.CABLE, QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
                 #En los nodos origen y destino se crea el atributo de número de antecesores y de sucesores, para comprobar posibles errores futuros
                 #Cuidado con no añadirselo al CT o a los CTs virtuales
-                if (G.nodes[row['NODO_ORIGEN_LBT_ID']]['Tipo_Nodo'] != 'CT') and (G.nodes[row['NODO_ORIGEN_LBT_ID']]['Tipo_Nodo'] != 'CT_Virtual'):
-                    G.nodes[row['NODO_ORIGEN_LBT_ID']]['N_suc'] += 1
+                datos_origen = G.nodes[row.NODO_ORIGEN_LBT_ID]
+                if (datos_origen['Tipo_Nodo'] != 'CT') and (datos_origen['Tipo_Nodo'] != 'CT_Virtual'):
+                    datos_origen['N_suc'] += 1
                     # G.nodes[row['NODO_ORIGEN_LBT_ID']]['P_R_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_ORIGEN_LBT_ID']]['Q_R_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_ORIGEN_LBT_ID']]['P_S_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_ORIGEN_LBT_ID']]['Q_S_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_ORIGEN_LBT_ID']]['P_T_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_ORIGEN_LBT_ID']]['Q_T_' + str(N_enlaces)] = 0
-                if (G.nodes[row['NODO_DESTINO_LBT_ID']]['Tipo_Nodo'] != 'CT') and (G.nodes[row['NODO_DESTINO_LBT_ID']]['Tipo_Nodo'] != 'CT_Virtual'):
-                    G.nodes[row['NODO_DESTINO_LBT_ID']]['N_ant'] += 1
+                datos_destino = G.nodes[row.NODO_DESTINO_LBT_ID]
+                if (datos_destino['Tipo_Nodo'] != 'CT') and (datos_destino['Tipo_Nodo'] != 'CT_Virtual'):
+                    datos_destino['N_ant'] += 1
                     # G.nodes[row['NODO_DESTINO_LBT_ID']]['P_R_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_DESTINO_LBT_ID']]['Q_R_' + str(N_enlaces)] = 0
                     # G.nodes[row['NODO_DESTINO_LBT_ID']]['P_S_' + str(N_enlaces)] = 0
@@ -1419,7 +1519,7 @@ class Solve_Graph:
                     # G.nodes[row['NODO_DESTINO_LBT_ID']]['Q_T_' + str(N_enlaces)] = 0
          
         for index, row in df_nodos_ct.iterrows():
-            if row.ID_NODO_LBT_ID not in G.nodes:
+            if row.ID_NODO_LBT_ID not in G:
                 try:
                     tipo_nodo_prov = row['TIPO_NODO']
                 except:
@@ -1457,6 +1557,46 @@ class Solve_Graph:
         ###Detección de posibles errores en el grafo. Se comprueban enlaces y se añaden los que puedan faltar por error  
         #Primero se comprueba que todos los nodos tienen un antecesor (N_ant=0). Si no es así se enlazan directamente con el CT_Virtual correspondiente si se comprueba que no tienen otra ruta de acceso.
         cont_enlaces_nuevos = 0
+        nuevas_trazas = [] #Filas de los enlaces creados. Se añaden al DF de trazas de una sola vez al final, en lugar de ampliar el DF fila a fila.
+        id_ct_s = str(self.id_ct)
+        
+        #Función para obtener el número de nodos vecinos distintos de un nodo (los enlaces paralelos cuentan una sola vez), directamente del diccionario de adyacencia del grafo.
+        #Equivale a len(np.unique(list(G.edges(nodo))))-1, incluido el valor -1 para un nodo sin enlaces.
+        def enlaces_nodo(nodo):
+            vecinos = G[nodo]
+            if len(vecinos) == 0:
+                return -1
+            return len(vecinos) - (1 if nodo in vecinos else 0)
+        
+        #Función para calcular de una sola vez, con NumPy, la longitud en línea recta de los enlaces que se pueden crear entre los nodos indicados y su CT_LBTID.
+        #Si no existe el CT_LBTID del nodo se toma el de su trafo y la longitud se limita a long_max_trafo. Devuelve un diccionario {nodo: (nodo_origen, longitud)}.
+        def calcula_enlaces_nuevos(nodos, long_max_trafo):
+            nodos_enlace = []
+            nodos_origen = []
+            long_max = []
+            for nodo in nodos:
+                #El nombre del nodo es ID_NODO_LBT_ID.
+                nodo_split = nodo.split('_')
+                if len(nodo_split) > 1 and id_ct_s + '_' + nodo_split[1] in G:
+                    nodo_origen = id_ct_s + '_' + nodo_split[1]
+                    long_max_nodo = np.inf
+                else:
+                    lbt_trafo = LBT_ID_list.loc[LBT_ID_list.TRAFO == G.nodes[nodo].get('TR')]['LBT_ID'].reset_index(drop=True)
+                    if len(lbt_trafo) == 0:
+                        continue
+                    nodo_origen = id_ct_s + '_' + str(lbt_trafo[0])
+                    long_max_nodo = long_max_trafo
+                nodos_enlace.append(nodo)
+                nodos_origen.append(nodo_origen)
+                long_max.append(long_max_nodo)
+            #Si el nodo origen no existe se toman las coordenadas del propio nodo (longitud 0).
+            pos_nodo = np.asarray([G.nodes[nodo]['pos'] for nodo in nodos_enlace], dtype=np.float64).reshape(-1, 2)
+            pos_origen = np.asarray([G.nodes[nodo_origen]['pos'] if nodo_origen in G else G.nodes[nodo]['pos'] for nodo, nodo_origen in zip(nodos_enlace, nodos_origen)], dtype=np.float64).reshape(-1, 2)
+            longitudes = np.minimum(np.hypot(pos_nodo[:, 0] - pos_origen[:, 0], pos_nodo[:, 1] - pos_origen[:, 1]), long_max)
+            return dict(zip(nodos_enlace, zip(nodos_origen, longitudes.tolist())))
+        
+        #Las longitudes se calculan para todos los nodos sin antecesores. Dentro del ciclo solo se crea el enlace si no tienen otra ruta de acceso.
+        enlaces_nuevos = calcula_enlaces_nuevos([nodo for nodo, data in G.nodes(data=True) if (data['Tipo_Nodo'] != 'CT') and (data['Tipo_Nodo'] != 'CT_Virtual') and (data['N_ant'] == 0)], 100)
         for nodo, data in G.nodes(data=True, default = 0):
             try:
                 ruta=list(nx.shortest_path(G,str(self.id_ct), nodo))
@@ -1466,37 +1606,22 @@ class Solve_Graph:
                 logger.error('Error de descripción de archivos detectado. No hay ruta entre ' + str(self.id_ct) + ' y ' + str(nodo))
             
             #Si len_ruta es mayor que 0 significa que aunque no tenga antecesores, ese nodo tiene un camino para llegar hasta él y no es necesario crear el enlace
-            if (G.nodes[nodo]['Tipo_Nodo'] != 'CT') and (G.nodes[nodo]['Tipo_Nodo'] != 'CT_Virtual') and (G.nodes[nodo]['N_ant'] == 0) and (len_ruta == 0):
-                #Se une directamente con el CT_LBTID. Si no existe, con un CT_LBTID cualquiera
+            if (data['Tipo_Nodo'] != 'CT') and (data['Tipo_Nodo'] != 'CT_Virtual') and (data['N_ant'] == 0) and (len_ruta == 0):
+                #Se une directamente con el CT_LBTID. Si no existe, con el CT_LBTID de su trafo. La longitud se calcula en línea recta entre el CT y el nodo.
+                #El nombre del nodo es ID_NODO_LBT_ID. Se separa una sola vez para obtener el ID_NODO y la LBT.
+                nodo_split = nodo.split('_')
+                nodo_origen, longitud = enlaces_nuevos[nodo]
                 try:
-                    nodo_origen = str(self.id_ct) + '_' + str(nodo.split('_')[1])
-                    #La longitud calcula en línea recta entre el CT y el nodo.
-                    longitud = math.sqrt((float(G.nodes[nodo]['pos'][0]) - float(G.nodes[nodo_origen]['pos'][0]))**2 + (float(G.nodes[nodo]['pos'][1]) - float(G.nodes[nodo_origen]['pos'][1]))**2)
-                    try:
-                        #Se intenta coger el mismo tipo de cable que el de el primer enlace que dependa de ese nodo. Sino se coge uno al azar de la red.
-                        tipo_cable = G.edges[list(G.edges(nodo))[0][0], list(G.edges(nodo))[0][1], 0]['CABLE']
-                    except:
-                        tipo_cable = df_traza_ct.CABLE[0] #df_traza_ct.loc[df_traza_ct['NODO_ORIGEN_LBT_ID'] == nodo_origen]['CABLE'].reset_index(drop=True)[0]
+                    #Se intenta coger el mismo tipo de cable que el de el primer enlace que dependa de ese nodo. Sino se coge uno al azar de la red.
+                    tipo_cable = G.edges[nodo, next(iter(G[nodo])), 0]['CABLE']
                 except:
-                    nodo_origen = str(self.id_ct) + '_' + str(LBT_ID_list.loc[LBT_ID_list.TRAFO == data['TR']]['LBT_ID'].reset_index(drop=True)[0]) #LBT_ID_list.LBT_ID[0]
-                    try:
-                        longitud = math.sqrt((float(G.nodes[nodo]['pos'][0]) - float(G.nodes[nodo_origen]['pos'][0]))**2 + (float(G.nodes[nodo]['pos'][1]) - float(G.nodes[nodo_origen]['pos'][1]))**2)
-                        if longitud > 100:
-                            longitud = 100
-                    except:
-                        longitud = 0
-                    try:
-                        #Se intenta coger el mismo tipo de cable que el de el primer enlace que dependa de ese nodo. Sino se coge uno al azar de la red.
-                        tipo_cable = G.edges[list(G.edges(nodo))[0][0], list(G.edges(nodo))[0][1], 0]['CABLE']
-                    except:
-                        tipo_cable = df_traza_ct.CABLE[0] #df_traza_ct.loc[df_traza_ct['NODO_ORIGEN_LBT_ID'] == nodo_origen]['CABLE'].reset_index(drop=True)[0]
-                        #continue
-                    #continue
-                G.add_edge(nodo_origen, nodo, 0, ID_traza = 0, TR=str(G.nodes[nodo]['TR']), Long=longitud, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=tipo_cable, QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
-                #Se añade el enlace al DF de trazas.
-                df_traza_ct.loc[len(df_traza_ct)] = [str(self.id_ct), self.Nombre_CT, G.nodes[nodo]['TR'], str(nodo.split('_')[1]), '0', nodo_origen.split('_')[0], float(G.nodes[nodo_origen]['pos'][0]), float(G.nodes[nodo_origen]['pos'][1]), nodo.split('_')[0], float(G.nodes[nodo]['pos'][0]), float(G.nodes[nodo]['pos'][1]), '', tipo_cable, tipo_cable, longitud, nodo_origen, nodo]
-                if (G.nodes[nodo]['Tipo_Nodo'] != 'CT') and (G.nodes[nodo]['Tipo_Nodo'] != 'CT_Virtual'):
-                    G.nodes[nodo]['N_ant'] += 1
+                    tipo_cable = default_cable #df_traza_ct.loc[df_traza_ct['NODO_ORIGEN_LBT_ID'] == nodo_origen]['CABLE'].reset_index(drop=True)[0]
+                G.add_edge(nodo_origen, nodo, 0, ID_traza = 0, TR=str(data['TR']), Long=longitud, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=tipo_cable, QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
+                #Se guarda el enlace para añadirlo al DF de trazas al terminar la revisión.
+                pos_origen = G.nodes[nodo_origen]['pos']
+                nuevas_trazas.append([id_ct_s, self.Nombre_CT, data['TR'], nodo_split[1], '0', id_ct_s, float(pos_origen[0]), float(pos_origen[1]), nodo_split[0], float(data['pos'][0]), float(data['pos'][1]), '', tipo_cable, tipo_cable, longitud, nodo_origen, nodo])
+                if (data['Tipo_Nodo'] != 'CT') and (data['Tipo_Nodo'] != 'CT_Virtual'):
+                    data['N_ant'] += 1
                 cont_enlaces_nuevos += 1
                 logger.error('Se ha detectado que no existe enlace previo al nodo ' + str(nodo) + '. Se ha creado un enlace con ' + str(nodo_origen) + '.')
                 
@@ -1506,6 +1631,10 @@ class Solve_Graph:
         ########
         ## COMPROBAR QUE EXISTE UN CAMINO ENTRE EL CT y cada nodo.
         ########
+        #Las longitudes se calculan para todos los nodos que no están conectados con el CT. Al añadir enlaces ningún nodo pierde su ruta, por lo que no aparecen nodos nuevos sin ruta.
+        nodos_conectados = nx.node_connected_component(G, id_ct_s) if id_ct_s in G else set()
+        enlaces_nuevos = calcula_enlaces_nuevos([nodo for nodo in G.nodes if nodo not in nodos_conectados], np.inf)
+        del nodos_conectados
         for nodo,data in G.nodes(data=True, default = 0):
             try:
                 # ruta=list(nx.shortest_path(G,id_ct, nodo))
@@ -1513,40 +1642,31 @@ class Solve_Graph:
     #            print(ruta)
             except:
                 logger.error('Error de descripción de archivos detectado. No hay ruta entre ' + str(self.id_ct) + ' y ' + str(nodo) + '. Creado un enlace directo con el trafo TR_400.')
+                #El nombre del nodo es ID_NODO_LBT_ID. Se separa una sola vez para obtener el ID_NODO y la LBT.
+                nodo_split = nodo.split('_')
+                nodo_origen, longitud = enlaces_nuevos[nodo]
                 try:
-                    nodo_origen = str(self.id_ct) + '_' + str(nodo.split('_')[1])
-                    #La longitud calcula en línea recta entre el CT y el nodo.
-                    longitud = math.sqrt((float(G.nodes[nodo]['pos'][0]) - float(G.nodes[nodo_origen]['pos'][0]))**2 + (float(G.nodes[nodo]['pos'][1]) - float(G.nodes[nodo_origen]['pos'][1]))**2)
-                    try:
-                        #Se intenta coger el mismo tipo de cable que el de el primer enlace que dependa de ese nodo. Sino se coge uno al azar de la red.
-                        tipo_cable = G.edges[list(G.edges(nodo))[0][0], list(G.edges(nodo))[0][1], 0]['CABLE']
-                    except:
-                        tipo_cable = df_traza_ct.CABLE[0] #df_traza_ct.loc[df_traza_ct['NODO_ORIGEN_LBT_ID'] == nodo_origen]['CABLE'].reset_index(drop=True)[0]
+                    #Se intenta coger el mismo tipo de cable que el de el primer enlace que dependa de ese nodo. Sino se coge uno al azar de la red.
+                    tipo_cable = G.edges[nodo, next(iter(G[nodo])), 0]['CABLE']
                 except:
-                    nodo_origen = str(self.id_ct) + '_' + str(LBT_ID_list.loc[LBT_ID_list.TRAFO == data['TR']]['LBT_ID'].reset_index(drop=True)[0]) #LBT_ID_list.LBT_ID[0]
-                    try:
-                        longitud = math.sqrt((float(G.nodes[nodo]['pos'][0]) - float(G.nodes[nodo_origen]['pos'][0]))**2 + (float(G.nodes[nodo]['pos'][1]) - float(G.nodes[nodo_origen]['pos'][1]))**2)
-                    except:
-                        longitud = 0
-                    try:
-                        #Se intenta coger el mismo tipo de cable que el de el primer enlace que dependa de ese nodo. Sino se coge uno al azar de la red.
-                        tipo_cable = G.edges[list(G.edges(nodo))[0][0], list(G.edges(nodo))[0][1], 0]['CABLE']
-                    except:
-                        tipo_cable = df_traza_ct.CABLE[0] #df_traza_ct.loc[df_traza_ct['NODO_ORIGEN_LBT_ID'] == nodo_origen]['CABLE'].reset_index(drop=True)[0]
-                        #continue
-                    #continue
-                G.add_edge(nodo_origen, nodo, 0, ID_traza = 0, TR=str(G.nodes[nodo]['TR']), Long=longitud, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=tipo_cable, QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
-                #Se añade el enlace al DF de trazas.
-                df_traza_ct.loc[len(df_traza_ct)] = [str(self.id_ct), self.Nombre_CT, G.nodes[nodo]['TR'], str(nodo.split('_')[1]), '0', nodo_origen.split('_')[0], float(G.nodes[nodo_origen]['pos'][0]), float(G.nodes[nodo_origen]['pos'][1]), nodo.split('_')[0], float(G.nodes[nodo]['pos'][0]), float(G.nodes[nodo]['pos'][1]), '', tipo_cable, tipo_cable, longitud, nodo_origen, nodo]
-                if (G.nodes[nodo]['Tipo_Nodo'] != 'CT') and (G.nodes[nodo]['Tipo_Nodo'] != 'CT_Virtual'):
-                    G.nodes[nodo]['N_ant'] += 1
+                    tipo_cable = default_cable #df_traza_ct.loc[df_traza_ct['NODO_ORIGEN_LBT_ID'] == nodo_origen]['CABLE'].reset_index(drop=True)[0]
+                G.add_edge(nodo_origen, nodo, 0, ID_traza = 0, TR=str(data['TR']), Long=longitud, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=tipo_cable, QBT_TENSION=400)#, ID_repeat=0) #ID_repeat. 0: solo hay un enlace. >=1: más de 1 enlace, y número del enlace.
+                #Se guarda el enlace para añadirlo al DF de trazas al terminar la revisión.
+                pos_origen = G.nodes[nodo_origen]['pos']
+                nuevas_trazas.append([id_ct_s, self.Nombre_CT, data['TR'], nodo_split[1], '0', id_ct_s, float(pos_origen[0]), float(pos_origen[1]), nodo_split[0], float(data['pos'][0]), float(data['pos'][1]), '', tipo_cable, tipo_cable, longitud, nodo_origen, nodo])
+                if (data['Tipo_Nodo'] != 'CT') and (data['Tipo_Nodo'] != 'CT_Virtual'):
+                    data['N_ant'] += 1
                 cont_enlaces_nuevos += 1
                 
                 #continue
             
             #Es necesario tener definidos estos atributos para detectar los ciclos y eliminar nodos adecuadamente.
-            G.nodes[nodo]['Enlaces_orig'] = len(list(np.unique(list(G.edges(nodo)))))-1
-            G.nodes[nodo]['Enlaces_iter'] = len(list(np.unique(list(G.edges(nodo)))))-1
+            data['Enlaces_orig'] = enlaces_nodo(nodo)
+            data['Enlaces_iter'] = enlaces_nodo(nodo)
+        
+        if len(nuevas_trazas) > 0:
+            df_traza_ct = pd.concat([df_traza_ct, pd.DataFrame(nuevas_trazas, columns=df_traza_ct.columns)], ignore_index=True)
+        del nuevas_trazas
         
         if cont_enlaces_nuevos > 0:
             logger.error('Se han detectado y creado ' + str(cont_enlaces_nuevos) + ' enlaces que no existian.')
@@ -1558,6 +1678,16 @@ class Solve_Graph:
         ########
         ## COMPROBAR QUE NO EXISTEN BUCLES. SI EXISTEN SE ELIMINA UN ENLACE DE UN NODO QUE NO SEA BIFURCACIÓN.
         ########
+        #Vista del grafo limitada a la componente del CT. Se obtiene una sola vez: al romper un bucle se elimina un enlace de un ciclo y el resto del ciclo mantiene unidos
+        #sus nodos, por lo que la componente no cambia. Al ser una vista refleja los enlaces eliminados.
+        H = G.subgraph(nx.node_connected_component(G, id_ct_s) if id_ct_s in G else [])
+        
+        #Función para obtener todos los bucles de la componente del CT. La búsqueda se limita a los nodos que pueden formar parte de un bucle y se hace sobre un diccionario de adyacencia,
+        #que se construye una sola vez en cada llamada (tras romper los bucles anteriores).
+        def bucles_ct(H):
+            H = H.subgraph(nodos_en_bucles(H))
+            return find_all_cycles({nodo: list(H[nodo]) for nodo in H})
+        
         contr_lazos = 0
         iter_lazos = 0 #Se contabiliza el número de iteraciones del while. Si sobrepasa de un valor se sale del lazo y se da un error.
         
@@ -1567,45 +1697,44 @@ class Solve_Graph:
             list_cycle = [] #Se inicializa por si acaso
             list_cycle2 = [] #Se inicializa por si acaso
             bucle_found = 0  
+            sin_lazos = 0 #Se pone a 1 si find_cycle confirma que no queda ningún lazo en la componente del CT. En ese caso no es necesario el método 2.
+            #Comprobación rápida: si la componente del CT es un árbol (n-1 enlaces, contando también los enlaces paralelos y los que unen un nodo consigo mismo) no hay lazos que corregir.
+            #Es un único recorrido lineal y evita la búsqueda de ciclos en el caso habitual de una red sin lazos.
+            if len(H) > 0 and nx.is_tree(H):
+                break
             #Método 1 de localización de lazos (rápido pero poco fiable).
             try:
                 #Este primer intento soluciona algunos lazos, pero puede identificar bucles que simplemente intercambian nodo origen y destino. Por eso se comprueba que devuelve más de 3 nodos que formna el lazo.
                 #Es una instrucción muy rápida pero que puede devolver errores, por eso para ciertos grafos es necesaria una segunda comprobación con el siguiente método.
                 #Se busca si hay un lazo en el grafo. Esta instrucción devuelve (nodo1, nodo2, key enlace, dirección)
-                list_cycle = list(nx.find_cycle(G, source=str(self.id_ct), orientation="ignore"))
+                list_cycle = list(nx.find_cycle(H, source=id_ct_s, orientation="ignore"))
                 # bucle_found = 0            
                 if len(list_cycle) >= 3:
                     bucle_found = 1
                     if graph_data_error <= 2: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
                         graph_data_error = 2
-                    #Se rompe uno de los enlaces:
-                    for j in range(0,1000000):
-                        try:
-                            #Se comprueba si hay enlace j
-                            G.edges[(list_cycle[0][0], list_cycle[0][1], j)]
-                            #Si le hay, se elimina el enlace
-                            G.remove_edge(list_cycle[0][0], list_cycle[0][1], key=j)
-                            # contr_lazos = 1
-                            bucle_found = 0
-                            print('Se deshace el enlace ' + str(list_cycle[0][0]) + '-' + str(list_cycle[0][1]) + '-' + str(j))
-                            logger.warning('Se deshace el enlace ' + str(list_cycle[0][0]) + '-' + str(list_cycle[0][1]) + '-' + str(j))
-                            #Se actualiza el valor de los atributos en ambos nodos
-                            G.nodes[list_cycle[0][0]]['Enlaces_orig'] = len(list(np.unique(list(G.edges(list_cycle[0][0])))))-1
-                            G.nodes[list_cycle[0][0]]['Enlaces_iter'] = len(list(np.unique(list(G.edges(list_cycle[0][0])))))-1
-                            G.nodes[list_cycle[0][1]]['Enlaces_orig'] = len(list(np.unique(list(G.edges(list_cycle[0][1])))))-1
-                            G.nodes[list_cycle[0][1]]['Enlaces_iter'] = len(list(np.unique(list(G.edges(list_cycle[0][1])))))-1
-                        
-                        except:
-                            break
+                    #Se rompe uno de los enlaces. Se eliminan todos los enlaces paralelos entre ambos nodos, recorriendo directamente sus claves.
+                    for j in list(G[list_cycle[0][0]][list_cycle[0][1]].keys()):
+                        G.remove_edge(list_cycle[0][0], list_cycle[0][1], key=j)
+                        # contr_lazos = 1
+                        bucle_found = 0
+                        print('Se deshace el enlace ' + str(list_cycle[0][0]) + '-' + str(list_cycle[0][1]) + '-' + str(j))
+                        logger.warning('Se deshace el enlace ' + str(list_cycle[0][0]) + '-' + str(list_cycle[0][1]) + '-' + str(j))
+                    #Se actualiza el valor de los atributos en ambos nodos
+                    G.nodes[list_cycle[0][0]]['Enlaces_orig'] = enlaces_nodo(list_cycle[0][0])
+                    G.nodes[list_cycle[0][0]]['Enlaces_iter'] = enlaces_nodo(list_cycle[0][0])
+                    G.nodes[list_cycle[0][1]]['Enlaces_orig'] = enlaces_nodo(list_cycle[0][1])
+                    G.nodes[list_cycle[0][1]]['Enlaces_iter'] = enlaces_nodo(list_cycle[0][1])
 
                     #Se vuelve a comprobar si existe otro posible bucle después de analizar el primero
                     try:
-                        list_cycle2 = list(nx.find_cycle(G, source=str(self.id_ct), orientation="ignore"))
+                        list_cycle2 = list(nx.find_cycle(H, source=id_ct_s, orientation="ignore"))
                         if len(list_cycle2) >= 3:
                             contr_lazos = 0                            
                     except:
+                        #No queda ningún lazo tras romper el primero.
                         list_cycle2 = []
-                        pass
+                        sin_lazos = 1
                     # if bucle_found == 1:
                     #     print('Encontrado un bucle no resuelto.')
                     #     graph_data_error = 3
@@ -1613,86 +1742,45 @@ class Solve_Graph:
             except:
                 #Si no se encuentra un ciclo se sale del while.
                 contr_lazos = 1
+                if len(list_cycle) == 0:
+                    sin_lazos = 1
                 
                 
-            #Función para encontrar todos los ciclos existentes en un grafo. Código adaptado de https://gist.github.com/joe-jordan/6548029
-            def find_all_cycles(G):
-                nodes=[str(self.id_ct)]
-                # extra variables for cycle detection:
-                cycle_stack = []
-                output_cycles = set()
-                
-                def get_hashable_cycle(cycle):
-                    """cycle as a tuple in a deterministic order."""
-                    m = min(cycle)
-                    mi = cycle.index(m)
-                    mi_plus_1 = mi + 1 if mi < len(cycle) - 1 else 0
-                    if cycle[mi-1] > cycle[mi_plus_1]:
-                        result = cycle[mi:] + cycle[:mi]
-                    else:
-                        result = list(reversed(cycle[:mi_plus_1])) + list(reversed(cycle[mi_plus_1:]))
-                    return tuple(result)
-                
-                for start in nodes:
-                    if start in cycle_stack:
-                        continue
-                    cycle_stack.append(start)
-                    
-                    stack = [(start,iter(G[start]))]
-                    while stack:
-                        parent,children = stack[-1]
-                        try:
-                            child = next(children)
-                            
-                            if child not in cycle_stack:
-                                cycle_stack.append(child)
-                                stack.append((child,iter(G[child])))
-                            else:
-                                i = cycle_stack.index(child)
-                                if i < len(cycle_stack) - 2: 
-                                  output_cycles.add(get_hashable_cycle(cycle_stack[i:]))
-                            
-                        except StopIteration:
-                            stack.pop()
-                            cycle_stack.pop()
-                
-                list_bucles = ([list(i) for i in output_cycles])
-                list_bucles = sorted(list_bucles, key=lambda x: len(x))
-                return list_bucles
             
-            list_bucles = []
-            list_bucles = find_all_cycles(G)
+            #La búsqueda de todos los ciclos es la parte más costosa. Si el método 1 ha confirmado que la componente del CT no tiene lazos (caso habitual), no se ejecuta.
+            list_bucles = bucles_ct(H) if sin_lazos == 0 else []
     
             #Método 2 de localización de lazos (más lento. Se ejecuta si el primer método es ambiguo.)
             if len(list_cycle) == 2 or len(list_cycle2) == 2 or bucle_found == 1 or len(list_bucles) > 0:
                 while len(list_bucles) > 0:
                     if graph_data_error <= 2: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
                         graph_data_error = 2
-                    #list_bucles tienes los bucles ordenados de menor a mayor número de enlaces. Se coge siempre el primer bucle, se deshace y se vuelven a comprobar los bucles.
+                    #list_bucles tienes los bucles ordenados de menor a mayor número de enlaces. Se recorren en ese orden y se deshace cada uno de ellos.
                     #Al deshacer un bucle se toma siempre el último enlace, por se el más alejado del CT.
-                    #if len(list_bucles[0]) >= 3:
-                    nodo_ini = list_bucles[0][len(list_bucles[0])-2]
-                    nodo_fin = list_bucles[0][len(list_bucles[0])-1]
-                    for j in range(0,1000000):
-                        try:
-                            #Se comprueba si hay enlace j
-                            G.edges[(nodo_ini, nodo_fin, j)]
-                            #Si le hay, se elimina el enlace
+                    #No se vuelve a recorrer el grafo completo después de cada enlace eliminado. Los bucles de la lista que ya se hayan roto al deshacer uno anterior se saltan,
+                    #y solo al terminar la lista se vuelve a buscar si queda algún bucle.
+                    for bucle in list_bucles:
+                        #Se comprueba que el bucle sigue cerrado (existen todos sus enlaces, incluido el que une el último nodo con el primero).
+                        if not all(G.has_edge(bucle[k-1], bucle[k]) for k in range(0, len(bucle))):
+                            continue
+                        #if len(bucle) >= 3:
+                        nodo_ini = bucle[len(bucle)-2]
+                        nodo_fin = bucle[len(bucle)-1]
+                        #Se eliminan todos los enlaces paralelos entre ambos nodos, recorriendo directamente sus claves.
+                        for j in list(G[nodo_ini].get(nodo_fin, {}).keys()):
                             G.remove_edge(nodo_ini, nodo_fin, key=j)
                             # contr_lazos = 1
                             bucle_found = 0
                             print('Se deshace el enlace ' + str(nodo_ini) + '-' + str(nodo_fin) + '-' + str(j))
                             logger.warning('Se deshace el enlace ' + str(nodo_ini) + '-' + str(nodo_fin) + '-' + str(j))
-                            #Se actualiza el valor de los atributos en ambos nodos
-                            G.nodes[nodo_ini]['Enlaces_orig'] = len(list(np.unique(list(G.edges(nodo_ini)))))-1
-                            G.nodes[nodo_ini]['Enlaces_iter'] = len(list(np.unique(list(G.edges(nodo_ini)))))-1
-                            G.nodes[nodo_fin]['Enlaces_orig'] = len(list(np.unique(list(G.edges(nodo_fin)))))-1
-                            G.nodes[nodo_fin]['Enlaces_iter'] = len(list(np.unique(list(G.edges(nodo_fin)))))-1
-                        except:
-                            break
+                        #Se actualiza el valor de los atributos en ambos nodos
+                        G.nodes[nodo_ini]['Enlaces_orig'] = enlaces_nodo(nodo_ini)
+                        G.nodes[nodo_ini]['Enlaces_iter'] = enlaces_nodo(nodo_ini)
+                        G.nodes[nodo_fin]['Enlaces_orig'] = enlaces_nodo(nodo_fin)
+                        G.nodes[nodo_fin]['Enlaces_iter'] = enlaces_nodo(nodo_fin)
                     
                     list_bucles = []
-                    list_bucles = find_all_cycles(G)
+                    list_bucles = bucles_ct(H)
                                 
                             
             if bucle_found == 1:
@@ -1707,40 +1795,85 @@ class Solve_Graph:
             if graph_data_error <= 3: #Es necesario comprobar que no tiene un valor mayor (más defectos en el grafo), para no sustituirlo por un valor menor.
                 graph_data_error = 3
        
-        return G, graph_data_error
+        return G, graph_data_error, df_traza_ct
     
     
     
     def add_cups_grafo(self, G, df_ct_cups_ct, df_matr_dist, id_ct, LBT_ID_list, dicc_colors):
         logger = logging.getLogger('add_cups_grafo')
+        #Se calculan una sola vez las rutas desde el CT hasta todos los nodos del grafo (una única búsqueda en anchura), en lugar de una búsqueda por cada CUPS de 230 V.
+        #No es necesario recalcularlas dentro del ciclo: los nodos _230 y los CUPS que se añaden solo se conectan entre sí y con los nodos virtuales del CT, por lo que no cambian las rutas hasta los nodos de 400 V.
+        rutas_ct = nx.single_source_shortest_path(G, str(self.id_ct))
+        #Se indexan una sola vez el nodo más cercano y la distancia de cada CUPS, en lugar de filtrar df_matr_dist en cada fila. Se mantiene el primer registro de cada CUPS, igual que con el filtrado.
+        matr_dist_cups = df_matr_dist.drop_duplicates('CUPS').set_index('CUPS')
+        arq_map = matr_dist_cups['ID_Nodo_Cercano'].to_dict()
+        dist_map = matr_dist_cups['Distancia'].to_dict()
+        del matr_dist_cups
+        #LBT_IDs de cada trafo, en el orden de LBT_ID_list. Se usan para buscar un nodo alternativo cuando no existe el ID_NODO_LBT_ID de un CUPS, probando solo las líneas de su trafo.
+        trafo_lbt = LBT_ID_list.groupby('TRAFO')['LBT_ID'].apply(list).to_dict()
+        #Se crea una función que añade un enlace de 230 V y actualiza de forma incremental Enlaces_orig y Enlaces_iter de sus extremos, en lugar de recontar todos sus enlaces.
+        #Estos atributos cuentan los vecinos distintos del nodo que no son CUPS (con el método original se contarían los CUPS que puedan estar añadidos a un nodo intermedio).
+        #Solo cambian si el enlace une dos nodos que no eran vecinos. Los nodos de 230 V nuevos parten de 0. Las funciones se definen una sola vez, fuera del ciclo de CUPS.
+        def add_enlace_230(nodo_1, nodo_2, **atributos):
+            enlace_nuevo = nodo_1 != nodo_2 and not (nodo_1 in G and nodo_2 in G[nodo_1])
+            G.add_edge(nodo_1, nodo_2, 0, **atributos)
+            if enlace_nuevo:
+                nodos = G.nodes
+                for nodo, vecino in ((nodo_1, nodo_2), (nodo_2, nodo_1)):
+                    if nodos[vecino].get('Tipo_Nodo') not in ('CUPS', 'CUPS_TR'):
+                        datos_nodo = nodos[nodo]
+                        datos_nodo['Enlaces_orig'] = datos_nodo.get('Enlaces_orig', 0) + 1
+                        datos_nodo['Enlaces_iter'] = datos_nodo['Enlaces_orig']
+        
+        #Funciones para duplicar en 230 V un nodo o un tramo de la red de 400 V. Copian de una sola vez los atributos del original que se mantienen (trafo, tipo, posición, cable y longitud)
+        #y dejan a 0 las potencias y antecesores/sucesores del duplicado.
+        def duplica_nodo_230(nodo, nodo_230):
+            datos_nodo = G.nodes[nodo]
+            G.add_node(nodo_230, TR = datos_nodo['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = datos_nodo['Tipo_Nodo'], pos = datos_nodo['pos'], color_nodo = datos_nodo['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=230)
+        
+        def duplica_tramo_230(nodo_1, nodo_2, datos_tramo):
+            add_enlace_230(nodo_1, nodo_2, ID_traza = 0, TR=datos_tramo['TR'], Long=datos_tramo['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=datos_tramo['CABLE'], QBT_TENSION=230)
+        
         #Se recorre el DF con los CUPS y se asocia cada CUP al nodo correspondiente.
-        for index, row in df_ct_cups_ct.iterrows():
-            if row['CTE_GISS'] > 0 or row.CUPS.find('GISS')>=0:
+        #Se normaliza una sola vez cada valor distinto de LBT_ID, con el mismo criterio que se aplicaba en cada fila (pd.to_numeric sobre un único valor es costoso).
+        lbt_id_norm = {}
+        for lbt_id in df_ct_cups_ct['LBT_ID'].unique():
+            try:
+                lbt_id_norm[lbt_id] = str(pd.to_numeric(lbt_id, downcast='integer')).replace('.0', '')
+            except:
+                lbt_id_norm[lbt_id] = str(lbt_id).replace('.0', '')
+        #Coordenadas de los CUPS convertidas a float de una sola vez por columna. Se accede a ellas con la posición de la fila (row.Index).
+        cups_x = pd.to_numeric(df_ct_cups_ct['CUPS_X'].astype(str).str.replace(',','.'), errors='coerce').tolist()
+        cups_y = pd.to_numeric(df_ct_cups_ct['CUPS_Y'].astype(str).str.replace(',','.'), errors='coerce').tolist()
+        #Se precalcula la posición de la columna AMM_FASE para corregir la fase con .iat. El índice de df_ct_cups_ct es un RangeIndex (reset_index en create_graph_dataframes).
+        col_amm_fase = df_ct_cups_ct.columns.get_loc('AMM_FASE')
+        #Colores de los nodos de CUPS, iguales para todas las filas.
+        color_cups = str(dicc_colors.get('CUPS'))
+        color_cups_tr = str(dicc_colors.get('CUPS_TR'))
+        for row in df_ct_cups_ct.itertuples():
+            if row.CTE_GISS > 0 or row.CUPS.find('GISS')>=0:
                 #Se añade al grafo el CUP del agregado en el CT.
                 cup_lbt_id = '0'
-                trafo_cup = str(row['TRAFO'])
+                trafo_cup = str(row.TRAFO)
                 cup_amm_fase = 'GISS'
                 cup_tipo_conexion = 'GISS'
                 arqueta_cup_lbt_id = str(self.id_ct) + '_' + str(row.TRAFO)
                 longitud = 0
-                if str(row.CUPS) not in G.nodes:
+                if str(row.CUPS) not in G:
                     G.add_edges_from( [(arqueta_cup_lbt_id, str(row.CUPS))])
                 
+                #Se obtiene una sola vez el diccionario de atributos del nodo del CUPS.
+                datos_cups = G.nodes[str(row.CUPS)]
                 #Primero se definen todas las posibles fases
-                G.nodes[str(row.CUPS)]['P_R_0'] = 0
-                G.nodes[str(row.CUPS)]['Q_R_0'] = 0
-                G.nodes[str(row.CUPS)]['P_S_0'] = 0
-                G.nodes[str(row.CUPS)]['Q_S_0'] = 0
-                G.nodes[str(row.CUPS)]['P_T_0'] = 0
-                G.nodes[str(row.CUPS)]['Q_T_0'] = 0
-                G.nodes[str(row.CUPS)]['LBT_ID'] = str(cup_lbt_id)
-                G.nodes[str(row.CUPS)]['TIPO_CONEXION'] = cup_tipo_conexion
-                G.nodes[str(row.CUPS)]['AMM_FASE'] = cup_amm_fase
-                G.nodes[str(row.CUPS)]['Tipo_Nodo'] = 'CUPS_TR'
-                G.nodes[str(row.CUPS)]['TR'] = trafo_cup
+                datos_cups['P_R_0'] = datos_cups['Q_R_0'] = datos_cups['P_S_0'] = datos_cups['Q_S_0'] = datos_cups['P_T_0'] = datos_cups['Q_T_0'] = 0
+                datos_cups['LBT_ID'] = str(cup_lbt_id)
+                datos_cups['TIPO_CONEXION'] = cup_tipo_conexion
+                datos_cups['AMM_FASE'] = cup_amm_fase
+                datos_cups['Tipo_Nodo'] = 'CUPS_TR'
+                datos_cups['TR'] = trafo_cup
                 
                 #Se añade el nivel de tensión del trafo
-                QBT_tension = str(G.nodes[str(row.CUPS)]['TR']).replace('R','')
+                QBT_tension = str(datos_cups['TR']).replace('R','')
                 if row.CUPS.find(QBT_tension + '1') >= 0:
                     tension_tr = 230
                 elif row.CUPS.find(QBT_tension + '2') >= 0:
@@ -1748,54 +1881,47 @@ class Solve_Graph:
                 else:
                     logger.error('Error al encontrar el nivel de tensión del CUPS ' + str(row.CUPS) + '. Trafo ' + str(row.TRAFO))
                     tension_tr = 0
-                G.nodes[str(row.CUPS)]['QBT_TENSION'] = tension_tr
+                datos_cups['QBT_TENSION'] = tension_tr
                             
                         
-                id_ct_coord_x = row['CUPS_X']
-                id_ct_coord_y = row['CUPS_Y']
-                G.nodes[str(row.CUPS)]['pos'] = (float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.')))
-                G.nodes[str(row.CUPS)]['color_nodo'] = str(dicc_colors.get('CUPS_TR'))
-                G.nodes[str(row.CUPS)]['N_ant'] = 1
+                datos_cups['pos'] = (cups_x[row.Index], cups_y[row.Index])
+                datos_cups['color_nodo'] = color_cups_tr
+                datos_cups['N_ant'] = 1
                 
                 #Se definen los atributos de la línea que une el nodo con el CUPS
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Long'] = float(longitud)
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['P_R_Linea'] = 0
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Q_R_Linea'] = 0
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['P_S_Linea'] = 0
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Q_S_Linea'] = 0
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['P_T_Linea'] = 0
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Q_T_Linea'] = 0
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['TR'] = trafo_cup
-                G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['QBT_TENSION'] = tension_tr
+                datos_enlace = G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]
+                datos_enlace['Long'] = float(longitud)
+                datos_enlace['P_R_Linea'] = datos_enlace['Q_R_Linea'] = datos_enlace['P_S_Linea'] = datos_enlace['Q_S_Linea'] = datos_enlace['P_T_Linea'] = datos_enlace['Q_T_Linea'] = 0
+                datos_enlace['TR'] = trafo_cup
+                datos_enlace['QBT_TENSION'] = tension_tr
 
             else:
-                cup_lbt_nombre = row['LBT_NOMBRE'] #Número de la línea
-                try:
-                    cup_lbt_id = row['LBT_ID']
-                    cup_lbt_id = str(pd.to_numeric(cup_lbt_id, downcast='integer')).replace('.0', '')
-                except:
-                    cup_lbt_id = str(cup_lbt_id).replace('.0', '')
+                cup_lbt_nombre = row.LBT_NOMBRE #Número de la línea
+                #Se calculan una sola vez las claves del CUPS y del CT que se usan en los accesos al grafo.
+                cups_key = str(row.CUPS)
+                ct_key = str(self.id_ct)
+                cup_lbt_id = lbt_id_norm[row.LBT_ID]
                 
-                qbt_tension = row['QBT_TENSION'] #Salida del trafo a la que está conectado el CUPS. T12 = 400V, T11=230V.
+                qbt_tension = row.QBT_TENSION #Salida del trafo a la que está conectado el CUPS. T12 = 400V, T11=230V.
                     
-                trafo_cup = str(row['TRAFO'])
-                cup_tipo_conexion = row['TIPO_CONEXION'] #Monofásico / trifásico
-                cup_pot_max = row['POT_MAX']  # kW
-                cup_tipo_actividad = row['TIPO_ACTIVIDAD'] #Residencial, Industria, Servicios
+                trafo_cup = str(row.TRAFO)
+                cup_tipo_conexion = row.TIPO_CONEXION #Monofásico / trifásico
+                cup_pot_max = row.POT_MAX  # kW
+                cup_tipo_actividad = row.TIPO_ACTIVIDAD #Residencial, Industria, Servicios
                 
-                cup_amm_fase = row['AMM_FASE'] #Fase de conexión. R, S, T
+                cup_amm_fase = row.AMM_FASE #Fase de conexión. R, S, T
                 if cup_amm_fase == 'R' or cup_amm_fase == 'S' or cup_amm_fase == 'T':
                     aa = 'todo ok'
                     del aa
                 else:
-                    df_ct_cups_ct.loc[index, 'AMM_FASE'] = 'R'
-                    logger.error('Error al buscar la fase del CUP ' + str(row.CUPS) + ' y tipo de conexión ' + str(cup_tipo_conexion) + '. Asignada fase R.')
+                    df_ct_cups_ct.iat[row.Index, col_amm_fase] = 'R'
+                    logger.error('Error al buscar la fase del CUP ' + cups_key + ' y tipo de conexión ' + str(cup_tipo_conexion) + '. Asignada fase R.')
                 
-                arqueta = df_matr_dist.loc[df_matr_dist['CUPS'] == row.CUPS]['ID_Nodo_Cercano'].reset_index(drop=True)[0]
+                arqueta = arq_map[row.CUPS]
                 arqueta_cup_lbt_id = str(arqueta) + '_' + str(cup_lbt_id)
                 
                 if str(arqueta).replace('.0','') == '1':
-                    arqueta_cup_lbt_id = str(self.id_ct) + '_' + str(row.LBT_ID)
+                    arqueta_cup_lbt_id = ct_key + '_' + str(row.LBT_ID)
               
                 if str(arqueta).replace('.0','') == '0':
                     aa = 'error nodo'
@@ -1807,55 +1933,44 @@ class Solve_Graph:
                     #COMPROBAR SI arqueta_cup_lbt_id EXISTE EN EL GRAFO
                     #Si no existe, se asocia el CUP al NODO_LBT_ID que exista. (Se asume el error pero se garantiza que el CUP queda conectado al grafo)
                     ########
-                    if arqueta_cup_lbt_id not in G.nodes:
-                        for lbt_row in LBT_ID_list.itertuples():
-                            arqueta_temp = str(arqueta) + '_' + str(lbt_row.LBT_ID)
-                            if arqueta_temp in G.nodes and lbt_row.TRAFO == trafo_cup:
-                                logger.warning('Nodo con ID_NODO_LBT_ID ' + arqueta_cup_lbt_id + ' no encontrado. Se asocia el CUP_LBT_ID ' +  str(row.CUPS) + '_' + str(cup_lbt_id) + ' al ID_NODO_LBT_ID ' + arqueta_temp)
-                                print('Nodo con ID_NODO_LBT_ID ' + arqueta_cup_lbt_id + ' no encontrado. Se asocia el CUP_LBT_ID ' +  str(row.CUPS) + '_' + str(cup_lbt_id) + ' al ID_NODO_LBT_ID ' + arqueta_temp)
+                    if arqueta_cup_lbt_id not in G:
+                        for lbt_id in trafo_lbt.get(trafo_cup, ()):
+                            arqueta_temp = str(arqueta) + '_' + str(lbt_id)
+                            if arqueta_temp in G:
+                                logger.warning('Nodo con ID_NODO_LBT_ID ' + arqueta_cup_lbt_id + ' no encontrado. Se asocia el CUP_LBT_ID ' +  cups_key + '_' + str(cup_lbt_id) + ' al ID_NODO_LBT_ID ' + arqueta_temp)
+                                print('Nodo con ID_NODO_LBT_ID ' + arqueta_cup_lbt_id + ' no encontrado. Se asocia el CUP_LBT_ID ' +  cups_key + '_' + str(cup_lbt_id) + ' al ID_NODO_LBT_ID ' + arqueta_temp)
                                 arqueta_cup_lbt_id = arqueta_temp
                                 break
                             
-                    longitud = df_matr_dist.loc[df_matr_dist['CUPS'] == row.CUPS]['Distancia'].reset_index(drop=True)[0]
+                    longitud = dist_map[row.CUPS]
                     #Si la distancia es demasiado larga (posible error de coordenadas), se define a un valor bajo.
                     if longitud > 50:
                         longitud = 50
                         
                         
-                    #Se crea una función que calcula Enlaces_orig y Enlaces_iter para los nodos de 230. Es necesaria porque sino con el método original se cuentan los CUPS que puedan estar añadidos a un nodo intermedio.
-                    def enlaces_iter_orig(nodo):
-                        cont_enlaces_nodo = 0
-                        for enlace_i in list(np.unique(list(G.edges(str(nodo))))):
-                            if G.nodes[enlace_i]['Tipo_Nodo'] != 'CUPS' and G.nodes[enlace_i]['Tipo_Nodo'] != 'CUPS_TR':
-                                cont_enlaces_nodo += 1
-                        return cont_enlaces_nodo-1 #-1 para no contar el propio nodo.
-                    
-                        
                      #Comprobamos si se trata de un CUPS con nivel de tensión de 230 V. Si es así se duplica la ruta entre el trafo y el CUPS, indicando en cada nodo _230.
                     if int(qbt_tension) >= 200 and int(qbt_tension) < 350:           
                         qbt_tension = 230 #Se define a 230, ya que puede tener valores de 220 o similares
-                        if G.nodes[arqueta_cup_lbt_id]['Tipo_Nodo'] == 'CT_Virtual' and arqueta_cup_lbt_id + '_230' not in G.nodes:
-                            G.add_node(arqueta_cup_lbt_id + '_230', TR = G.nodes[arqueta_cup_lbt_id]['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = G.nodes[arqueta_cup_lbt_id]['Tipo_Nodo'], pos = G.nodes[arqueta_cup_lbt_id]['pos'], color_nodo = G.nodes[arqueta_cup_lbt_id]['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=qbt_tension)
-                            if G.nodes[arqueta_cup_lbt_id]['TR'] + '_230' not in G.nodes:
-                                G.add_node(G.nodes[arqueta_cup_lbt_id]['TR'] + '_230', TR = G.nodes[arqueta_cup_lbt_id]['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = G.nodes[arqueta_cup_lbt_id]['Tipo_Nodo'], pos = G.nodes[arqueta_cup_lbt_id]['pos'], color_nodo = G.nodes[arqueta_cup_lbt_id]['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=qbt_tension)
+                        #Se obtienen una sola vez los atributos de la arqueta y el nombre de su nodo duplicado de 230 V.
+                        datos_arqueta = G.nodes[arqueta_cup_lbt_id]
+                        arqueta_230 = arqueta_cup_lbt_id + '_230'
+                        if datos_arqueta['Tipo_Nodo'] == 'CT_Virtual' and arqueta_230 not in G:
+                            duplica_nodo_230(arqueta_cup_lbt_id, arqueta_230)
+                            if datos_arqueta['TR'] + '_230' not in G:
+                                duplica_nodo_230(arqueta_cup_lbt_id, datos_arqueta['TR'] + '_230')
                                 # G.add_edge(G.nodes[arqueta_cup_lbt_id]['TR'] + '_230', arqueta_cup_lbt_id + '_230', 0, ID_traza = 0, TR=G.nodes[arqueta_cup_lbt_id]['TR'], Long=0, P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(ruta[len(ruta)-1]), str(arqueta_cup_lbt_id),0]['CABLE'])
                                 
-                            ruta=list(nx.shortest_path(G,str(self.id_ct),arqueta_cup_lbt_id))
+                            ruta=list(rutas_ct[arqueta_cup_lbt_id])
                             ruta.remove(arqueta_cup_lbt_id)
-                            if (str(ruta[len(ruta)-1]).replace('400','230'), str(arqueta_cup_lbt_id) + '_230') not in G.edges:
-                                G.add_edge(str(ruta[len(ruta)-1]).replace('400','230'), str(arqueta_cup_lbt_id) + '_230', 0, ID_traza = 0, TR=G.edges[str(ruta[len(ruta)-1]), str(arqueta_cup_lbt_id),0]['TR'], Long=G.edges[str(ruta[len(ruta)-1]), str(arqueta_cup_lbt_id),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(ruta[len(ruta)-1]), str(arqueta_cup_lbt_id),0]['CABLE'], QBT_TENSION=qbt_tension)
-                            if (str(ruta[len(ruta)-2]), str(ruta[len(ruta)-1]).replace('400','230')) not in G.edges:
-                                G.add_edge(str(ruta[len(ruta)-2]), str(ruta[len(ruta)-1]).replace('400','230'), 0, ID_traza = 0, TR=G.edges[str(ruta[len(ruta)-2]), str(ruta[len(ruta)-1]), 0]['TR'], Long=G.edges[str(ruta[len(ruta)-2]), str(ruta[len(ruta)-1]),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(ruta[len(ruta)-2]), str(ruta[len(ruta)-1]),0]['CABLE'], QBT_TENSION=qbt_tension)
+                            #Últimos nodos de la ruta antes de la arqueta y nombre del duplicado de 230 V del último.
+                            ultimo = str(ruta[-1])
+                            ultimo_230 = ultimo.replace('400','230')
+                            penultimo = str(ruta[-2])
+                            if (ultimo_230, arqueta_230) not in G.edges:
+                                duplica_tramo_230(ultimo_230, arqueta_230, G.edges[ultimo, arqueta_cup_lbt_id, 0])
+                            if (penultimo, ultimo_230) not in G.edges:
+                                duplica_tramo_230(penultimo, ultimo_230, G.edges[penultimo, ultimo, 0])
                                 
-                            cont_enlaces_nodo = enlaces_iter_orig(str(ruta[len(ruta)-1]).replace('400','230'))
-                            G.nodes[str(ruta[len(ruta)-1]).replace('400','230')]['Enlaces_orig'] = cont_enlaces_nodo
-                            G.nodes[str(ruta[len(ruta)-1]).replace('400','230')]['Enlaces_iter'] = cont_enlaces_nodo
-                            cont_enlaces_nodo = enlaces_iter_orig(str(arqueta_cup_lbt_id) + '_230')
-                            G.nodes[str(arqueta_cup_lbt_id) + '_230']['Enlaces_orig'] = cont_enlaces_nodo
-                            G.nodes[str(arqueta_cup_lbt_id) + '_230']['Enlaces_iter'] = cont_enlaces_nodo
-                            cont_enlaces_nodo = enlaces_iter_orig(str(ruta[len(ruta)-2]))
-                            G.nodes[str(ruta[len(ruta)-2])]['Enlaces_orig'] = cont_enlaces_nodo
-                            G.nodes[str(ruta[len(ruta)-2])]['Enlaces_iter'] = cont_enlaces_nodo
                             
                             # G.nodes[str(ruta[len(ruta)-1]).replace('400','230')]['Enlaces_orig'] = len(list(np.unique(list(G.edges(str(ruta[len(ruta)-1]).replace('400','230'))))))-1
                             # G.nodes[str(ruta[len(ruta)-1]).replace('400','230')]['Enlaces_iter'] = len(list(np.unique(list(G.edges(str(ruta[len(ruta)-1]).replace('400','230'))))))-1
@@ -1864,27 +1979,29 @@ class Solve_Graph:
                             
                             # arqueta_cup_lbt_id = arqueta_cup_lbt_id + '_230'
                             
-                        elif arqueta_cup_lbt_id + '_230' not in G.nodes and G.nodes[arqueta_cup_lbt_id]['Tipo_Nodo'] != 'CT_Virtual':
-                            G.add_node(arqueta_cup_lbt_id + '_230', TR = G.nodes[arqueta_cup_lbt_id]['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = G.nodes[arqueta_cup_lbt_id]['Tipo_Nodo'], pos = G.nodes[arqueta_cup_lbt_id]['pos'], color_nodo = G.nodes[arqueta_cup_lbt_id]['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=qbt_tension)
-                            ruta=list(nx.shortest_path(G,str(self.id_ct),arqueta_cup_lbt_id))
+                        elif arqueta_230 not in G and datos_arqueta['Tipo_Nodo'] != 'CT_Virtual':
+                            duplica_nodo_230(arqueta_cup_lbt_id, arqueta_230)
+                            ruta=list(rutas_ct[arqueta_cup_lbt_id])
                             ruta.remove(arqueta_cup_lbt_id)
                             nodo_old = arqueta_cup_lbt_id
                             localiza_ct = 0 #Identifica cuando se ha entrado en un CT_Virtual para crear un único enlace entre la LBT_ID y el trafo.
+                            trafo_400 = str(datos_arqueta['TR']) + '_400' #Nodo de 400 V del trafo de la arqueta, fijo en todo el recorrido.
                             for row2 in reversed(ruta):
+                                #Nombres de los duplicados de 230 V, calculados una sola vez por nodo de la ruta.
+                                row2_230 = row2.replace('400','230')
+                                row2_mas_230 = row2 + '_230'
+                                nodo_old_230 = nodo_old + '_230'
+                                #Todas las ramas usan los datos del tramo entre row2 y nodo_old (consecutivos en la ruta).
+                                datos_tramo = G.edges[row2, nodo_old, 0]
                                 #Se comprueba si row2 no está ya definido previamente.
-                                if row2 + '_230' not in G.nodes and row2 != str(G.nodes[arqueta_cup_lbt_id]['TR']) + '_400':
+                                if row2_mas_230 not in G and row2 != trafo_400:
                                     if localiza_ct == 1:
                                         # G.add_edge(str(row2), str(nodo_old) + '_230', 0, ID_traza = 0, TR=G.edges[str(row2), str(nodo_old),0]['TR'], Long=G.edges[str(row2), str(nodo_old),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(row2), str(nodo_old),0]['CABLE'])
                                         
-                                        G.add_node(str(row2).replace('400','230'), TR = G.nodes[str(row2)]['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = G.nodes[str(row2)]['Tipo_Nodo'], pos = G.nodes[str(row2)]['pos'], color_nodo = G.nodes[str(row2)]['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=qbt_tension)
-                                        G.add_edge(str(row2).replace('400','230'), str(nodo_old) + '_230', 0, ID_traza = 0, TR=G.edges[str(row2), str(nodo_old),0]['TR'], Long=G.edges[str(row2), str(nodo_old),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(row2), str(nodo_old),0]['CABLE'], QBT_TENSION=qbt_tension)
-                                        G.add_edge(str(self.id_ct) + '_' + str(row2).replace('_400',''), str(row2).replace('400','230'), 0, ID_traza = 0, TR=G.edges[str(row2), str(nodo_old),0]['TR'], Long=G.edges[str(row2), str(nodo_old),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(row2), str(nodo_old),0]['CABLE'], QBT_TENSION=qbt_tension)
-                                        cont_enlaces_nodo = enlaces_iter_orig(str(row2).replace('400','230'))
-                                        G.nodes[str(row2).replace('400','230')]['Enlaces_orig'] = cont_enlaces_nodo
-                                        G.nodes[str(row2).replace('400','230')]['Enlaces_iter'] = cont_enlaces_nodo
-                                        cont_enlaces_nodo = enlaces_iter_orig(str(self.id_ct) + '_' + str(row2).replace('_400',''))
-                                        G.nodes[str(self.id_ct) + '_' + str(row2).replace('_400','')]['Enlaces_orig'] = cont_enlaces_nodo
-                                        G.nodes[str(self.id_ct) + '_' + str(row2).replace('_400','')]['Enlaces_iter'] = cont_enlaces_nodo
+                                        duplica_nodo_230(row2, row2_230)
+                                        duplica_tramo_230(row2_230, nodo_old_230, datos_tramo)
+                                        ct_lbt = ct_key + '_' + row2.replace('_400','') #Nodo CT_LBTID del trafo.
+                                        duplica_tramo_230(ct_lbt, row2_230, datos_tramo)
                                         
                                         # G.nodes[str(row2).replace('400','230')]['Enlaces_orig'] = len(list(np.unique(list(G.edges(str(row2).replace('400','230'))))))-1
                                         # G.nodes[str(row2).replace('400','230')]['Enlaces_iter'] = len(list(np.unique(list(G.edges(str(row2).replace('400','230'))))))-1
@@ -1893,19 +2010,13 @@ class Solve_Graph:
                                         
                                         
                                     else:
-                                        G.add_node(str(row2) + '_230', TR = G.nodes[str(row2)]['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = G.nodes[str(row2)]['Tipo_Nodo'], pos = G.nodes[str(row2)]['pos'], color_nodo = G.nodes[str(row2)]['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=qbt_tension)
-                                        G.add_edge(str(row2) + '_230', str(nodo_old) + '_230', 0, ID_traza = 0, TR=G.edges[str(row2), str(nodo_old),0]['TR'], Long=G.edges[str(row2), str(nodo_old),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(row2), str(nodo_old),0]['CABLE'], QBT_TENSION=qbt_tension)
-                                    cont_enlaces_nodo = enlaces_iter_orig(nodo_old + '_230')
-                                    G.nodes[nodo_old + '_230']['Enlaces_orig'] = cont_enlaces_nodo
-                                    G.nodes[nodo_old + '_230']['Enlaces_iter'] = cont_enlaces_nodo                                    
+                                        duplica_nodo_230(row2, row2_mas_230)
+                                        duplica_tramo_230(row2_mas_230, nodo_old_230, datos_tramo)
                                     
                                     # G.nodes[nodo_old + '_230']['Enlaces_orig'] = len(list(np.unique(list(G.edges(nodo_old + '_230')))))-1
                                     # G.nodes[nodo_old + '_230']['Enlaces_iter'] = len(list(np.unique(list(G.edges(nodo_old + '_230')))))-1
                                     if G.nodes[row2]['Tipo_Nodo'] == 'CT_Virtual':
                                         if localiza_ct == 1:
-                                            cont_enlaces_nodo = enlaces_iter_orig(str(row2).replace('400','230'))
-                                            G.nodes[str(row2).replace('400','230')]['Enlaces_orig'] = cont_enlaces_nodo
-                                            G.nodes[str(row2).replace('400','230')]['Enlaces_iter'] = cont_enlaces_nodo
                                             
                                             # G.nodes[str(row2).replace('400','230')]['Enlaces_orig'] = len(list(np.unique(list(G.edges(str(row2).replace('400','230'))))))-1
                                             # G.nodes[str(row2).replace('400','230')]['Enlaces_iter'] = len(list(np.unique(list(G.edges(str(row2).replace('400','230'))))))-1
@@ -1915,15 +2026,9 @@ class Solve_Graph:
                                     nodo_old = row2
                                 else:
                                     if localiza_ct == 1:
-                                        if str(row2).replace('400','230') not in G.nodes:
-                                            G.add_node(str(row2).replace('400','230'), TR = G.nodes[str(row2)]['TR'], P_R_0 = 0, Q_R_0 = 0, P_S_0 = 0, Q_S_0 = 0, P_T_0 = 0, Q_T_0 = 0, Tipo_Nodo = G.nodes[str(row2)]['Tipo_Nodo'], pos = G.nodes[str(row2)]['pos'], color_nodo = G.nodes[str(row2)]['color_nodo'], N_ant = 0, N_suc = 0, QBT_TENSION=qbt_tension)
-                                        G.add_edge(str(row2).replace('400','230'), str(nodo_old) + '_230', 0, ID_traza = 0, TR=G.edges[str(row2), str(nodo_old),0]['TR'], Long=G.edges[str(row2), str(nodo_old),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(row2), str(nodo_old),0]['CABLE'], QBT_TENSION=qbt_tension)
-                                        cont_enlaces_nodo = enlaces_iter_orig(nodo_old + '_230')
-                                        G.nodes[nodo_old + '_230']['Enlaces_orig'] = cont_enlaces_nodo
-                                        G.nodes[nodo_old + '_230']['Enlaces_iter'] = cont_enlaces_nodo
-                                        cont_enlaces_nodo = enlaces_iter_orig(str(row2).replace('400','230'))
-                                        G.nodes[str(row2).replace('400','230')]['Enlaces_orig'] = cont_enlaces_nodo
-                                        G.nodes[str(row2).replace('400','230')]['Enlaces_iter'] = cont_enlaces_nodo
+                                        if row2_230 not in G:
+                                            duplica_nodo_230(row2, row2_230)
+                                        duplica_tramo_230(row2_230, nodo_old_230, datos_tramo)
                                         
                                         # G.nodes[nodo_old + '_230']['Enlaces_orig'] = len(list(np.unique(list(G.edges(nodo_old + '_230')))))-1
                                         # G.nodes[nodo_old + '_230']['Enlaces_iter'] = len(list(np.unique(list(G.edges(nodo_old + '_230')))))-1
@@ -1931,13 +2036,7 @@ class Solve_Graph:
                                         # G.nodes[str(row2).replace('400','230')]['Enlaces_iter'] = len(list(np.unique(list(G.edges(str(row2.replace('400','230')))))))-1
                                         break
                                     else:
-                                        G.add_edge(str(row2) + '_230', str(nodo_old) + '_230', 0, ID_traza = 0, TR=G.edges[str(row2), str(nodo_old),0]['TR'], Long=G.edges[str(row2), str(nodo_old),0]['Long'], P_R_Linea=0, Q_R_Linea=0, P_S_Linea=0, Q_S_Linea=0, P_T_Linea=0, Q_T_Linea=0, CABLE=G.edges[str(row2), str(nodo_old),0]['CABLE'], QBT_TENSION=qbt_tension)
-                                        cont_enlaces_nodo = enlaces_iter_orig(nodo_old + '_230')
-                                        G.nodes[nodo_old + '_230']['Enlaces_orig'] = cont_enlaces_nodo
-                                        G.nodes[nodo_old + '_230']['Enlaces_iter'] = cont_enlaces_nodo
-                                        cont_enlaces_nodo = enlaces_iter_orig(str(row2) + '_230')
-                                        G.nodes[str(row2) + '_230']['Enlaces_orig'] = cont_enlaces_nodo
-                                        G.nodes[str(row2) + '_230']['Enlaces_iter'] = cont_enlaces_nodo
+                                        duplica_tramo_230(row2_mas_230, nodo_old_230, datos_tramo)
                                         
                                         # G.nodes[nodo_old + '_230']['Enlaces_orig'] = len(list(np.unique(list(G.edges(nodo_old + '_230')))))-1
                                         # G.nodes[nodo_old + '_230']['Enlaces_iter'] = len(list(np.unique(list(G.edges(nodo_old + '_230')))))-1
@@ -1945,51 +2044,51 @@ class Solve_Graph:
                                         # G.nodes[str(row2) + '_230']['Enlaces_iter'] = len(list(np.unique(list(G.edges(str(row2) + '_230')))))-1
                                         break                                    
             
-                        arqueta_cup_lbt_id = arqueta_cup_lbt_id + '_230' #Se define ahora para poder utilizar antes los datos de la arqueta original.
+                        arqueta_cup_lbt_id = arqueta_230 #Se define ahora para poder utilizar antes los datos de la arqueta original.
                         
                     else:
                         qbt_tension = 400 #Se unifica a 400 porque puede tomar valor de 380, 440 o similar.
                         
                         
                     #Una vez comprobados los enlaces del nodo se añade el CUP
-                    if str(row.CUPS) not in G.nodes:
-                        G.add_edges_from( [(arqueta_cup_lbt_id, str(row.CUPS))])
+                    if cups_key not in G:
+                        G.add_edges_from( [(arqueta_cup_lbt_id, cups_key)])
                     
-                    #Primero se definen todas las posibles fases
-                    G.nodes[str(row.CUPS)]['P_R_0'] = 0
-                    G.nodes[str(row.CUPS)]['Q_R_0'] = 0
-                    G.nodes[str(row.CUPS)]['P_S_0'] = 0
-                    G.nodes[str(row.CUPS)]['Q_S_0'] = 0
-                    G.nodes[str(row.CUPS)]['P_T_0'] = 0
-                    G.nodes[str(row.CUPS)]['Q_T_0'] = 0
-                    G.nodes[str(row.CUPS)]['LBT_ID'] = str(cup_lbt_id)
-                    G.nodes[str(row.CUPS)]['TIPO_CONEXION'] = cup_tipo_conexion
-                    G.nodes[str(row.CUPS)]['AMM_FASE'] = cup_amm_fase
-                    G.nodes[str(row.CUPS)]['Tipo_Nodo'] = 'CUPS'
-                    G.nodes[str(row.CUPS)]['TR'] = trafo_cup
-                    G.nodes[str(row.CUPS)]['QBT_TENSION'] = qbt_tension
-                    
-                            
-                    id_ct_coord_x = row['CUPS_X']
-                    id_ct_coord_y = row['CUPS_Y']
-                    G.nodes[str(row.CUPS)]['pos'] = (float(str(id_ct_coord_x).replace(',','.')), float(str(id_ct_coord_y).replace(',','.')))
-                    G.nodes[str(row.CUPS)]['color_nodo'] = str(dicc_colors.get('CUPS'))
-                    G.nodes[str(row.CUPS)]['N_ant'] = 1
+                    #Se definen de una vez todos los atributos del nodo del CUPS, empezando por todas las posibles fases.
+                    G.nodes[cups_key].update({'P_R_0': 0, 'Q_R_0': 0, 'P_S_0': 0, 'Q_S_0': 0, 'P_T_0': 0, 'Q_T_0': 0,
+                                              'LBT_ID': str(cup_lbt_id), 'TIPO_CONEXION': cup_tipo_conexion, 'AMM_FASE': cup_amm_fase, 'Tipo_Nodo': 'CUPS', 'TR': trafo_cup, 'QBT_TENSION': qbt_tension,
+                                              'pos': (cups_x[row.Index], cups_y[row.Index]), 'color_nodo': color_cups, 'N_ant': 1})
                     
                     #Se definen los atributos de la línea que une el nodo con el CUPS
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Long'] = float(longitud)
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['P_R_Linea'] = 0
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Q_R_Linea'] = 0
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['P_S_Linea'] = 0
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Q_S_Linea'] = 0
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['P_T_Linea'] = 0
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['Q_T_Linea'] = 0
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['TR'] = trafo_cup         
-                    G.edges[(arqueta_cup_lbt_id, str(row.CUPS),0)]['QBT_TENSION'] = qbt_tension
+                    G.edges[(arqueta_cup_lbt_id, cups_key,0)].update({'Long': float(longitud), 'P_R_Linea': 0, 'Q_R_Linea': 0, 'P_S_Linea': 0, 'Q_S_Linea': 0, 'P_T_Linea': 0, 'Q_T_Linea': 0, 'TR': trafo_cup, 'QBT_TENSION': qbt_tension})
         return G
     
     
     
+    def indexa_cups_grafo(self, G):
+        """
+        
+        Función para obtener el nodo del grafo al que está conectado cada CUPS (y CUPS_TR).
+        Se calcula una sola vez, con el grafo ya definido, para no recorrer los enlaces del CUPS en cada hora al añadir las curvas de carga.
+        
+        Parámetros
+        ----------
+        G : Grafo del CT.
+            
+        
+        Retorno
+        -------
+        cups_nodo : Diccionario con el nodo del grafo al que está conectado cada CUPS.
+        """
+        cups_nodo = {}
+        for nodo, data in G.nodes(data=True):
+            if (data['Tipo_Nodo'] == 'CUPS' or data['Tipo_Nodo'] == 'CUPS_TR') and len(G[nodo]) > 0:
+                #Equivale al destino del primer enlace del CUPS, str(list(G.edges(nodo))[0][1]).
+                cups_nodo[nodo] = str(next(iter(G[nodo])))
+        return cups_nodo
+    
+    
+    
     def get_cch_cups(self, fecha, ruta_cch, cups_grafo):
         """
         
@@ -2010,75 +2109,116 @@ class Solve_Graph:
         df_cch_AS_giss : DataFrame con las curvas de carga de energía recibida de los clientes (autoconsumo) por los CUPS de medida en el CT.
         """
         logger = logging.getLogger('get_cch_cups')
-        df_cch = pd.DataFrame(columns=['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25', 'FLAG_H01', 'FLAG_H02', 'FLAG_H03', 'FLAG_H04', 'FLAG_H05', 'FLAG_H06', 'FLAG_H07', 'FLAG_H08', 'FLAG_H09', 'FLAG_H10', 'FLAG_H11', 'FLAG_H12', 'FLAG_H13', 'FLAG_H14', 'FLAG_H15', 'FLAG_H16', 'FLAG_H17', 'FLAG_H18', 'FLAG_H19', 'FLAG_H20', 'FLAG_H21', 'FLAG_H22', 'FLAG_H23', 'FLAG_H24', 'FLAG_H25'])
+        #Columnas de las curvas de carga de clientes que se usan en el análisis. Las columnas FLAG_Hxx no se utilizan y no se leen, para reducir la memoria y el trabajo al filtrar y eliminar duplicados.
+        columnas_cch = ['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION'] + ['VALOR_H' + str(hora).zfill(2) for hora in range(1, 26)]
+        df_cch = pd.DataFrame(columns=columnas_cch)
         # df_cch2 = pd.DataFrame(columns=['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25', 'FLAG_H01', 'FLAG_H02', 'FLAG_H03', 'FLAG_H04', 'FLAG_H05', 'FLAG_H06', 'FLAG_H07', 'FLAG_H08', 'FLAG_H09', 'FLAG_H10', 'FLAG_H11', 'FLAG_H12', 'FLAG_H13', 'FLAG_H14', 'FLAG_H15', 'FLAG_H16', 'FLAG_H17', 'FLAG_H18', 'FLAG_H19', 'FLAG_H20', 'FLAG_H21', 'FLAG_H22', 'FLAG_H23', 'FLAG_H24', 'FLAG_H25'])
         df_cch_AE_giss = pd.DataFrame(columns=['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25', 'FLAG_H01', 'FLAG_H02', 'FLAG_H03', 'FLAG_H04', 'FLAG_H05', 'FLAG_H06', 'FLAG_H07', 'FLAG_H08', 'FLAG_H09', 'FLAG_H10', 'FLAG_H11', 'FLAG_H12', 'FLAG_H13', 'FLAG_H14', 'FLAG_H15', 'FLAG_H16', 'FLAG_H17', 'FLAG_H18', 'FLAG_H19', 'FLAG_H20', 'FLAG_H21', 'FLAG_H22', 'FLAG_H23', 'FLAG_H24', 'FLAG_H25'])
         df_cch_AS_giss = pd.DataFrame(columns=['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25', 'FLAG_H01', 'FLAG_H02', 'FLAG_H03', 'FLAG_H04', 'FLAG_H05', 'FLAG_H06', 'FLAG_H07', 'FLAG_H08', 'FLAG_H09', 'FLAG_H10', 'FLAG_H11', 'FLAG_H12', 'FLAG_H13', 'FLAG_H14', 'FLAG_H15', 'FLAG_H16', 'FLAG_H17', 'FLAG_H18', 'FLAG_H19', 'FLAG_H20', 'FLAG_H21', 'FLAG_H22', 'FLAG_H23', 'FLAG_H24', 'FLAG_H25'])
-        #Listar contenido carpeta curvas de carga
-        contenido = os.listdir(ruta_cch)
-        for i in contenido:
+        #Listar contenido carpeta curvas de carga. Solo interesan los archivos del mes de la fecha indicada.
+        fecha_mes = str(fecha)[0:6]
+        partes_cch = [] #Trozos filtrados de las curvas de carga de clientes. Se concatenan una sola vez al terminar la lectura.
+        #Se prepara una sola vez el conjunto de CUPS del grafo (sin repetidos y como texto) para el filtrado de cada bloque.
+        cups_filtro = np.array(list(set(map(str, cups_grafo))), dtype=object)
+        for entrada in os.scandir(ruta_cch):
+            i = entrada.name
+            #Ahora se comprueba si el archivo es el que se corresponde con la fecha indicada
+            if i.find(fecha_mes) < 0:
+                continue
+            
             palabra_clave = 'CAPTADA' #Palafra que identifica a los clientes. Para el CT es GISS
             if i.find(palabra_clave) >= 0:
                 df_temp = []
-                #Ahora se comprueba si el archivo es el que se corresponde con la fecha indicada
-                if i.find(str(fecha)[0:6]) >= 0:
-                    try:
-                        archivo_cch = ruta_cch + i
-                        iter_csv = pd.read_csv (archivo_cch, iterator=True, chunksize=1000, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
-                        for df_temp in iter_csv:
-                            #df_temp = df_temp.loc[df_temp['FECHA'] == fecha]
-                            df_temp['CUPS'] = df_temp['CUPS'].str.upper().replace(' ', '')
-                            # df_cch = df_cch.append(df_temp[df_temp.CUPS.isin(list(df_ct_cups_ct.CUPS))], ignore_index=True).reset_index(drop=True)
-                            df_cch = df_cch.append(df_temp[df_temp.CUPS.isin(cups_grafo)], ignore_index=True).reset_index(drop=True)
-                        del iter_csv, df_temp
-                    except:
-                        logger.error('Error al leer el archivo con las curvas de carga de los clientes: ' + archivo_cch + '. Ejecución abortada.')
-                        raise
+                try:
+                    archivo_cch = ruta_cch + i
+                    #Se lee por bloques grandes: con bloques de 1000 filas el coste fijo de cada bloque (parseo, filtrado y copia) domina en archivos de varios millones de filas.
+                    iter_csv = pd.read_csv (archivo_cch, iterator=True, chunksize=100000, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False, usecols=lambda columna: columna in columnas_cch)
+                    for df_temp in iter_csv:
+                        #df_temp = df_temp.loc[df_temp['FECHA'] == fecha]
+                        df_temp['CUPS'] = df_temp['CUPS'].str.upper().str.replace(' ', '', regex=False)
+                        # df_cch = df_cch.append(df_temp[df_temp.CUPS.isin(list(df_ct_cups_ct.CUPS))], ignore_index=True).reset_index(drop=True)
+                        partes_cch.append(df_temp[df_temp.CUPS.isin(cups_filtro)])
+                    del iter_csv, df_temp
+                except:
+                    logger.error('Error al leer el archivo con las curvas de carga de los clientes: ' + archivo_cch + '. Ejecución abortada.')
+                    raise
             
             #Se busca también el archivo correspondiente a las medidas a la salida del CT
             palabra_clave_2 = 'AE_GISS'
             if i.find(palabra_clave_2) >= 0:
                 df_temp = []
-                if i.find(str(fecha)[0:6]) >= 0:
-                    #Lectura del archivo con las medidas a la salida del CT:
-                    try:
-                        archivo_cch_giss = ruta_cch + i
+                #Lectura del archivo con las medidas a la salida del CT:
+                try:
+                    archivo_cch_giss = ruta_cch + i
                         
-                        df_temp = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
-                        df_cch_AE_giss = df_temp.loc[(df_temp['CODIGO_LVC'].str.find(str(self.id_ct)) >= 0)].reset_index(drop=True)
-                        del df_temp
-                        # df_cch_AE_giss = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
-                    except:
-                        logger.error('Error al leer el archivo con las curvas de carga del CT: ' + archivo_cch_giss + '. Ejecución abortada.')
-                        raise
+                    df_temp = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
+                    df_cch_AE_giss = df_temp.loc[(df_temp['CODIGO_LVC'].str.find(str(self.id_ct)) >= 0)].reset_index(drop=True)
+                    del df_temp
+                    # df_cch_AE_giss = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
+                except:
+                    logger.error('Error al leer el archivo con las curvas de carga del CT: ' + archivo_cch_giss + '. Ejecución abortada.')
+                    raise
                         
             #Se busca también el archivo correspondiente a las medidas a la salida del CT
             palabra_clave_3 = 'AS_GISS'
             if i.find(palabra_clave_3) >= 0:
                 df_temp = []
-                if i.find(str(fecha)[0:6]) >= 0:
-                    #Lectura del archivo con las medidas a la salida del CT:
-                    try:
-                        archivo_cch_giss = ruta_cch + i
+                #Lectura del archivo con las medidas a la salida del CT:
+                try:
+                    archivo_cch_giss = ruta_cch + i
                         
-                        df_temp = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
-                        df_cch_AS_giss = df_temp.loc[(df_temp['CODIGO_LVC'].str.find(str(self.id_ct)) >= 0)].reset_index(drop=True)
-                        del df_temp
-                        # df_cch_AE_giss = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
-                    except:
-                        logger.error('Error al leer el archivo con las curvas de carga del CT: ' + archivo_cch_giss + '. Ejecución abortada.')
-                        raise
+                    df_temp = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
+                    df_cch_AS_giss = df_temp.loc[(df_temp['CODIGO_LVC'].str.find(str(self.id_ct)) >= 0)].reset_index(drop=True)
+                    del df_temp
+                    # df_cch_AE_giss = pd.read_csv(archivo_cch_giss, encoding='Latin9', header=0, sep=';', quotechar='\"', error_bad_lines = False)
+                except:
+                    logger.error('Error al leer el archivo con las curvas de carga del CT: ' + archivo_cch_giss + '. Ejecución abortada.')
+                    raise
             
         
+        if len(partes_cch) > 0:
+            df_cch = pd.concat([df_cch] + partes_cch, ignore_index=True)
+        del partes_cch
+        
         #Se eliminan duplicados al terminar. Se han localizado CUPS trifásicos que están el archivo de TF4 y en TF5 con las mismas fechas.
-        df_cch = df_cch.drop_duplicates(keep = 'first').reset_index(drop=True)
-        df_cch_AE_giss = df_cch_AE_giss.drop_duplicates(keep = 'first').reset_index(drop=True)
+        #Se comparan las filas completas: CUPS y FECHA no bastan, ya que un mismo CUPS tiene filas de AE (7) y AS (8) para la misma fecha, y las filas repetidas con valores distintos se resuelven después tomando el valor más grande.
+        df_cch = df_cch.drop_duplicates(keep = 'first', ignore_index=True)
+        df_cch_AE_giss = df_cch_AE_giss.drop_duplicates(keep = 'first', ignore_index=True)
+        
+        #Las filas ya están filtradas a los CUPS del grafo. Se reducen los tipos de las columnas por las que se filtra cada día (MAGNITUD y DATA_VALIDATION) para que las comparaciones sean numéricas.
+        #Las filas con MAGNITUD no numérica no son ni AE (7) ni AS (8), se descartan antes de reducir el tipo en lugar de abortar la lectura.
+        df_cch['MAGNITUD'] = pd.to_numeric(df_cch['MAGNITUD'], errors='coerce')
+        df_cch = df_cch[df_cch['MAGNITUD'].notna()].reset_index(drop=True)
+        df_cch['MAGNITUD'] = pd.to_numeric(df_cch['MAGNITUD'], downcast='integer')
+        df_cch['DATA_VALIDATION'] = df_cch['DATA_VALIDATION'].astype('category')
     
         return df_cch, df_cch_AE_giss, df_cch_AS_giss
     
 
     
-    def add_cch_grafo(self, G, colum_hora, df_AE_fecha, df_AS_fecha):#, cups_agregado_CT, id_ct):
+    def agrupa_cch_cups(self, df_fecha, columnas_hora):
+        """
+        
+        Función para agrupar por CUPS las curvas de carga de un día, una sola vez para todas las horas.
+        Importante: Si un CUPS tiene varias filas para la fecha se toma el valor máximo de cada hora, y se guarda el número de filas para avisar en el log al añadir las curvas de carga al grafo.
+        
+        Parámetros
+        ----------
+        df_fecha : DataFrame con la curva de carga (AE o AS) de todos los clientes del CT para la fecha indicada.
+        columnas_hora : Listado de columnas de las curvas de carga con los valores de cada hora [VALOR_H01, VALOR_H02, ... , VALOR_H25].
+                    
+        
+        Retorno
+        -------
+        cch_cups : DataFrame indexado por CUPS con el valor máximo de cada hora y el número de filas del CUPS en la columna N_FILAS.
+        """
+        grupos_cups = df_fecha.groupby('CUPS', sort=False)
+        cch_cups = grupos_cups[columnas_hora].max()
+        cch_cups['N_FILAS'] = grupos_cups.size()
+        return cch_cups
+    
+    
+    def add_cch_grafo(self, G, colum_hora, cch_AE_cups, cch_AS_cups):#, cups_agregado_CT, id_ct):
         """
         
         Función para añadir al grafo los valores de potencia de las curvas de carga tanto de clientes como de medido en el CT para una hora concreta, para el posterior cálculo de pérdidas.
@@ -2088,8 +2228,8 @@ class Solve_Graph:
         ----------
         G : Grafo del CT.
         colum_hora : Columna del DF de curvas de carga con el valor de la hora a analizar [VALOR_H01, VALOR_H02, ... , VALOR_H24].
-        df_AE_fecha : DataFrame con la curva de carga de energía activa consumida (AE) para todos los clientes del CT para la fecha indicada.
-        df_AS_fecha : DataFrame con la curva de carga de energía activa suministrada a la red (AS, autoconsumo vertido) para todos los clientes del CT para la fecha indicada.
+        cch_AE_cups : DataFrame agrupado por CUPS (agrupa_cch_cups) con la curva de carga de energía activa consumida (AE) para todos los clientes del CT para la fecha indicada.
+        cch_AS_cups : DataFrame agrupado por CUPS (agrupa_cch_cups) con la curva de carga de energía activa suministrada a la red (AS, autoconsumo vertido) para todos los clientes del CT para la fecha indicada.
                     
         
         Retorno
@@ -2098,201 +2238,173 @@ class Solve_Graph:
         """
         logger = logging.getLogger('add_cch_grafo')
         
+        #Se guarda una sola vez la vista de nodos del grafo.
+        nodes_view = G.nodes
+        
         #Antes de añadir las curvas de carga poner a 0 los parámetros de potencia de todos los nodos.
-        for nodo1, nodo2, keys, data in G.edges(data = True, default = 0, keys=True):
-            G.edges[nodo1, nodo2, keys]['P_R_Linea'] = 0
-            G.edges[nodo1, nodo2, keys]['P_S_Linea'] = 0
-            G.edges[nodo1, nodo2, keys]['P_T_Linea'] = 0
-            G.edges[nodo1, nodo2, keys]['Q_R_Linea'] = 0
-            G.edges[nodo1, nodo2, keys]['Q_S_Linea'] = 0
-            G.edges[nodo1, nodo2, keys]['Q_T_Linea'] = 0
+        #Se actualiza directamente el diccionario de atributos que devuelve la iteración con un diccionario de ceros.
+        potencia_enlace_0 = {'P_R_Linea': 0, 'P_S_Linea': 0, 'P_T_Linea': 0, 'Q_R_Linea': 0, 'Q_S_Linea': 0, 'Q_T_Linea': 0}
+        for nodo1, nodo2, keys, data in G.edges(data = True, keys=True):
+            data.update(potencia_enlace_0)
         
         #Reiniciar también a 0 las pérdidas de todos los enlaces.
-        for nodo, data in G.nodes(data=True, default = 0):
-            G.nodes[nodo]['P_R_0'] = 0
-            G.nodes[nodo]['P_S_0'] = 0
-            G.nodes[nodo]['P_T_0'] = 0
-            G.nodes[nodo]['Q_R_0'] = 0
-            G.nodes[nodo]['Q_S_0'] = 0
-            G.nodes[nodo]['Q_T_0'] = 0
+        potencia_nodo_0 = {'P_R_0': 0, 'P_S_0': 0, 'P_T_0': 0, 'Q_R_0': 0, 'Q_S_0': 0, 'Q_T_0': 0}
+        for nodo, data in G.nodes(data=True):
+            data.update(potencia_nodo_0)
         
         #Se recorre el DF de AE para añadir la potencia de cada CUPS
-        cups_utilizados = [] #Se define esta lista para ir incluyendo los CUPS que ya se han utilizado, para evitar los casos con 2 filas repetidas por CUPS
-        for index, row in df_AE_fecha.iterrows():
-            if len(df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS].reset_index(drop=True)) >= 1:
-                if len(df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS].reset_index(drop=True)) > 1:
-                    #Se ha encontrado más de 1 fila AE para el mismo CUPS en la misma fecha en STO. GRIAL 32 (6486) para el CUPS ES0033770553479001ZZ0F  durante varios días del mes de enero de 2020.
-                    logger.error('Encontrados ' + str(len(df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS].reset_index(drop=True))) + ' filas con CCH_AE para el CUPS ' + str(row.CUPS) + ' y debería ser solo 1 fila. Se considera solo el valormás grande para el análisis de la hora ' + str(colum_hora))
-                
-                try:
-                    if df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS].sort_values(colum_hora, ascending=False).reset_index(drop=True)[colum_hora][0] > 0: 
-                        # potencia_cup = float(df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS][colum_hora].reset_index(drop=True)[0])
-                        potencia_cup = float(df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS].sort_values(colum_hora, ascending=False).reset_index(drop=True)[colum_hora][0])
-                        #Cuidado con los posibles valores de potencia 'nan'.
-                        if potencia_cup > 0:
-                            aa = 'todo ok'
-                            del aa
-                        else:
-                            potencia_cup = 0
-                        Q_CUP = 0
-                        cup_amm_fase = G.nodes[row.CUPS]['AMM_FASE']
-                        if cup_amm_fase == 'R' or cup_amm_fase == 'S' or cup_amm_fase == 'T':
-                            aa = 'todo ok'
-                            del aa
-                        else: 
-                            logger.error('Error al identificar la fase ' + str(cup_amm_fase) + ' del CUPS ' + str(row.CUPS))
-                            cup_amm_fase = 'R'
-                            
-                        cup_tipo_conexion = G.nodes[row.CUPS]['TIPO_CONEXION']
-                        
-                    else:
+        #Las filas de cada CUPS ya están agrupadas para el día: valor máximo de la hora (equivale a ordenar de mayor a menor y tomar el primero) y número de filas. Cada CUPS aparece una sola vez, no hace falta controlar los repetidos.
+        for cups, valor_max, n_filas in zip(cch_AE_cups.index, cch_AE_cups[colum_hora].to_numpy(), cch_AE_cups['N_FILAS'].to_numpy()):
+            if n_filas > 1:
+                #Se ha encontrado más de 1 fila AE para el mismo CUPS en la misma fecha en STO. GRIAL 32 (6486) para el CUPS ES0033770553479001ZZ0F  durante varios días del mes de enero de 2020.
+                logger.error('Encontrados ' + str(n_filas) + ' filas con CCH_AE para el CUPS ' + str(cups) + ' y debería ser solo 1 fila. Se considera solo el valor más grande para el análisis de la hora ' + str(colum_hora))
+            
+            try:
+                if valor_max > 0: 
+                    # potencia_cup = float(df_AE_fecha.loc[df_AE_fecha['CUPS'] == row.CUPS][colum_hora].reset_index(drop=True)[0])
+                    potencia_cup = float(valor_max)
+                    #Cuidado con los posibles valores de potencia 'nan'.
+                    if not potencia_cup > 0:
                         potencia_cup = 0
-                        Q_CUP = 0
+                    Q_CUP = 0
+                    cup_amm_fase = nodes_view[cups]['AMM_FASE']
+                    if cup_amm_fase != 'R' and cup_amm_fase != 'S' and cup_amm_fase != 'T':
+                        logger.error('Error al identificar la fase ' + str(cup_amm_fase) + ' del CUPS ' + str(cups))
                         cup_amm_fase = 'R'
-                        cup_tipo_conexion = 'MONOFASICO'
-                except:
+                        
+                    cup_tipo_conexion = nodes_view[cups]['TIPO_CONEXION']
+                    
+                else:
                     potencia_cup = 0
                     Q_CUP = 0
                     cup_amm_fase = 'R'
                     cup_tipo_conexion = 'MONOFASICO'
+            except:
+                potencia_cup = 0
+                Q_CUP = 0
+                cup_amm_fase = 'R'
+                cup_tipo_conexion = 'MONOFASICO'
+            
+            Nodo_grafo = self.cups_nodo_grafo[cups]
+            #Diccionarios de atributos del CUPS y del nodo al que está conectado.
+            datos_cups = nodes_view[str(cups)]
+            datos_nodo = nodes_view[Nodo_grafo]
+            #Nombres de los atributos de potencia de la fase del CUPS.
+            clave_p = 'P_' + cup_amm_fase + '_0'
+            clave_q = 'Q_' + cup_amm_fase + '_0'
+            
+            #Se agrega la potencia en el nodo. Aquí se sumará lo de todos los CUPS conectados a ese nodo.
+            #Se agrega siempre en P_FASE_0 y Q_FASE_0
+            if cup_tipo_conexion == 'MONOFASICO':
+                #Se asigna el valor de potencia en el atributo del CUPS y en la fase correspondiente.
+                datos_cups[clave_p] = potencia_cup
+                datos_cups[clave_q] = Q_CUP
+                #Idem. para la fase oportuna del nodo
+                datos_nodo[clave_p] = datos_nodo[clave_p] + potencia_cup
+                datos_nodo[clave_q] = datos_nodo[clave_q] + datos_cups[clave_q]
+                #Pérdidas de la línea que une la arqueta con el CUP. Puede ser trifásica o monofásica. NO tenemos el tipo de cable.
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['P_' + cup_amm_fase + '_Linea'] = 0
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['Q_' + cup_amm_fase + '_Linea'] = 0
+                    
                 
-                Nodo_grafo = str(list(G.edges(row.CUPS))[0][1])
-                
-                #Se agrega la potencia en el nodo. Aquí se sumará lo de todos los CUPS conectados a ese nodo.
-                #Se agrega siempre en P_FASE_0 y Q_FASE_0
-                if cup_tipo_conexion == 'MONOFASICO':
-                    #Se comprueba si no se ha añadido antes una potencia a este CUPS, podría ser el caso si el CUPS estuviese repetido para la fecha de análisis. En este caso, el del primer if de este ciclo, se habría añadido el valor más alto de potencia y se descartan los demás.
-                    # if G.nodes[str(row.CUPS)]['P_' + cup_amm_fase + '_0'] == 0:
-                    if str(row.CUPS) not in cups_utilizados:
-                        #Se asigna el valor de potencia en el atributo del CUPS y en la fase correspondiente.
-                        G.nodes[str(row.CUPS)]['P_' + cup_amm_fase + '_0'] = potencia_cup
-                        G.nodes[str(row.CUPS)]['Q_' + cup_amm_fase + '_0'] = Q_CUP
-                        #Idem. para la fase oportuna del nodo
-                        G.nodes[Nodo_grafo]['P_' + cup_amm_fase + '_0'] = G.nodes[Nodo_grafo]['P_' + cup_amm_fase + '_0'] + potencia_cup
-                        G.nodes[Nodo_grafo]['Q_' + cup_amm_fase + '_0'] = G.nodes[Nodo_grafo]['Q_' + cup_amm_fase + '_0'] + G.nodes[str(row.CUPS)]['Q_' + cup_amm_fase + '_0']
-                        #Pérdidas de la línea que une la arqueta con el CUP. Puede ser trifásica o monofásica. NO tenemos el tipo de cable.
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['P_' + cup_amm_fase + '_Linea'] = 0
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['Q_' + cup_amm_fase + '_Linea'] = 0
-                        cups_utilizados.append(str(row.CUPS)) #Se añade el cups a la lista una vez utilizado
-                    else:
-                        logger.error('Ya se ha agregado una potencia AE para el CUPS monofásico ' + str(row.CUPS) + ', que aparece en varias filas, se obvian el resto de valores de la hora ' + str(colum_hora))
-                        
+            elif cup_tipo_conexion == 'TRIFASICO':
+                #Se asigna el valor de potencia en el atributo del CUPS y en las 3 fases. El reparto por fase se calcula una sola vez.
+                potencia_fase = potencia_cup/3
+                Q_fase = Q_CUP/3
+                datos_cups['P_R_0'] = potencia_fase
+                datos_cups['Q_R_0'] = Q_fase
+                datos_cups['P_S_0'] = potencia_fase
+                datos_cups['Q_S_0'] = Q_fase
+                datos_cups['P_T_0'] = potencia_fase
+                datos_cups['Q_T_0'] = Q_fase
                     
-                elif cup_tipo_conexion == 'TRIFASICO':
-                    #Se comprueba si no se ha añadido antes una potencia a este CUPS, podría ser el caso si el CUPS estuviese repetido para la fecha de análisis. En este caso, el del primer if de este ciclo, se habría añadido el valor más alto de potencia y se descartan los demás.
-                    # if (G.nodes[str(row.CUPS)]['P_R_0'] == 0) and (G.nodes[str(row.CUPS)]['P_S_0'] == 0) and (G.nodes[str(row.CUPS)]['P_T_0'] == 0):
-                    if str(row.CUPS) not in cups_utilizados:
-                        #Se asigna el valor de potencia en el atributo del CUPS y en las 3 fases.
-                        G.nodes[str(row.CUPS)]['P_R_0'] = potencia_cup/3
-                        G.nodes[str(row.CUPS)]['Q_R_0'] = Q_CUP/3
-                        G.nodes[str(row.CUPS)]['P_S_0'] = potencia_cup/3
-                        G.nodes[str(row.CUPS)]['Q_S_0'] = Q_CUP/3
-                        G.nodes[str(row.CUPS)]['P_T_0'] = potencia_cup/3
-                        G.nodes[str(row.CUPS)]['Q_T_0'] = Q_CUP/3
-                        
-                        G.nodes[Nodo_grafo]['P_R_0'] = G.nodes[Nodo_grafo]['P_R_0'] + potencia_cup/3
-                        G.nodes[Nodo_grafo]['Q_R_0'] = G.nodes[Nodo_grafo]['Q_R_0'] + Q_CUP/3
-                        G.nodes[Nodo_grafo]['P_S_0'] = G.nodes[Nodo_grafo]['P_S_0'] + potencia_cup/3
-                        G.nodes[Nodo_grafo]['Q_S_0'] = G.nodes[Nodo_grafo]['Q_S_0'] + Q_CUP/3
-                        G.nodes[Nodo_grafo]['P_T_0'] = G.nodes[Nodo_grafo]['P_T_0'] + potencia_cup/3
-                        G.nodes[Nodo_grafo]['Q_T_0'] = G.nodes[Nodo_grafo]['Q_T_0'] + Q_CUP/3
-                        #Pérdidas de la línea que une la arqueta con el CUP. Puede ser trifásica o monofásica. NO tenemos el tipo de cable.
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['P_R_Linea'] = 0
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['Q_R_Linea'] = 0
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['P_S_Linea'] = 0
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0]['Q_S_Linea'] = 0
-                        # G.edges[(Nodo_grafo,  str(row.CUPS),0]['P_T_Linea'] = 0
-                        # G.edges[(Nodo_grafo,  str(row.CUPS) ,0)]['Q_T_Linea'] = 0
-                        cups_utilizados.append(str(row.CUPS)) #Se añade el cups a la lista una vez utilizado
-                    else:
-                        logger.error('Ya se ha agregado una potencia AE para el CUPS trifásico ' + str(row.CUPS) + ', que aparece en varias filas, se obvian el resto de valores de la hora ' + str(colum_hora))
-                else:
-                    logger.error('ERROR CUPS_AE. TIPO DE CONEXIÓN NO IDENTIFICADA (MONOFÁSICA/TRIFÁSICA): ' +  str(row.CUPS) + ': ' + str(cup_tipo_conexion))
+                datos_nodo['P_R_0'] = datos_nodo['P_R_0'] + potencia_fase
+                datos_nodo['Q_R_0'] = datos_nodo['Q_R_0'] + Q_fase
+                datos_nodo['P_S_0'] = datos_nodo['P_S_0'] + potencia_fase
+                datos_nodo['Q_S_0'] = datos_nodo['Q_S_0'] + Q_fase
+                datos_nodo['P_T_0'] = datos_nodo['P_T_0'] + potencia_fase
+                datos_nodo['Q_T_0'] = datos_nodo['Q_T_0'] + Q_fase
+                #Pérdidas de la línea que une la arqueta con el CUP. Puede ser trifásica o monofásica. NO tenemos el tipo de cable.
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['P_R_Linea'] = 0
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['Q_R_Linea'] = 0
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0)]['P_S_Linea'] = 0
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0]['Q_S_Linea'] = 0
+                # G.edges[(Nodo_grafo,  str(row.CUPS),0]['P_T_Linea'] = 0
+                # G.edges[(Nodo_grafo,  str(row.CUPS) ,0)]['Q_T_Linea'] = 0
+            else:
+                logger.error('ERROR CUPS_AE. TIPO DE CONEXIÓN NO IDENTIFICADA (MONOFÁSICA/TRIFÁSICA): ' +  str(cups) + ': ' + str(cup_tipo_conexion))
 
         #Se repite el proceso para los CUPS con generación vertida a la red.
         #En este caso se define la potencia como negativa, de forma que se reste a la potencia inyectada por el trafo.
-        del cups_utilizados
-        cups_utilizados = [] #Se define esta lista para ir incluyendo los CUPS que ya se han utilizado, para evitar los casos con 2 filas repetidas por CUPS
-        for index, row in df_AS_fecha.iterrows():
-            if len(df_AS_fecha.loc[df_AS_fecha['CUPS'] == row.CUPS].reset_index(drop=True)) >= 1:
-                if len(df_AS_fecha.loc[df_AS_fecha['CUPS'] == row.CUPS].reset_index(drop=True)) > 1:
-                    #Se ha encontrado más de 1 fila AS para el mismo CUPS en la misma fecha.
-                    logger.error('Encontrados ' + str(len(df_AS_fecha.loc[df_AS_fecha['CUPS'] == row.CUPS].reset_index(drop=True))) + ' filas con CCH_AS para el CUPS ' + str(row.CUPS) + ' y debería ser solo 1 fila. Se considera solo el primer valor para el análisis de la hora ' + str(colum_hora))
-                
-                try:       
-                    if df_AS_fecha.loc[df_AS_fecha['CUPS'] == row.CUPS].sort_values(colum_hora, ascending=False).reset_index(drop=True)[colum_hora][0] > 0:
-                        potencia_cup = -1 * float(df_AS_fecha.loc[df_AS_fecha['CUPS'] == row.CUPS].sort_values(colum_hora, ascending=False).reset_index(drop=True)[colum_hora][0])
-                        #Cuidado con los posibles valores de potencia 'nan'.
-                        if potencia_cup < 0:
-                            aa = 'todo ok'
-                            del aa
-                        else:
-                            potencia_cup = 0
-                        Q_CUP = 0
-                        cup_amm_fase = G.nodes[row.CUPS]['AMM_FASE']
-                        if cup_amm_fase == 'R' or cup_amm_fase == 'S' or cup_amm_fase == 'T':
-                            aa = 'todo ok'
-                            del aa
-                        else: 
-                            logger.error('Error al identificar la fase ' + str(cup_amm_fase) + ' del CUPS ' + str(row.CUPS))
-                            cup_amm_fase = 'R'
-                            
-                        cup_tipo_conexion = G.nodes[row.CUPS]['TIPO_CONEXION']
-                        
-                    else:
+        #Las filas de cada CUPS ya están agrupadas para el día: valor máximo de la hora (equivale a ordenar de mayor a menor y tomar el primero) y número de filas. Cada CUPS aparece una sola vez, no hace falta controlar los repetidos.
+        for cups, valor_max, n_filas in zip(cch_AS_cups.index, cch_AS_cups[colum_hora].to_numpy(), cch_AS_cups['N_FILAS'].to_numpy()):
+            if n_filas > 1:
+                #Se ha encontrado más de 1 fila AS para el mismo CUPS en la misma fecha.
+                logger.error('Encontrados ' + str(n_filas) + ' filas con CCH_AS para el CUPS ' + str(cups) + ' y debería ser solo 1 fila. Se considera solo el valor más grande para el análisis de la hora ' + str(colum_hora))
+            
+            try:       
+                if valor_max > 0:
+                    potencia_cup = -1 * float(valor_max)
+                    #Cuidado con los posibles valores de potencia 'nan'.
+                    if not potencia_cup < 0:
                         potencia_cup = 0
-                        Q_CUP = 0
+                    Q_CUP = 0
+                    cup_amm_fase = nodes_view[cups]['AMM_FASE']
+                    if cup_amm_fase != 'R' and cup_amm_fase != 'S' and cup_amm_fase != 'T':
+                        logger.error('Error al identificar la fase ' + str(cup_amm_fase) + ' del CUPS ' + str(cups))
                         cup_amm_fase = 'R'
-                        cup_tipo_conexion = 'MONOFASICO'
-                except:
+                        
+                    cup_tipo_conexion = nodes_view[cups]['TIPO_CONEXION']
+                    
+                else:
                     potencia_cup = 0
                     Q_CUP = 0
                     cup_amm_fase = 'R'
                     cup_tipo_conexion = 'MONOFASICO'
-                
-                Nodo_grafo = str(list(G.edges(row.CUPS))[0][1])
-                        
-                #Se agrega la potencia en el nodo. Aquí se sumará lo de todos los CUPS conectados a ese nodo. En este caso la generación se sumará con número negativo, por lo que se restará.
-                #Se agrega siempre en P_FASE_0 y Q_FASE_0
-                if cup_tipo_conexion == 'MONOFASICO':
-                    #Se comprueba si no se ha añadido antes una potencia a este CUPS, podría ser el caso si el CUPS estuviese repetido para la fecha de análisis. En este caso, el del primer if de este ciclo, se habría añadido el valor más alto de potencia y se descartan los demás.
-                    # if G.nodes[str(row.CUPS)]['P_' + cup_amm_fase + '_0'] == 0:
-                    if str(row.CUPS) not in cups_utilizados:
-                        #Se asigna el valor de potencia en el atributo del CUPS y en la fase correspondiente.
-                        #Cuidado con los casos de autoconsumo, puede darse el caso de que, para una misma hora, un CUPS haya consumido e inyectado a la vez (EL PILAR 6720, 2020-10-03)
-                        G.nodes[str(row.CUPS)]['P_' + cup_amm_fase + '_0'] += potencia_cup
-                        G.nodes[str(row.CUPS)]['Q_' + cup_amm_fase + '_0'] += Q_CUP
-                        #Idem. para la fase oportuna del nodo
-                        G.nodes[Nodo_grafo]['P_' + cup_amm_fase + '_0'] = G.nodes[Nodo_grafo]['P_' + cup_amm_fase + '_0'] + potencia_cup
-                        G.nodes[Nodo_grafo]['Q_' + cup_amm_fase + '_0'] = G.nodes[Nodo_grafo]['Q_' + cup_amm_fase + '_0'] + G.nodes[str(row.CUPS)]['Q_' + cup_amm_fase + '_0']
-                        cups_utilizados.append(str(row.CUPS)) #Se añade el cups a la lista una vez utilizado
-                    else:
-                        logger.error('Ya se ha agregado una potencia AS para el CUPS monofásico ' + str(row.CUPS) + ', que aparece en varias filas, se obvian el resto de valores de la hora ' + str(colum_hora))
-                        
-                elif cup_tipo_conexion == 'TRIFASICO':
-                    #Se comprueba si no se ha añadido antes una potencia a este CUPS, podría ser el caso si el CUPS estuviese repetido para la fecha de análisis. En este caso, el del primer if de este ciclo, se habría añadido el valor más alto de potencia y se descartan los demás.
-                    # if (G.nodes[str(row.CUPS)]['P_R_0'] == 0) and (G.nodes[str(row.CUPS)]['P_S_0'] == 0) and (G.nodes[str(row.CUPS)]['P_T_0'] == 0):
-                    if str(row.CUPS) not in cups_utilizados:
-                        #Se asigna el valor de potencia en el atributo del CUPS y en las 3 fases.
-                        G.nodes[str(row.CUPS)]['P_R_0'] += potencia_cup/3
-                        G.nodes[str(row.CUPS)]['Q_R_0'] += Q_CUP/3
-                        G.nodes[str(row.CUPS)]['P_S_0'] += potencia_cup/3
-                        G.nodes[str(row.CUPS)]['Q_S_0'] += Q_CUP/3
-                        G.nodes[str(row.CUPS)]['P_T_0'] += potencia_cup/3
-                        G.nodes[str(row.CUPS)]['Q_T_0'] += Q_CUP/3
-                        
-                        G.nodes[Nodo_grafo]['P_R_0'] = G.nodes[Nodo_grafo]['P_R_0'] + potencia_cup/3
-                        G.nodes[Nodo_grafo]['Q_R_0'] = G.nodes[Nodo_grafo]['Q_R_0'] + Q_CUP/3
-                        G.nodes[Nodo_grafo]['P_S_0'] = G.nodes[Nodo_grafo]['P_S_0'] + potencia_cup/3
-                        G.nodes[Nodo_grafo]['Q_S_0'] = G.nodes[Nodo_grafo]['Q_S_0'] + Q_CUP/3
-                        G.nodes[Nodo_grafo]['P_T_0'] = G.nodes[Nodo_grafo]['P_T_0'] + potencia_cup/3
-                        G.nodes[Nodo_grafo]['Q_T_0'] = G.nodes[Nodo_grafo]['Q_T_0'] + Q_CUP/3
-                        cups_utilizados.append(str(row.CUPS)) #Se añade el cups a la lista una vez utilizado
-                    else:
-                        logger.error('Ya se ha agregado una potencia AS para el CUPS trifásico ' + str(row.CUPS) + ', que aparece en varias filas, se obvian el resto de valores de la hora ' + str(colum_hora))
-                else:
-                    logger.error('ERROR CUPS_AS. TIPO DE CONEXIÓN NO IDENTIFICADA (MONOFÁSICA/TRIFÁSICA): ' +  str(row.CUPS) + ': ' + str(cup_tipo_conexion))
-        del cups_utilizados
+            except:
+                potencia_cup = 0
+                Q_CUP = 0
+                cup_amm_fase = 'R'
+                cup_tipo_conexion = 'MONOFASICO'
+            
+            Nodo_grafo = self.cups_nodo_grafo[cups]
+            #Diccionarios de atributos del CUPS y del nodo al que está conectado.
+            datos_cups = nodes_view[str(cups)]
+            datos_nodo = nodes_view[Nodo_grafo]
+            #Nombres de los atributos de potencia de la fase del CUPS.
+            clave_p = 'P_' + cup_amm_fase + '_0'
+            clave_q = 'Q_' + cup_amm_fase + '_0'
+                    
+            #Se agrega la potencia en el nodo. Aquí se sumará lo de todos los CUPS conectados a ese nodo. En este caso la generación se sumará con número negativo, por lo que se restará.
+            #Se agrega siempre en P_FASE_0 y Q_FASE_0
+            if cup_tipo_conexion == 'MONOFASICO':
+                #Se asigna el valor de potencia en el atributo del CUPS y en la fase correspondiente.
+                #Cuidado con los casos de autoconsumo, puede darse el caso de que, para una misma hora, un CUPS haya consumido e inyectado a la vez (EL PILAR 6720, 2020-10-03)
+                datos_cups[clave_p] += potencia_cup
+                datos_cups[clave_q] += Q_CUP
+                #Idem. para la fase oportuna del nodo
+                datos_nodo[clave_p] = datos_nodo[clave_p] + potencia_cup
+                datos_nodo[clave_q] = datos_nodo[clave_q] + datos_cups[clave_q]
+                    
+            elif cup_tipo_conexion == 'TRIFASICO':
+                #Se asigna el valor de potencia en el atributo del CUPS y en las 3 fases. El reparto por fase se calcula una sola vez.
+                potencia_fase = potencia_cup/3
+                Q_fase = Q_CUP/3
+                datos_cups['P_R_0'] += potencia_fase
+                datos_cups['Q_R_0'] += Q_fase
+                datos_cups['P_S_0'] += potencia_fase
+                datos_cups['Q_S_0'] += Q_fase
+                datos_cups['P_T_0'] += potencia_fase
+                datos_cups['Q_T_0'] += Q_fase
+                    
+                datos_nodo['P_R_0'] = datos_nodo['P_R_0'] + potencia_fase
+                datos_nodo['Q_R_0'] = datos_nodo['Q_R_0'] + Q_fase
+                datos_nodo['P_S_0'] = datos_nodo['P_S_0'] + potencia_fase
+                datos_nodo['Q_S_0'] = datos_nodo['Q_S_0'] + Q_fase
+                datos_nodo['P_T_0'] = datos_nodo['P_T_0'] + potencia_fase
+                datos_nodo['Q_T_0'] = datos_nodo['Q_T_0'] + Q_fase
+            else:
+                logger.error('ERROR CUPS_AS. TIPO DE CONEXIÓN NO IDENTIFICADA (MONOFÁSICA/TRIFÁSICA): ' +  str(cups) + ': ' + str(cup_tipo_conexion))
         return G
     
     
@@ -2320,127 +2432,167 @@ class Solve_Graph:
         CCH_Data_Error : Valor del parámetro de comprobación de resultados.
         """
         logger = logging.getLogger('resuelve_grafo')
-        #Hay que asegurarse de que todos los nodos tienen al atributo 'Enlaces_iter' igual que 'Enlaces_orig'
-        for row in G.nodes:
-            if G.nodes[row]['Tipo_Nodo'] != 'CUPS' and G.nodes[row]['Tipo_Nodo'] != 'CUPS_TR':
-                G.nodes[row]['Enlaces_iter'] = G.nodes[row]['Enlaces_orig']
         
-        #Se recorren todos los nodos finales (los que no tienen conectado nada y los que tienen conectados los CUPS pero NO tienen otros descendientes)
-        for row in end_nodes_cups:
-            ruta=list(nx.shortest_path(G,str(self.id_ct),row))
-            ruta.remove(row)
+        #Parámetros de cálculo de las pérdidas como variables locales, ya que se usan en cada enlace recorrido
+        X_cable = self.X_cable
+        #Tensiones de fase (V_Linea/raíz de 3) calculadas una sola vez, en lugar de en cada fase de cada enlace
+        V_Fase_400 = self.V_Linea_400/math.sqrt(3)
+        V_Fase_230 = self.V_Linea_230/math.sqrt(3)
+        #Conjunto de nodos de bifurcación para las comprobaciones de pertenencia al recorrer las rutas. La lista se mantiene para iterar en orden.
+        splitting_nodes_set = set(splitting_nodes_sin_cups)
+        
+        def ruta_ct(nodo):
+            #Ruta desde el CT hasta el nodo, sin incluir el propio nodo. La topología no cambia entre horas, por lo que se calcula solo la primera vez.
+            #Las rutas de todos los nodos se obtienen con un único recorrido BFS desde el CT, en lugar de un shortest_path por cada nodo.
+            if not self.rutas_ct:
+                self.rutas_ct = {n: ruta[:-1] for n, ruta in nx.single_source_shortest_path(G,str(self.id_ct)).items()}
+            return self.rutas_ct[nodo]
+        
+        def conductor(tipo_cable):
+            #Conductor con los datos del tipo de cable cargados de la librería .xml. Se carga una sola vez por tipo de cable, ya que fcompute_r solo depende de la temperatura y la corriente que se fijan antes de cada cálculo.
+            if tipo_cable not in self.conductores_cable:
+                Cable = cable.Conductor()
+                Found_cable = Cable.fload_library( tipo_cable)
+                # if Found_cable == 0:
+                #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Se consideran valores definidos por defecto.')
+                self.conductores_cable[tipo_cable] = Cable
+            return self.conductores_cable[tipo_cable]
+        
+        def agrega_enlaces(nodo_old, row2):
+            #Agrega en row2 la potencia de nodo_old y las pérdidas de los enlaces en paralelo entre ambos nodos. Es común a los dos recorridos del grafo.
+            #Devuelve el diccionario de atributos de row2, para comprobar después si es un nodo de bifurcación.
+            #Enlaces en paralelo entre ambos nodos, como diccionario clave -> atributos de la adyacencia del MultiGraph
+            enlaces = G[row2][nodo_old]
+            N_anteriores = len(enlaces)
+            datos_old = G.nodes[nodo_old]
+            datos_row2 = G.nodes[row2]
+            #Potencias de nodo_old como variables locales. No cambian al recorrer los enlaces en paralelo, solo se modifica row2.
+            P_R_old = datos_old['P_R_0']
+            Q_R_old = datos_old['Q_R_0']
+            P_S_old = datos_old['P_S_0']
+            Q_S_old = datos_old['Q_S_0']
+            P_T_old = datos_old['P_T_0']
+            Q_T_old = datos_old['Q_T_0']
+            #Potencias acumuladas en row2. Se suman en variables locales y se escriben en el nodo una sola vez al terminar con los enlaces en paralelo.
+            P_R_row2 = datos_row2['P_R_0']
+            Q_R_row2 = datos_row2['Q_R_0']
+            P_S_row2 = datos_row2['P_S_0']
+            Q_S_row2 = datos_row2['Q_S_0']
+            P_T_row2 = datos_row2['P_T_0']
+            Q_T_row2 = datos_row2['Q_T_0']
+
+            for i, edata in enlaces.items():
+                tipo_cable = str(edata['CABLE'])
+                QBT_TENSION = str(edata['QBT_TENSION'])
+                longitud_km = float(str(edata['Long']).replace(',','.'))/1000 #Se convierte una sola vez para las tres fases
+                if QBT_TENSION == '400':
+                    V_Fase = V_Fase_400
+                elif QBT_TENSION == '230':
+                    V_Fase = V_Fase_230
+                else:
+                    #Todos los enlaces del grafo se definen a 400 o 230 V. Otra tensión es un error de construcción del grafo y no se puede calcular la corriente del enlace.
+                    logger.error('Tensión ' + QBT_TENSION + ' no reconocida en el enlace ' + str(nodo_old) + ' - ' + str(row2) + ' (' + str(i) + '). Solo se admiten 400 y 230 V.')
+                    raise ValueError('Tensión ' + QBT_TENSION + ' no reconocida en el enlace ' + str(nodo_old) + ' - ' + str(row2))
+                I_R_row = (math.hypot(P_R_old*1000, Q_R_old*1000)/V_Fase)/N_anteriores
+                I_S_row = (math.hypot(P_S_old*1000, Q_S_old*1000)/V_Fase)/N_anteriores
+                I_T_row = (math.hypot(P_T_old*1000, Q_T_old*1000)/V_Fase)/N_anteriores
             
-            #Se recorre la ruta en sentido inverso, añadiendo la potencia y calculando las pérdidas de los vanos.
-            #Se para cuando se encuentra un nodo con más ramificaciones.
-            nodo_old = row
-            for row2 in reversed(ruta):
-                N_anteriores = 0
-                for i in range(0,1000000):
-                    try:
-                        G.edges[(row2, nodo_old, i)]
-                        N_anteriores += 1
-                    except:
-                        break
-
-                for i in range(0, N_anteriores):
-                    tipo_cable = str(G.edges[(row2, nodo_old,i)]['CABLE'])
-                    QBT_TENSION = str(G.edges[(row2, nodo_old,i)]['QBT_TENSION'])
-                    if QBT_TENSION == '400':
-                        V_Linea = self.V_Linea_400
-                    elif QBT_TENSION == '230':
-                        V_Linea = self.V_Linea_230
-                    I_R_row = (math.sqrt(float(G.nodes[nodo_old]['P_R_0']*1000)**2 + float(G.nodes[nodo_old]['Q_R_0']*1000)**2)/(V_Linea/math.sqrt(3)))/N_anteriores
-                    I_S_row = (math.sqrt(float(G.nodes[nodo_old]['P_S_0']*1000)**2 + float(G.nodes[nodo_old]['Q_S_0']*1000)**2)/(V_Linea/math.sqrt(3)))/N_anteriores
-                    I_T_row = (math.sqrt(float(G.nodes[nodo_old]['P_T_0']*1000)**2 + float(G.nodes[nodo_old]['Q_T_0']*1000)**2)/(V_Linea/math.sqrt(3)))/N_anteriores
-                
+                if longitud_km == 0:
+                    #Enlace sin longitud (p.ej. enlaces del CT virtual, que pueden no tener tipo de cable asignado). No hay pérdidas por resistencia, no es necesario llamar a la librería de cables.
+                    R_cable_ohm_R = R_cable_ohm_S = R_cable_ohm_T = 0
+                else:
                     #Se llama a la librería de cálculo de resistencia por km
-                    Cable_R = cable.Conductor()
-        #                Cable_R.fload_library( "RZ_0.6/1.0_kV_4x10_CU")
-                    Found_cable = Cable_R.fload_library( tipo_cable)
-                    # if Found_cable == 0:
-                    #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Enlace ' + str(row2) + '-' + str(nodo_old) + '-' + str(i) + '. Se consideran valores definidos por defecto.')
+                    Cable_R = conductor(tipo_cable)
                     Cable_R.fset_t1(temp_cables)
                     Cable_R.fset_i(I_R_row)
                     R_cable_ohm_km_R = Cable_R.fcompute_r()
-                    
-                    # longitud = float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))
+                
+                    # longitud = float(str(edata['Long']).replace(',','.'))
                     # if longitud > 100:
                     #     longitud = 100
                     #     logger.warning('La traza ' + str(row.NODO_ORIGEN) + ' - ' + str(row.NODO_DESTINO) + ' tiene más de 100m de longitud. Posible error, se asigna longitud=100m.')
+            
+                    R_cable_ohm_R = R_cable_ohm_km_R * longitud_km
                 
-                    R_cable_ohm_R = R_cable_ohm_km_R * float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))/1000
-                    
-                    Cable_S = cable.Conductor()
-                    Found_cable = Cable_S.fload_library( tipo_cable)
-                    # if Found_cable == 0:
-                    #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Enlace ' + str(row2) + '-' + str(nodo_old) + '-' + str(i) + '. Se consideran valores definidos por defecto.')
+                    Cable_S = conductor(tipo_cable)
                     Cable_S.fset_t1(temp_cables)
                     Cable_S.fset_i(I_S_row)
                     R_cable_ohm_km_S = Cable_S.fcompute_r()
-                    R_cable_ohm_S = R_cable_ohm_km_S * float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))/1000
-                    
-                    Cable_T = cable.Conductor()
-                    Found_cable = Cable_T.fload_library( tipo_cable)
-                    # if Found_cable == 0:
-                    #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Enlace ' + str(row2) + '-' + str(nodo_old) + '-' + str(i) + '. Se consideran valores definidos por defecto.')
+                    R_cable_ohm_S = R_cable_ohm_km_S * longitud_km
+                
+                    Cable_T = conductor(tipo_cable)
                     Cable_T.fset_t1(temp_cables)
                     Cable_T.fset_i(I_T_row)
                     R_cable_ohm_km_T = Cable_T.fcompute_r()
-                    R_cable_ohm_T = R_cable_ohm_km_T * float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))/1000
-                        
-                        
-                    P_R_row = R_cable_ohm_R*I_R_row**2/1000 #Se pasa a kW
-                    Q_R_row = self.X_cable*I_R_row**2/1000
-                    P_S_row = R_cable_ohm_S*I_S_row**2/1000 #Se pasa a kW
-                    Q_S_row = self.X_cable*I_S_row**2/1000
-                    P_T_row = R_cable_ohm_T*I_T_row**2/1000 #Se pasa a kW                    
-                    Q_T_row = self.X_cable*I_T_row**2/1000
-                
-                        
-                    #Si el nodo destino tiene bifurcación hay que tener cuidado de no agregar potencia en el ID que no corresponde. En el caso de los enlaces es igual en todos los casos.
-                    #Las pérdidas dan un valor positivo aunque la potencia en nodo_old sea negativa (autoconsumo).
-                    #Hay que mantenerlas positivas para que al sumar P_Nodo_old + Pérdidas sea un número negativo más grande (P_row2 será mayor que P_nodo_old)
-                    #Pero al definir las pérdidas en el grafo se hace en negativo, para indicar que son debidas a autoconsumo y que no se asocian al grafo.
-                    if G.nodes[nodo_old]['P_R_0'] < 0:
-                        G.edges[(row2, nodo_old,i)]['P_R_Linea'] = G.edges[(row2, nodo_old,i)]['P_R_Linea'] - P_R_row
-                        G.edges[(row2, nodo_old,i)]['Q_R_Linea'] = G.edges[(row2, nodo_old,i)]['Q_R_Linea'] - Q_R_row
-                    else:
-                        G.edges[(row2, nodo_old,i)]['P_R_Linea'] = G.edges[(row2, nodo_old,i)]['P_R_Linea'] + P_R_row
-                        G.edges[(row2, nodo_old,i)]['Q_R_Linea'] = G.edges[(row2, nodo_old,i)]['Q_R_Linea'] + Q_R_row
-                    if G.nodes[nodo_old]['P_S_0'] < 0:
-                        G.edges[(row2, nodo_old,i)]['P_S_Linea'] = G.edges[(row2, nodo_old,i)]['P_S_Linea'] - P_S_row
-                        G.edges[(row2, nodo_old,i)]['Q_S_Linea'] = G.edges[(row2, nodo_old,i)]['Q_S_Linea'] - Q_S_row
-                    else:
-                        G.edges[(row2, nodo_old,i)]['P_S_Linea'] = G.edges[(row2, nodo_old,i)]['P_S_Linea'] + P_S_row
-                        G.edges[(row2, nodo_old,i)]['Q_S_Linea'] = G.edges[(row2, nodo_old,i)]['Q_S_Linea'] + Q_S_row
-                    if G.nodes[nodo_old]['P_T_0'] < 0:
-                        G.edges[(row2, nodo_old,i)]['P_T_Linea'] = G.edges[(row2, nodo_old,i)]['P_T_Linea'] - P_T_row
-                        G.edges[(row2, nodo_old,i)]['Q_T_Linea'] = G.edges[(row2, nodo_old,i)]['Q_T_Linea'] - Q_T_row
-                    else:
-                        G.edges[(row2, nodo_old,i)]['P_T_Linea'] = G.edges[(row2, nodo_old,i)]['P_T_Linea'] + P_T_row
-                        G.edges[(row2, nodo_old,i)]['Q_T_Linea'] = G.edges[(row2, nodo_old,i)]['Q_T_Linea'] + Q_T_row
+                    R_cable_ohm_T = R_cable_ohm_km_T * longitud_km
                     
-                    #En el caso de la potencia en los nodos:
-                    #Cuidado con sumar varias veces cuando i > 0
-                    if i == 0:
-                        G.nodes[row2]['P_R_0'] = G.nodes[row2]['P_R_0'] + G.nodes[nodo_old]['P_R_0'] + P_R_row
-                        G.nodes[row2]['Q_R_0'] = G.nodes[row2]['Q_R_0'] + G.nodes[nodo_old]['Q_R_0'] + Q_R_row
-                        G.nodes[row2]['P_S_0'] = G.nodes[row2]['P_S_0'] + G.nodes[nodo_old]['P_S_0'] + P_S_row
-                        G.nodes[row2]['Q_S_0'] = G.nodes[row2]['Q_S_0'] + G.nodes[nodo_old]['Q_S_0'] + Q_S_row
-                        G.nodes[row2]['P_T_0'] = G.nodes[row2]['P_T_0'] + G.nodes[nodo_old]['P_T_0'] + P_T_row
-                        G.nodes[row2]['Q_T_0'] = G.nodes[row2]['Q_T_0'] + G.nodes[nodo_old]['Q_T_0'] + Q_T_row
-                    else:
-                        G.nodes[row2]['P_R_0'] = G.nodes[row2]['P_R_0'] + P_R_row
-                        G.nodes[row2]['Q_R_0'] = G.nodes[row2]['Q_R_0'] + Q_R_row
-                        G.nodes[row2]['P_S_0'] = G.nodes[row2]['P_S_0'] + P_S_row
-                        G.nodes[row2]['Q_S_0'] = G.nodes[row2]['Q_S_0'] + Q_S_row
-                        G.nodes[row2]['P_T_0'] = G.nodes[row2]['P_T_0'] + P_T_row
-                        G.nodes[row2]['Q_T_0'] = G.nodes[row2]['Q_T_0'] + Q_T_row
+                    
+                #Cuadrado de la corriente de cada fase, común a las pérdidas activas y reactivas
+                I2_R_row = I_R_row**2
+                P_R_row = R_cable_ohm_R*I2_R_row/1000 #Se pasa a kW
+                Q_R_row = X_cable*I2_R_row/1000
+                I2_S_row = I_S_row**2
+                P_S_row = R_cable_ohm_S*I2_S_row/1000 #Se pasa a kW
+                Q_S_row = X_cable*I2_S_row/1000
+                I2_T_row = I_T_row**2
+                P_T_row = R_cable_ohm_T*I2_T_row/1000 #Se pasa a kW                    
+                Q_T_row = X_cable*I2_T_row/1000
+            
+                    
+                #Si el nodo destino tiene bifurcación hay que tener cuidado de no agregar potencia en el ID que no corresponde. En el caso de los enlaces es igual en todos los casos.
+                #Las pérdidas dan un valor positivo aunque la potencia en nodo_old sea negativa (autoconsumo).
+                #Hay que mantenerlas positivas para que al sumar P_Nodo_old + Pérdidas sea un número negativo más grande (P_row2 será mayor que P_nodo_old)
+                #Pero al definir las pérdidas en el grafo se hace en negativo, para indicar que son debidas a autoconsumo y que no se asocian al grafo.
+                signo_R = -1 if P_R_old < 0 else 1
+                edata['P_R_Linea'] = edata['P_R_Linea'] + signo_R*P_R_row
+                edata['Q_R_Linea'] = edata['Q_R_Linea'] + signo_R*Q_R_row
+                signo_S = -1 if P_S_old < 0 else 1
+                edata['P_S_Linea'] = edata['P_S_Linea'] + signo_S*P_S_row
+                edata['Q_S_Linea'] = edata['Q_S_Linea'] + signo_S*Q_S_row
+                signo_T = -1 if P_T_old < 0 else 1
+                edata['P_T_Linea'] = edata['P_T_Linea'] + signo_T*P_T_row
+                edata['Q_T_Linea'] = edata['Q_T_Linea'] + signo_T*Q_T_row
                 
-                G.nodes[nodo_old]['Enlaces_iter'] -=1
+                #En el caso de la potencia en los nodos:
+                #Cuidado con sumar varias veces cuando i > 0
+                if i == 0:
+                    P_R_row2 = P_R_row2 + P_R_old + P_R_row
+                    Q_R_row2 = Q_R_row2 + Q_R_old + Q_R_row
+                    P_S_row2 = P_S_row2 + P_S_old + P_S_row
+                    Q_S_row2 = Q_S_row2 + Q_S_old + Q_S_row
+                    P_T_row2 = P_T_row2 + P_T_old + P_T_row
+                    Q_T_row2 = Q_T_row2 + Q_T_old + Q_T_row
+                else:
+                    P_R_row2 = P_R_row2 + P_R_row
+                    Q_R_row2 = Q_R_row2 + Q_R_row
+                    P_S_row2 = P_S_row2 + P_S_row
+                    Q_S_row2 = Q_S_row2 + Q_S_row
+                    P_T_row2 = P_T_row2 + P_T_row
+                    Q_T_row2 = Q_T_row2 + Q_T_row
+            
+            datos_row2.update({'P_R_0': P_R_row2, 'Q_R_0': Q_R_row2, 'P_S_0': P_S_row2, 'Q_S_0': Q_S_row2, 'P_T_0': P_T_row2, 'Q_T_0': Q_T_row2})
+            datos_old['Enlaces_iter'] -=1
+            
+            return datos_row2
+        
+        #Hay que asegurarse de que todos los nodos tienen al atributo 'Enlaces_iter' igual que 'Enlaces_orig'
+        #Se usa directamente el diccionario de atributos de cada nodo que devuelve la iteración.
+        for row, data in G.nodes(data=True):
+            if data['Tipo_Nodo'] != 'CUPS' and data['Tipo_Nodo'] != 'CUPS_TR':
+                data['Enlaces_iter'] = data['Enlaces_orig']
+        
+        #Se recorren todos los nodos finales (los que no tienen conectado nada y los que tienen conectados los CUPS pero NO tienen otros descendientes)
+        for row in end_nodes_cups:
+            ruta = ruta_ct(row)
+            
+            #Se recorre la ruta en sentido inverso, añadiendo la potencia y calculando las pérdidas de los vanos.
+            #Se para cuando se encuentra un nodo con más ramificaciones.
+            nodo_old = row
+            for row2 in reversed(ruta):
+                datos_row2 = agrega_enlaces(nodo_old, row2)
                 
-                if row2 in splitting_nodes_sin_cups:
-                    G.nodes[row2]['Enlaces_iter'] -=1
+                if row2 in splitting_nodes_set:
+                    datos_row2['Enlaces_iter'] -=1
                     break 
                 
                 nodo_old = row2
@@ -2448,136 +2600,40 @@ class Solve_Graph:
         
         #Ahora se recorre de forma iterativa los splitting nodes que ya tienen 'Enlaces_iter' == 1 hasta que se llega a otro splitting node con más ramas.
         #Así hasta acabar con todo el grafo.            
-        nodos_utilizados = []
+        nodos_utilizados = set() #Conjunto, para comprobar la pertenencia directamente y no tener que eliminar duplicados
+        #Diccionarios de atributos de los splitting nodes, resueltos una sola vez y no en cada pasada del bucle while
+        #Se recorren de mayor a menor profundidad desde el CT: cuando se llega a un nodo ya se han agregado todas las ramas que cuelgan de él, y en una sola pasada se resuelve todo el grafo.
+        #El orden solo depende de la topología, se calcula en la primera hora y se reutiliza en el resto.
+        if not self.splitting_ordenados:
+            self.splitting_ordenados = sorted(splitting_nodes_sin_cups, key=lambda nodo: len(ruta_ct(nodo)), reverse=True)
+        datos_splitting = [(row, G.nodes[row]) for row in self.splitting_ordenados]
         a=0
         salir_bucle = 0
         while len(nodos_utilizados) < len(splitting_nodes_sin_cups) and salir_bucle == 0 :#and a == 0:     
             a = 1
-            for row in splitting_nodes_sin_cups:
-                if G.nodes[row]['Enlaces_iter'] == 1 and (row not in (nodos_utilizados)):
+            for row, datos_row in datos_splitting:
+                if datos_row['Enlaces_iter'] == 1 and (row not in nodos_utilizados):
                     a = 0
-                    ruta=list(nx.shortest_path(G,str(self.id_ct),row))
-                    ruta.remove(row)
+                    ruta = ruta_ct(row)
                     #Se recorre la ruta en sentido inverso, añadiendo la potencia y calculando las pérdidas de los vanos.
                     #Hasta que se encuentra un nodo con más ramificaciones
                     nodo_old = row
                     for row2 in reversed(ruta):
                         #Es necesario en todos los casos identificar los diferentes ID de potencia que existen en el nodo y continuar aguas arriba por el enlace adecuado.
-                        N_anteriores = 0
-                        for i in range(0,1000000):
-                            try:
-                                G.edges[(row2, nodo_old, i)]
-                                N_anteriores += 1
-                            except:
-                                break
-
-                        for i in range(0,N_anteriores):
-                            #Si la longitud de la traza es distinta de 0 se calculan las pérdidas. si es 0 puede ser un enlace del CT virtual que no tiene asignado tipo de cable
-                            tipo_cable = str(G.edges[(row2, nodo_old,i)]['CABLE'])
-                            QBT_TENSION = str(G.edges[(row2, nodo_old,i)]['QBT_TENSION'])
-                            if QBT_TENSION == '400':
-                                V_Linea = self.V_Linea_400
-                            elif QBT_TENSION == '230':
-                                V_Linea = self.V_Linea_230
-                            I_R_row = (math.sqrt(float(G.nodes[nodo_old]['P_R_0']*1000)**2 + float(G.nodes[nodo_old]['Q_R_0']*1000)**2)/(V_Linea/math.sqrt(3)))/N_anteriores
-                            I_S_row = (math.sqrt(float(G.nodes[nodo_old]['P_S_0']*1000)**2 + float(G.nodes[nodo_old]['Q_S_0']*1000)**2)/(V_Linea/math.sqrt(3)))/N_anteriores
-                            I_T_row = (math.sqrt(float(G.nodes[nodo_old]['P_T_0']*1000)**2 + float(G.nodes[nodo_old]['Q_T_0']*1000)**2)/(V_Linea/math.sqrt(3)))/N_anteriores   
-                            
-                            # I_R_row = (math.sqrt(3)*math.sqrt(float(G.nodes[nodo_old]['P_R_0']*1000)**2 + float(G.nodes[nodo_old]['Q_R_0']*1000)**2)/(math.sqrt(3)*self.V_Linea))/N_anteriores
-                            # I_S_row = (math.sqrt(3)*math.sqrt(float(G.nodes[nodo_old]['P_S_0']*1000)**2 + float(G.nodes[nodo_old]['Q_S_0']*1000)**2)/(math.sqrt(3)*self.V_Linea))/N_anteriores
-                            # I_T_row = (math.sqrt(3)*math.sqrt(float(G.nodes[nodo_old]['P_T_0']*1000)**2 + float(G.nodes[nodo_old]['Q_T_0']*1000)**2)/(math.sqrt(3)*self.V_Linea))/N_anteriores   
-                            
-                            #Se llama a la librería de cálculo de resistencia por km
-                            Cable_R = cable.Conductor()
-                            Found_cable = Cable_R.fload_library( tipo_cable)
-                            # if Found_cable == 0:
-                            #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Enlace ' + str(row2) + '-' + str(nodo_old) + '-' + str(i) + '. Se consideran valores definidos por defecto.')
-                            Cable_R.fset_t1(temp_cables)
-                            Cable_R.fset_i(I_R_row)
-                            R_cable_ohm_km_R = Cable_R.fcompute_r()
-                            R_cable_ohm_R = R_cable_ohm_km_R * float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))/1000
-                            
-                            Cable_S = cable.Conductor()
-                            Found_cable = Cable_S.fload_library( tipo_cable)
-                            # if Found_cable == 0:
-                            #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Enlace ' + str(row2) + '-' + str(nodo_old) + '-' + str(i) + '. Se consideran valores definidos por defecto.')
-                            Cable_S.fset_t1(temp_cables)
-                            Cable_S.fset_i(I_S_row)
-                            R_cable_ohm_km_S = Cable_S.fcompute_r()
-                            R_cable_ohm_S = R_cable_ohm_km_S * float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))/1000
-                            
-                            Cable_T = cable.Conductor()
-                            Found_cable = Cable_T.fload_library( tipo_cable)
-                            # if Found_cable == 0:
-                            #     logger.warning('Error al buscar el tipo de cable ' + tipo_cable + ' en la librería .xml. Enlace ' + str(row2) + '-' + str(nodo_old) + '-' + str(i) + '. Se consideran valores definidos por defecto.')
-                            Cable_T.fset_t1(temp_cables)
-                            Cable_T.fset_i(I_T_row)
-                            R_cable_ohm_km_T = Cable_T.fcompute_r()
-                            R_cable_ohm_T = R_cable_ohm_km_T * float(str(G.edges[(row2, nodo_old,i)]['Long']).replace(',','.'))/1000
-                            
-                        
-                            P_R_row = R_cable_ohm_R*I_R_row**2/1000 #Se pasa a kW
-                            Q_R_row = self.X_cable*I_R_row**2/1000
-                            P_S_row = R_cable_ohm_S*I_S_row**2/1000 #Se pasa a kW
-                            Q_S_row = self.X_cable*I_S_row**2/1000
-                            P_T_row = R_cable_ohm_T*I_T_row**2/1000 #Se pasa a kW
-                            Q_T_row = self.X_cable*I_T_row**2/1000  
-                            
-                            #Las pérdidas dan un valor positivo aunque la potencia en nodo_old sea negativa (autoconsumo).
-                            #Hay que mantenerlas positivas para que al sumar P_Nodo_old + Pérdidas sea un número negativo más grande (P_row2 será mayor que P_nodo_old)
-                            #Pero al definir las pérdidas en el grafo se hace en negativo, para indicar que son debidas a autoconsumo y que no se asocian al grafo.
-                            if G.nodes[nodo_old]['P_R_0'] < 0:
-                                G.edges[(row2, nodo_old,i)]['P_R_Linea'] = G.edges[(row2, nodo_old,i)]['P_R_Linea'] - P_R_row
-                                G.edges[(row2, nodo_old,i)]['Q_R_Linea'] = G.edges[(row2, nodo_old,i)]['Q_R_Linea'] - Q_R_row
-                            else:
-                                G.edges[(row2, nodo_old,i)]['P_R_Linea'] = G.edges[(row2, nodo_old,i)]['P_R_Linea'] + P_R_row
-                                G.edges[(row2, nodo_old,i)]['Q_R_Linea'] = G.edges[(row2, nodo_old,i)]['Q_R_Linea'] + Q_R_row
-                            if G.nodes[nodo_old]['P_S_0'] < 0:
-                                G.edges[(row2, nodo_old,i)]['P_S_Linea'] = G.edges[(row2, nodo_old,i)]['P_S_Linea'] - P_S_row
-                                G.edges[(row2, nodo_old,i)]['Q_S_Linea'] = G.edges[(row2, nodo_old,i)]['Q_S_Linea'] - Q_S_row
-                            else:
-                                G.edges[(row2, nodo_old,i)]['P_S_Linea'] = G.edges[(row2, nodo_old,i)]['P_S_Linea'] + P_S_row
-                                G.edges[(row2, nodo_old,i)]['Q_S_Linea'] = G.edges[(row2, nodo_old,i)]['Q_S_Linea'] + Q_S_row
-                            if G.nodes[nodo_old]['P_T_0'] < 0:
-                                G.edges[(row2, nodo_old,i)]['P_T_Linea'] = G.edges[(row2, nodo_old,i)]['P_T_Linea'] - P_T_row
-                                G.edges[(row2, nodo_old,i)]['Q_T_Linea'] = G.edges[(row2, nodo_old,i)]['Q_T_Linea'] - Q_T_row
-                            else:
-                                G.edges[(row2, nodo_old,i)]['P_T_Linea'] = G.edges[(row2, nodo_old,i)]['P_T_Linea'] + P_T_row
-                                G.edges[(row2, nodo_old,i)]['Q_T_Linea'] = G.edges[(row2, nodo_old,i)]['Q_T_Linea'] + Q_T_row
-                            
-                            
-                            #En el caso de la potencia en los nodos:
-                            #Cuidado con sumar varias veces cuando i > 0
-                            if i == 0:
-                                G.nodes[row2]['P_R_0'] = G.nodes[row2]['P_R_0'] + G.nodes[nodo_old]['P_R_0'] + P_R_row
-                                G.nodes[row2]['Q_R_0'] = G.nodes[row2]['Q_R_0'] + G.nodes[nodo_old]['Q_R_0'] + Q_R_row
-                                G.nodes[row2]['P_S_0'] = G.nodes[row2]['P_S_0'] + G.nodes[nodo_old]['P_S_0'] + P_S_row
-                                G.nodes[row2]['Q_S_0'] = G.nodes[row2]['Q_S_0'] + G.nodes[nodo_old]['Q_S_0'] + Q_S_row
-                                G.nodes[row2]['P_T_0'] = G.nodes[row2]['P_T_0'] + G.nodes[nodo_old]['P_T_0'] + P_T_row
-                                G.nodes[row2]['Q_T_0'] = G.nodes[row2]['Q_T_0'] + G.nodes[nodo_old]['Q_T_0'] + Q_T_row
-                            else:
-                                G.nodes[row2]['P_R_0'] = G.nodes[row2]['P_R_0'] + P_R_row
-                                G.nodes[row2]['Q_R_0'] = G.nodes[row2]['Q_R_0'] + Q_R_row
-                                G.nodes[row2]['P_S_0'] = G.nodes[row2]['P_S_0'] + P_S_row
-                                G.nodes[row2]['Q_S_0'] = G.nodes[row2]['Q_S_0'] + Q_S_row
-                                G.nodes[row2]['P_T_0'] = G.nodes[row2]['P_T_0'] + P_T_row
-                                G.nodes[row2]['Q_T_0'] = G.nodes[row2]['Q_T_0'] + Q_T_row
-                            
-                        G.nodes[nodo_old]['Enlaces_iter'] -=1
+                        datos_row2 = agrega_enlaces(nodo_old, row2)
                         
                         
-                        if row2 in splitting_nodes_sin_cups:
-                            if G.nodes[row2]['Enlaces_iter'] > 2:
-                                G.nodes[row2]['Enlaces_iter'] -=1
+                        if row2 in splitting_nodes_set:
+                            if datos_row2['Enlaces_iter'] > 2:
+                                datos_row2['Enlaces_iter'] -=1
                                 salir_bucle = 1
                                 break 
-                            nodos_utilizados.append(row2)                        
+                            nodos_utilizados.add(row2)                        
                         
                         nodo_old = row2
                         
                             
-                    nodos_utilizados.append(row)
-                    nodos_utilizados = list(dict.fromkeys(nodos_utilizados))
+                    nodos_utilizados.add(row)
             if a == 1:
                 print('Entramos en un bucle...')
                 logger.critical('Error encontrado. Entrada en bucle no resuelto. se aborta el cálculo de pérdidas.')
@@ -2702,7 +2758,7 @@ def main(self):
         G = nx.MultiGraph() #Multigrafo no dirigido. Permite añadir múltiples enlaces entre los mismos nodos, con diferentes valores en los atributos.
         
         #Se genera el grafo con los DF creados
-        G, graph_data_error = self.genera_grafo(G, df_nodos_ct, df_traza_ct, LBT_ID_list, cups_agregado_CT, dicc_colors, graph_data_error)
+        G, graph_data_error, df_traza_ct = self.genera_grafo(G, df_nodos_ct, df_traza_ct, LBT_ID_list, cups_agregado_CT, dicc_colors, graph_data_error)
     
         ##############################################################################
         ## Lectura de los archivos de CUPS y asociación de CUPS con el nodo correpsondiente del grafo.
@@ -2735,6 +2791,19 @@ def main(self):
     
     
     
+    print('Graph_data_error = ' + str(graph_data_error))
+    self.update_graph_data_error(graph_data_error)
+    
+    #Se aborta antes de guardar el .gml y de representar la red, para no hacerlo con un grafo no válido.
+    if graph_data_error == 3:
+        logger.critical('CREACIÓN DEL GRAFO ABORTADA. ERRORES INCOMPATIBLES CON UNA CORRECTA DEFINICIÓN.')
+        print('CREACIÓN DEL GRAFO ABORTADA. ERRORES INCOMPATIBLES CON UNA CORRECTA DEFINICIÓN. Graph_data_error = ' + str(graph_data_error))
+        return
+        # return graph_data_error
+    
+    
+    #El .gml solo se guarda si se ha generado el grafo desde el principio.
+    if self.use_gml_file == 1 or gml_ok == 1:
         ##############################################################################
         ## Generación de un archivo .gml con la descripción del grafo.
         ##############################################################################
@@ -2744,10 +2813,12 @@ def main(self):
         # nx.write_gml(G, self.ruta_raiz + 'gml_files/' + 'Graph_def_' + self.Nombre_CT.replace(' ', '_') + '_' + str(self.id_ct) + '.gml')
         # nx.write_yaml(G, self.ruta_raiz + 'Graph_def_' + self.Nombre_CT.replace(' ', '_') + '_' + str(self.id_ct) + '.yaml')
         #Archivo comprimido. Ej. El_Infierno = 4,3 kB
-        #Se guarda si no ha habido un error crítico de descripción que no permita tener un 
-        # if graph_data_error != 3:
+        #Solo se llega aquí si no ha habido un error crítico de descripción (graph_data_error = 3), en ese caso ya se ha abortado antes.
         try:
-            nx.write_gml(G, self.ruta_raiz + 'gml_files/' + 'Graph_def_' + self.Nombre_CT.replace(' ', '_') + '_' + str(self.id_ct) + '.gml.gz')
+            #Se escribe línea a línea sobre el archivo comprimido, con un nivel de compresión bajo (más rápido, el tamaño sigue siendo muy reducido frente al .gml).
+            #Las líneas del .gml se pasan al compresor con writelines según se generan, sin construir el documento completo en memoria.
+            with gzip.open(self.ruta_raiz + 'gml_files/' + 'Graph_def_' + self.Nombre_CT.replace(' ', '_') + '_' + str(self.id_ct) + '.gml.gz', 'wb', compresslevel=1) as f_gml:
+                f_gml.writelines((linea + '\n').encode('ascii') for linea in nx.generate_gml(G))
             logger.debug('Guardado correctamente el archivo .gml.gz con la descripción del grafo en la carpeta ' + self.ruta_raiz + 'gml_files/')
         except:
             logger.error('Error al guardar el archivo .gml.gz con la descripción del grafo en la carpeta ' + self.ruta_raiz + 'gml_files/')
@@ -2762,27 +2833,28 @@ def main(self):
             plt.close()
             plt.subplot(111)
             posicion = nx.get_node_attributes(G,'pos')
-            color_map = []
             #for node in G:
-            for nodo, data in G.nodes(data=True, default = 0):
-                color_map.append(data['color_nodo'])
+            color_map = [data['color_nodo'] for nodo, data in G.nodes(data=True)]
             # color1 = nx.get_node_attributes(G,'color_nodo')
             # node_color=color1.values()
             #nx.draw(G, with_labels=True)
             #nx.draw(G, cmap = plt.get_cmap('jet'), with_labels=True, pos=nx.spring_layout(G))
             #nx.draw_networkx_edges(G, pos=nx.spring_layout(G))
             #nx.draw_networkx_nodes(G, pos=nx.spring_layout(G))    
-            nx.draw_kamada_kawai(G, node_size=7, node_color=color_map)
+            #Posiciones kamada_kawai del grafo actual, se pasan explícitamente a nx.draw.
+            pos_kk = nx.kamada_kawai_layout(G)
+            nx.draw(G, pos_kk, node_size=7, node_color=color_map)
     #        nx.draw(G, pos=pos)
         #    plt.show(block=False)                
-            plt.savefig(plt_graph_file, format="JPG", dpi=800, bbox_inches='tight')
+            #Resolución de 200 dpi (con 800 dpi el guardado de la imagen era lo más lento de la representación).
+            plt.savefig(plt_graph_file, format="JPG", dpi=200, bbox_inches='tight')
             plt.close()
             logger.debug('Guardada la representación eléctrica de la red en el archivo ' + str(plt_graph_file))
             
             plt.subplot(111)
             nx.draw(G, posicion, node_size=7, node_color=color_map)
             #nx.draw(G, node_size=7)
-            plt.savefig(plt_graph_file_v2, format="JPG", dpi=800, bbox_inches='tight')
+            plt.savefig(plt_graph_file_v2, format="JPG", dpi=200, bbox_inches='tight')
             plt.close()
             logger.debug('Guardada la representación geográfica de la red en el archivo ' + str(plt_graph_file_v2))
         #    plt.draw()
@@ -2811,15 +2883,6 @@ def main(self):
         except:
             logger.error('Error al generar las imágenes .jpg con la descripción del grafo en ' + plt_graph_file + ' y ' + plt_graph_file_v2)
     
-    print('Graph_data_error = ' + str(graph_data_error))
-    self.update_graph_data_error(graph_data_error)
-    
-    if graph_data_error == 3:
-        logger.critical('CREACIÓN DEL GRAFO ABORTADA. ERRORES INCOMPATIBLES CON UNA CORRECTA DEFINICIÓN.')
-        print('CREACIÓN DEL GRAFO ABORTADA. ERRORES INCOMPATIBLES CON UNA CORRECTA DEFINICIÓN. Graph_data_error = ' + str(graph_data_error))
-        self.update_graph_data_error(graph_data_error)
-        return
-        # return graph_data_error
 
     
     ##############################################################################
@@ -2834,30 +2897,35 @@ def main(self):
     #Identificar los nodos finales de la red, tengan CUPS asociados o no.
     end_nodes_sin_cups = []
     cups_grafo = []   
-    trafos_grafo = []
+    trafos_grafo = set() #Conjunto de trafos del grafo, sin repetir
     if graph_data_error < 3:
         ind_cups_agregado_CT = 0
         if 'cups_agregado_CT' not in locals():
-            cups_agregado_CT = pd.DataFrame(columns=['CUPS', 'TRAFO', 'CUPS_X', 'CUPS_Y'])
+            #Las filas se acumulan en una lista y el DataFrame se crea una sola vez al terminar de recorrer los nodos.
+            filas_cups_agregado_CT = []
+            #Líneas para el archivo cups_repetidos_trafo.txt, se escriben todas juntas al final abriendo el archivo una sola vez.
+            lineas_cups_repetidos = []
             ind_cups_agregado_CT = 1
     
+        #Tipo de cada nodo en un diccionario, para no acceder a los atributos del grafo en cada consulta de los vecinos. La topología ya no cambia.
+        tipo_nodo = nx.get_node_attributes(G, 'Tipo_Nodo')
         for node, data in G.nodes(data=True):
-            if data['TR'] != 'CT' and data['TR'] not in trafos_grafo:
-                trafos_grafo.append(str(data['TR']))
+            if data['TR'] != 'CT':
+                trafos_grafo.add(str(data['TR']))
                     
             if data['Tipo_Nodo'] == 'CUPS' or data['Tipo_Nodo'] == 'CUPS_TR':
                 # cups_grafo += [node]
                 cups_grafo.append(node)
             else:
                 # if G.nodes[node]['Tipo_Nodo'] != 'CT' and G.nodes[node]['Tipo_Nodo'] != 'CT_Virtual':
-                a = list(np.unique(list(G.edges(node))))
-                a.remove(node)
+                #Vecinos del nodo directamente del diccionario de adyacencia del grafo (ya sin repetir los enlaces en paralelo), ordenados igual que con np.unique.
+                a = sorted(vecino for vecino in G.adj[node] if vecino != node)
                 num_cups = 0
                 num_desc = 0
                 num_desc_spl = 0
                 
                 #Hay que considerar el caso en que haya un TR_230 o TR_400 porque se ha identificado un CUP GISS ahí pero realmente no hay nada más conectado. Ejemplo MATADERO 5482
-                if G.nodes[node]['Tipo_Nodo'] == 'CT_Virtual' and len(a) == 1:
+                if data['Tipo_Nodo'] == 'CT_Virtual' and len(a) == 1:
                     end_nodes_sin_cups.append(node)
                 
                 #Los nodos CUP no tienen asignados estos atributos.
@@ -2868,33 +2936,35 @@ def main(self):
                     # G.nodes[node]['Enlaces_orig1'] = 0
                     # G.nodes[node]['Enlaces_iter1'] = 0
                     
+                #El tipo del propio nodo se evalúa una sola vez, y el de cada vecino una sola vez dentro del bucle.
+                es_ct = data['Tipo_Nodo'] == 'CT' or data['Tipo_Nodo'] == 'CT_Virtual'
                 for row in a:
+                    tipo_vecino = tipo_nodo[row]
+                    vecino_cups = tipo_vecino == 'CUPS' or tipo_vecino == 'CUPS_TR'
                     #Para obtener nodos_cups_conectados y nodos_cups_descendientes
-                    if data['Tipo_Nodo'] != 'CT' and data['Tipo_Nodo'] != 'CT_Virtual':
-                        if G.nodes[row]['Tipo_Nodo'] == 'CUPS' or G.nodes[row]['Tipo_Nodo'] == 'CUPS_TR':
+                    if not es_ct:
+                        if vecino_cups:
                             num_cups += 1
                         else:
                             num_desc +=1
                     
-                    #Para splitting_nodes_sin_cups
-                    if G.nodes[row]['Tipo_Nodo'] != 'CUPS' and data['Tipo_Nodo'] != 'CUPS' and G.nodes[row]['Tipo_Nodo'] != 'CUPS_TR' and data['Tipo_Nodo'] != 'CUPS_TR':
+                    #Para splitting_nodes_sin_cups. En esta rama el propio nodo nunca es CUPS ni CUPS_TR.
+                    if not vecino_cups:
                         # G.nodes[node]['Enlaces_orig1'] = G.nodes[node]['Enlaces_orig1'] + 1
                         # G.nodes[node]['Enlaces_iter1'] = G.nodes[node]['Enlaces_iter1'] + 1
                         num_desc_spl += 1
                     
-                    if ind_cups_agregado_CT == 1 and (data['Tipo_Nodo'] == 'CT' or data['Tipo_Nodo'] == 'CT_Virtual'):
+                    if ind_cups_agregado_CT == 1 and es_ct:
                         # if G.nodes[row]['Tipo_Nodo'] == 'CUPS' or G.nodes[row]['Tipo_Nodo'] == 'CUPS_TR':
-                        if G.nodes[row]['Tipo_Nodo'] == 'CUPS_TR':
+                        if tipo_vecino == 'CUPS_TR':
                             #Se han visto dos CUPS para una misma salida del trafo, ambos con el mismo ID_CT pero uno era TRAFGISS03733T12 y otro TRAFGISS09615T12 (TORRE, 3733)
                             if row.find(str(self.id_ct)) >= 0:
-                                cups_agregado_CT = cups_agregado_CT.append({'CUPS': str(row), 'TRAFO': G.nodes[row]['TR'], 'CUPS_X': G.nodes[row]['pos'][0], 'CUPS_Y': G.nodes[row]['pos'][1]}, ignore_index=True)
+                                filas_cups_agregado_CT.append({'CUPS': str(row), 'TRAFO': G.nodes[row]['TR'], 'CUPS_X': G.nodes[row]['pos'][0], 'CUPS_Y': G.nodes[row]['pos'][1]})
                             else:
-                                f123 = open(self.ruta_raiz + "cups_repetidos_trafo.txt", 'a')
-                                f123.write(str(self.Nombre_CT) + ',' + str(self.id_ct) + ',' + str(row) + '\n')
+                                lineas_cups_repetidos.append(str(self.Nombre_CT) + ',' + str(self.id_ct) + ',' + str(row) + '\n')
                                 
-                                cups_agregado_CT = cups_agregado_CT.append({'CUPS': str(row), 'TRAFO': G.nodes[row]['TR'], 'CUPS_X': G.nodes[row]['pos'][0], 'CUPS_Y': G.nodes[row]['pos'][1]}, ignore_index=True)
+                                filas_cups_agregado_CT.append({'CUPS': str(row), 'TRAFO': G.nodes[row]['TR'], 'CUPS_X': G.nodes[row]['pos'][0], 'CUPS_Y': G.nodes[row]['pos'][1]})
                                 print('Error. Encontrado el CUPS ' + str(row) + ' en un trafo y NO se corresponde con el ID_CT: ' + str(self.id_ct) + '. CUPS ignorado.')
-                                print(cups_agregado_CT)
                                 # import time
                                 # time.sleep(5)
                                 logger.error('Error. Encontrado el CUPS ' + str(row) + ' en un trafo y NO se corresponde con el ID_CT: ' + str(self.id_ct) + '. CUPS ignorado.')
@@ -2917,23 +2987,118 @@ def main(self):
                     
                 # if data['Tipo_Nodo'] == 'CT' and data['Tipo_Nodo'] == 'CT_Virtual':
         
-        #Se eliminan duplicados
-        nodos_cups_conectados = list(dict.fromkeys(nodos_cups_conectados))
-        nodos_cups_descendientes = list(dict.fromkeys(nodos_cups_descendientes))
-        splitting_nodes_sin_cups = list(dict.fromkeys(splitting_nodes_sin_cups))
-        end_nodes_sin_cups = list(dict.fromkeys(end_nodes_sin_cups))
+        #DataFrame con los CUPS de la cabecera del CT, creado una sola vez con todas las filas encontradas.
+        if ind_cups_agregado_CT == 1:
+            cups_agregado_CT = pd.DataFrame(filas_cups_agregado_CT, columns=['CUPS', 'TRAFO', 'CUPS_X', 'CUPS_Y'])
+            del filas_cups_agregado_CT
+            if len(lineas_cups_repetidos) > 0:
+                with open(self.ruta_raiz + "cups_repetidos_trafo.txt", 'a') as f123:
+                    f123.writelines(lineas_cups_repetidos)
+            del lineas_cups_repetidos
+        
+        #No es necesario eliminar duplicados: cada nodo se recorre una sola vez y se añade como mucho una vez a cada lista.
                
     
-        derivation_nodes = [x for x,y in G.nodes(data=True) if y['Tipo_Nodo']=='DERIVACION']
+        derivation_nodes = [x for x,y in tipo_nodo.items() if y=='DERIVACION']
             
         logger.debug('Encontrados ' + str(len(splitting_nodes_sin_cups)) + ' nodos con bifurcaciones, de los cuales ' + str(len(derivation_nodes)) + ' se consideran derivación; y ' + str(len(end_nodes_sin_cups)) + ' nodos terminación de línea.')
+        
+        #Nodo al que está conectado cada CUPS, se reutiliza en todas las horas al añadir las curvas de carga.
+        self.cups_nodo_grafo = self.indexa_cups_grafo(G)
+        
+        #Método para obtener los resultados requeridos según CT, TR y nivel de tensión (05-2021)
+        #Nodos en los que se obtienen resultados: el CT, sus vecinos y los vecinos de estos (salvo CUPS_TR). Se obtienen de la lista de adyacencia una sola vez, la topología no cambia entre horas.
+        nodo_ct = str(self.id_ct)
+        lista_temp = sorted(vecino for vecino in G.adj[nodo_ct] if vecino != nodo_ct)
+        lista_nodos_resultados = [nodo_ct] + lista_temp
+        for i in lista_temp:
+            lista_nodos_resultados.extend(j for j in sorted(G.adj[i]) if j != i and j != nodo_ct and tipo_nodo[j] != 'CUPS_TR')
+        del lista_temp
+        
+        #Se crea una lista con todos los nodos que pueden ser terminación de línea y/o tener CUPs conectados. No cambia entre horas, se crea una sola vez.
+        end_nodes_cups = end_nodes_sin_cups + nodos_cups_conectados
+        end_nodes_cups = list(dict.fromkeys(end_nodes_cups))
+        #Posible caso del id_ct en la lista end_nodes. Hay que eliminarlo. Caso donde solo salga una línea del CT
+        if self.id_ct in end_nodes_cups:
+            end_nodes_cups.remove(self.id_ct)
+        
+        #Se elimina el id_ct de splitting nodes para no iterar sobre él.
+        #No tendría que ser necesario eliminarlo
+        if self.id_ct in splitting_nodes_sin_cups:
+            splitting_nodes_sin_cups.remove(self.id_ct)
+        
+        #Diccionarios de atributos de los nodos CUPS, en el orden del grafo. Los valores de potencia se actualizan en cada hora sobre estos mismos diccionarios.
+        datos_cups_grafo = [data for nodo, data in G.nodes(data=True) if data['Tipo_Nodo'] == 'CUPS']
+        
+        #Texto a buscar en CODIGO_LVC para localizar la medida del CT de cada nodo de resultados. None para el CT, que suma todas las medidas.
+        #Los nodos de salida de tensión de trafo con una tensión distinta de 230 o 400 no tienen clave y su medida se queda en 0.
+        clave_medida_nodo = {}
+        for row in lista_nodos_resultados:
+            if str(row).find('_230') >= 0 or str(row).find('_400') >= 0:
+                if int(G.nodes[row]['QBT_TENSION']) == 230:
+                    clave_medida_nodo[row] = str(G.nodes[row]['TR'].replace('R','') + '1')
+                elif int(G.nodes[row]['QBT_TENSION']) == 400:
+                    clave_medida_nodo[row] = str(G.nodes[row]['TR'].replace('R','') + '2')
+            elif G.nodes[str(row)]['TR'] == 'CT':
+                clave_medida_nodo[row] = None
+            else:
+                clave_medida_nodo[row] = str(row).replace('_TR','T')
 
     
     
-    #ELIMINAR
-    print(cups_agregado_CT)
-    # return
-    # time.sleep(3)
+    ##############################################################################
+    ## Conexión con la BBDD SQL.
+    ## Se abre una única conexión para todos los días y horas, en lugar de reconectar en cada hora.
+    ##############################################################################
+    #Se define el nombre de dos de las tablas SQL, las que contendrán todos los datos del grafo
+    tabla_ct_nodos = "OUTPUT_" + str(self.id_ct) + "_" + str(self.Nombre_CT).replace(' ','_') + "_NODOS"
+    tabla_ct_trazas = "OUTPUT_" + str(self.id_ct) + "_" + str(self.Nombre_CT).replace(' ','_') + "_TRAZAS" 
+    
+    if (self.save_ddbb == 0) or (self.save_ddbb == 1) or (self.save_ddbb == 2):
+        try:
+            conn = pyodbc.connect('Driver={SQL Server};'
+                                  'Server=' + ip_server + ';'
+                                  'Database=' + db_server + ';'
+                                  'UID=' + usr_server + ';'
+                                  'PWD=' + pwd_server)
+                                 #'Trusted_Connection=yes;')
+            cursor = conn.cursor()
+            #Las filas se insertan por lotes con executemany, enviando todos los parámetros de una vez.
+            cursor.fast_executemany = True
+        except:
+            logger.error('Error de conexión con la BBDD. Ejecución abortada.')
+            raise
+        
+        #Se comprueba una sola vez qué tablas existen en la BBDD, las tablas no cambian durante la ejecución.
+        SQL_Query = pd.read_sql_query("SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE table_name IN ('" + str(self.tabla_cts_general) + "', '" + str(tabla_ct_nodos) + "', '" + str(tabla_ct_trazas) + "')", conn)
+        #La comparación de nombres en SQL Server no distingue mayúsculas, se hace igual aquí.
+        tablas_existentes = set(SQL_Query['TABLE_NAME'].str.lower())
+        existe_tabla_general = str(self.tabla_cts_general).lower() in tablas_existentes
+        existe_tabla_nodos = str(tabla_ct_nodos).lower() in tablas_existentes
+        existe_tabla_trazas = str(tabla_ct_trazas).lower() in tablas_existentes
+        del SQL_Query, tablas_existentes
+    
+    #Instrucciones INSERT parametrizadas de las tres tablas. Las filas de cada día se acumulan en listas y se insertan juntas al terminar el día.
+    instruccion_insert_general = "INSERT INTO " + self.tabla_cts_general + " (ID_Caso, ID_CT, CT_NOMBRE, ID_NODO, CCH_Data_Error, Fecha, Hora, P_R_CT_KW, P_S_CT_KW, P_T_CT_KW, AE_CT_MEDIDO_KW, AS_CT_MEDIDO_KW, AE_R_LINEAS_KW, AE_S_LINEAS_KW, AE_T_LINEAS_KW, AS_R_LINEAS_KW, AS_S_LINEAS_KW, AS_T_LINEAS_KW) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
+    instruccion_insert_nodos = "INSERT INTO " + tabla_ct_nodos + " (ID_Caso, ID_NODO_LBT_ID, Fecha, Hora, P_R_KW, P_S_KW, P_T_KW) VALUES (?, ?, ?, ?, ?, ?, ?);"
+    instruccion_insert_trazas = "INSERT INTO " + tabla_ct_trazas + " (ID_Caso, ID_NODO_LBT_ID_INI, ID_NODO_LBT_ID_FIN, ID_TRAZA, Fecha, Hora, P_R_LINEA_KW, P_S_LINEA_KW, P_T_LINEA_KW) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);"
+    
+    def inserta_filas(instruccion_insert, filas):
+        #Inserta todas las filas con una única llamada executemany y un único commit.
+        #Si falla el lote se deshace y se insertan las filas una a una, para guardar las correctas y registrar en el log las erróneas como antes.
+        if len(filas) == 0:
+            return
+        try:
+            cursor.executemany(instruccion_insert, filas)
+            conn.commit()
+        except:
+            conn.rollback()
+            for fila in filas:
+                try:
+                    cursor.execute(instruccion_insert, fila)
+                except:
+                    logger.error('Error al guardar en la BBDD. ' + instruccion_insert + ' ' + str(fila))
+            conn.commit()
     
     
     ##############################################################################
@@ -2941,20 +3106,10 @@ def main(self):
     ##############################################################################
     #Adaptación de la fecha para crear un ID para el SQL
     fecha_datetime = self.fecha_ini
-    fecha = int(str(fecha_datetime.strftime("%Y")) + str(fecha_datetime.strftime("%m")) + str(fecha_datetime.strftime("%d")))
+    fecha = fecha_datetime.year*10000 + fecha_datetime.month*100 + fecha_datetime.day
     
-    #Se leen las curvas de carga del mes correspondiente al primer día. Después se actualizará si se cambia de mes.
-    df_cch, df_cch_AE_giss, df_cch_AS_giss = self.get_cch_cups(fecha, self.ruta_cch, cups_grafo)
-    
-
-    while fecha_datetime < self.fecha_fin + datetime.timedelta(days=1):
-        fecha = int(str(fecha_datetime.strftime("%Y")) + str(fecha_datetime.strftime("%m")) + str(fecha_datetime.strftime("%d")))
-        
-        #Se comprueba si al pasar al día siguiente se cambia de mes y se extraen los datos de todo ese mes si es necesario.
-        if fecha_datetime > self.fecha_ini and (fecha_datetime - datetime.timedelta(days=1)).month != fecha_datetime.month:
-            del df_cch, df_cch_AE_giss, df_cch_AS_giss
-            df_cch, df_cch_AE_giss, df_cch_AS_giss = self.get_cch_cups(fecha, self.ruta_cch, cups_grafo)
-
+    def separa_cch_dias(df_cch):
+        #Filtra las curvas de carga del mes leído y las separa por día. Se ejecuta una sola vez por mes, cada día solo consulta su DF en los diccionarios.
         ##############################################################################  
         ## Filtrado de las curvas de carga.
         ## Se extraen valores de potencia entregada a los clientes. Magnitud 7, AE
@@ -2962,48 +3117,41 @@ def main(self):
         ## En ambos casos se separa según data_validation (validez del tipo de dato.)
         ##############################################################################
         #Potencia entregada. AE
+        #Se filtra una sola vez la magnitud y después se separa según data_validation. df_cch ya tiene solo las columnas necesarias, no hace falta volver a seleccionarlas.
+        df_cch_7 = df_cch[df_cch['MAGNITUD'] == 7]
         #DF con valores de potencia entregada a los clientes (7) con data_validation = A (valores válidos)
-        df_AE_7A = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 7) & (df_cch['DATA_VALIDATION'] == 'A')]
-        df_AE = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 7) & (df_cch['DATA_VALIDATION'] == 'A')]
+        df_AE_7A = df_cch_7[df_cch_7['DATA_VALIDATION'] == 'A']
         #DF con valores de potencia entregada a los clientes (7) con data_validation = P (valores parcialmente válidos)
-        df_AE_7P = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 7) & (df_cch['DATA_VALIDATION'] == 'P')]
+        df_AE_7P = df_cch_7[df_cch_7['DATA_VALIDATION'] == 'P']
         # df_AE = df_AE.append(df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 7) & (df_cch['DATA_VALIDATION'] == 'P')], ignore_index=True).reset_index(drop=True)
-        #Se añade al DF original.
-        df_AE = df_AE.append(df_AE_7P, ignore_index=True).reset_index(drop=True)
         #DF con valores de potencia entregada a los clientes (7) con data_validation = N (valores inválidos)
         #DECIDIR SI CONSIDERARLOS O NO.
-        df_AE_7N = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 7) & (df_cch['DATA_VALIDATION'] == 'N')]
-        #Se añade al DF original.
-        df_AE = df_AE.append(df_AE_7N, ignore_index=True).reset_index(drop=True)
+        df_AE_7N = df_cch_7[df_cch_7['DATA_VALIDATION'] == 'N']
+        #Se unen los tres DF en uno solo, con una única concatenación.
+        df_AE = pd.concat([df_AE_7A, df_AE_7P, df_AE_7N], ignore_index=True)
         
         logger.debug('Registros AE clientes encontrados: 7A=' + str(len(df_AE_7A)) + ', 7P=' + str(len(df_AE_7P)) + ', 7N=' +str(len(df_AE_7N)) + '. Duplicados encontrados: ' + str(len(df_AE)-len(df_AE.drop_duplicates())))
         #Se eliminan duplicados
         df_AE = df_AE.drop_duplicates(keep = 'first').reset_index(drop=True)
         
-        df_AE_fecha = df_AE[df_AE['FECHA'] == fecha].reset_index(drop=True)
-        
         
         #Potencia suministrada (autoconsumo). AS
+        df_cch_8 = df_cch[df_cch['MAGNITUD'] == 8]
         #DF con valores de potencia entregada a los clientes (7) con data_validation = A (valores válidos)
-        df_AS_8A = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 8) & (df_cch['DATA_VALIDATION'] == 'A')]
-        df_AS = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 8) & (df_cch['DATA_VALIDATION'] == 'A')]
+        df_AS_8A = df_cch_8[df_cch_8['DATA_VALIDATION'] == 'A']
         #DF con valores de potencia entregada a los clientes (7) con data_validation = P (valores parcialmente válidos)
-        df_AS_8P = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 8) & (df_cch['DATA_VALIDATION'] == 'P')]
+        df_AS_8P = df_cch_8[df_cch_8['DATA_VALIDATION'] == 'P']
         # df_AS = df_AS.append(df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 8) & (df_cch['DATA_VALIDATION'] == 'P')], ignore_index=True).reset_index(drop=True)
-        #Se añade al DF original.
-        df_AS = df_AS.append(df_AS_8P, ignore_index=True).reset_index(drop=True)
         #DF con valores de potencia entregada a los clientes (7) con data_validation = N (valores inválidos)
         #No se van a considerar estos valores.
-        df_AS_8N = df_cch[['CUPS', 'FECHA', 'MAGNITUD', 'DATA_VALIDATION', 'VALOR_H01', 'VALOR_H02', 'VALOR_H03', 'VALOR_H04', 'VALOR_H05', 'VALOR_H06', 'VALOR_H07', 'VALOR_H08', 'VALOR_H09', 'VALOR_H10', 'VALOR_H11', 'VALOR_H12', 'VALOR_H13', 'VALOR_H14', 'VALOR_H15', 'VALOR_H16', 'VALOR_H17', 'VALOR_H18', 'VALOR_H19', 'VALOR_H20', 'VALOR_H21', 'VALOR_H22', 'VALOR_H23', 'VALOR_H24', 'VALOR_H25']][(df_cch['MAGNITUD'] == 8) & (df_cch['DATA_VALIDATION'] == 'N')]
-        #Se añade al DF original.
-        df_AS = df_AS.append(df_AS_8N, ignore_index=True).reset_index(drop=True)
+        df_AS_8N = df_cch_8[df_cch_8['DATA_VALIDATION'] == 'N']
+        #Se unen los tres DF en uno solo, con una única concatenación.
+        df_AS = pd.concat([df_AS_8A, df_AS_8P, df_AS_8N], ignore_index=True)
         
         logger.debug('Registros AS clientes encontrados: 8A=' + str(len(df_AS_8A)) + ', 8P=' + str(len(df_AS_8P)) + ', 8N=' +str(len(df_AS_8N)) + '. Duplicados encontrados: ' + str(len(df_AS)-len(df_AS.drop_duplicates())))
         #Se eliminan duplicados
         df_AS = df_AS.drop_duplicates(keep = 'first').reset_index(drop=True)
         
-        df_AS_fecha = df_AS[df_AS['FECHA'] == fecha].reset_index(drop=True)
-        
         
         ##TEMPORAL
         #Se guarda la info en dos archivos txt
@@ -3013,7 +3161,126 @@ def main(self):
         # f_temp = open ("F:\GTEA\DEPERTEC\Grafo\AS_DEPERTEC.txt", "a")
         # f_temp.write(str(self.id_ct) + ";" + str(self.Nombre_CT) + ';' + str(fecha_datetime.year) + ';' + str(fecha_datetime.month) + ';' + str(len(df_AS_8A)) + ';' + str(len(df_AS_8P)) + ';' + str(len(df_AS_8N)) + ';' + str(len(df_cch_AS_giss)) + "\n")
         # f_temp.close()
-        del df_AE_7A, df_AE_7P, df_AE_7N, df_AS_8A, df_AS_8P, df_AS_8N
+        del df_cch_7, df_cch_8, df_AE_7A, df_AE_7P, df_AE_7N, df_AS_8A, df_AS_8P, df_AS_8N
+        
+        #DF de cada día del mes indexados por la fecha. Se devuelven también DF vacíos con las mismas columnas para los días sin curvas de carga.
+        df_AE_dias = {fecha_dia: df_dia.reset_index(drop=True) for fecha_dia, df_dia in df_AE.groupby('FECHA')}
+        df_AS_dias = {fecha_dia: df_dia.reset_index(drop=True) for fecha_dia, df_dia in df_AS.groupby('FECHA')}
+        return df_AE_dias, df_AS_dias, df_AE.iloc[0:0], df_AS.iloc[0:0]
+    
+    def agrega_perdidas_enlaces(G):
+        #Suma las pérdidas de los enlaces en el orden [AE_R, Q_R, AE_S, Q_S, AE_T, Q_T, AS_R, AS_S, AS_T].
+        #Se acumulan a la vez por (TR, QBT_TENSION), por TR y en total, recorriendo los enlaces una sola vez y en el mismo orden que antes, por lo que las sumas son idénticas.
+        perdidas_tr_tension = {}
+        perdidas_tr = {}
+        perdidas_total = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+        for nodo1, nodo2, keys, data in G.edges(data = True, default = 0, keys=True):
+            clave_tr_tension = (data['TR'], data['QBT_TENSION'])
+            if clave_tr_tension not in perdidas_tr_tension:
+                perdidas_tr_tension[clave_tr_tension] = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+            if data['TR'] not in perdidas_tr:
+                perdidas_tr[data['TR']] = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+            #Hay que considerar que desde la última arqueta hasta el CUPS solo está definida la P y Q de la fase correspondiente, se comprueba si existe el atributo en lugar de capturar la excepción.
+            P_R_Linea = data.get('P_R_Linea')
+            P_S_Linea = data.get('P_S_Linea')
+            P_T_Linea = data.get('P_T_Linea')
+            for acumulado in (perdidas_tr_tension[clave_tr_tension], perdidas_tr[data['TR']], perdidas_total):
+                if P_R_Linea is not None:
+                    if P_R_Linea >= 0:
+                        acumulado[0] += P_R_Linea
+                        acumulado[1] += data.get('Q_R_Linea', 0)
+                    else:
+                        acumulado[6] += abs(P_R_Linea)
+                if P_S_Linea is not None:
+                    if P_S_Linea >= 0:
+                        acumulado[2] += P_S_Linea
+                        acumulado[3] += data.get('Q_S_Linea', 0)
+                    else:
+                        acumulado[7] += abs(P_S_Linea)
+                if P_T_Linea is not None:
+                    if P_T_Linea >= 0:
+                        acumulado[4] += P_T_Linea
+                        acumulado[5] += data.get('Q_T_Linea', 0)
+                    else:
+                        acumulado[8] += abs(P_T_Linea)
+        return perdidas_tr_tension, perdidas_tr, perdidas_total
+    
+    #Pérdidas nulas para los nodos sin enlaces de su TR y nivel de tensión.
+    perdidas_vacias = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+    
+    def agrega_cargas_cups():
+        #Suma las potencias de los CUPS en el orden [P_R, Q_R, P_S, Q_S, P_T, Q_T], por (TR, QBT_TENSION), por TR y en total.
+        #Se recorren los CUPS una sola vez y en el mismo orden que los nodos del grafo, por lo que las sumas son idénticas a recorrer el grafo para cada nodo de resultados.
+        cargas_tr_tension = {}
+        cargas_tr = {}
+        cargas_total = [0, 0, 0, 0, 0, 0]
+        for data in datos_cups_grafo:
+            clave_tr_tension = (data['TR'], data['QBT_TENSION'])
+            if clave_tr_tension not in cargas_tr_tension:
+                cargas_tr_tension[clave_tr_tension] = [0, 0, 0, 0, 0, 0]
+            if data['TR'] not in cargas_tr:
+                cargas_tr[data['TR']] = [0, 0, 0, 0, 0, 0]
+            for acumulado in (cargas_tr_tension[clave_tr_tension], cargas_tr[data['TR']], cargas_total):
+                acumulado[0] += data['P_R_0']
+                acumulado[1] += data['Q_R_0']
+                acumulado[2] += data['P_S_0']
+                acumulado[3] += data['Q_S_0']
+                acumulado[4] += data['P_T_0']
+                acumulado[5] += data['Q_T_0']
+        return cargas_tr_tension, cargas_tr, cargas_total
+    
+    #Cargas nulas para los nodos sin CUPS de su TR y nivel de tensión.
+    cargas_vacias = [0, 0, 0, 0, 0, 0]
+    
+    def medida_nodos(df_medida):
+        #Suma por hora de las medidas del CT asociadas a cada nodo de resultados. Se filtra CODIGO_LVC una sola vez por día y por clave, no en cada hora y nodo.
+        sumas_clave = {}
+        medidas = {}
+        horas = list(diccionario_horas.keys())
+        for nodo, clave in clave_medida_nodo.items():
+            if clave not in sumas_clave:
+                #Filas de la medida asociadas a la clave. Si no se pueden filtrar (falta CODIGO_LVC o no es texto) el nodo se queda sin medida.
+                try:
+                    if clave is None:
+                        filas_clave = df_medida
+                    else:
+                        #Búsqueda de subcadena sin expresiones regulares, igual que el filtro del CT.
+                        filas_clave = df_medida.loc[df_medida['CODIGO_LVC'].str.contains(clave, regex=False, na=False)]
+                except (KeyError, AttributeError):
+                    filas_clave = None
+                if filas_clave is None:
+                    sumas_clave[clave] = None
+                else:
+                    #Cada hora se suma por separado: una columna horaria ausente o con valores no numéricos solo deja a 0 esa hora.
+                    sumas_clave[clave] = filas_clave.reindex(columns=horas, fill_value=0).apply(pd.to_numeric, errors='coerce').sum()
+            #Si no se ha podido obtener la medida el nodo no se incluye y su valor se queda en 0.
+            if sumas_clave[clave] is not None:
+                medidas[nodo] = sumas_clave[clave]
+        return medidas
+    
+    #Se leen las curvas de carga del mes correspondiente al primer día. Después se actualizará si se cambia de mes.
+    df_cch, df_cch_AE_giss, df_cch_AS_giss = self.get_cch_cups(fecha, self.ruta_cch, cups_grafo)
+    df_AE_dias, df_AS_dias, df_AE_vacio, df_AS_vacio = separa_cch_dias(df_cch)
+    
+
+    #Fecha límite del bucle diario (se incluye el día final)
+    fecha_limite = self.fecha_fin + datetime.timedelta(days=1)
+    while fecha_datetime < fecha_limite:
+        fecha = fecha_datetime.year*10000 + fecha_datetime.month*100 + fecha_datetime.day
+        #Filas a guardar en la BBDD durante el día, para cada una de las tablas.
+        filas_general = []
+        filas_nodos = []
+        filas_trazas = []
+        
+        #Se comprueba si al pasar al día siguiente se cambia de mes y se extraen los datos de todo ese mes si es necesario.
+        if fecha_datetime > self.fecha_ini and (fecha_datetime - datetime.timedelta(days=1)).month != fecha_datetime.month:
+            del df_cch, df_cch_AE_giss, df_cch_AS_giss
+            df_cch, df_cch_AE_giss, df_cch_AS_giss = self.get_cch_cups(fecha, self.ruta_cch, cups_grafo)
+            df_AE_dias, df_AS_dias, df_AE_vacio, df_AS_vacio = separa_cch_dias(df_cch)
+
+        #Curvas de carga del día, ya filtradas y separadas al leer el mes.
+        df_AE_fecha = df_AE_dias.get(fecha, df_AE_vacio)
+        df_AS_fecha = df_AS_dias.get(fecha, df_AS_vacio)
         # fecha_datetime = fecha_datetime + datetime.timedelta(days=1)
         # continue
         
@@ -3029,25 +3296,24 @@ def main(self):
             
             logger.debug('Encontrados ' + str(len(CUPS_unicos)) + ' CUPS únicos en los archivos de curvas de carga de clientes.')
             
+            #Medidas del CT para la fecha. No dependen de la hora, se filtran una sola vez por día.
+            #Importante el .zfill(5), es necesario que el número tenga los 0 delante necesarios para no ser confundido con otro CT que contenga número similares. (Ej. 00832 y 08323)
+            AE_medida_ct = df_cch_AE_giss.loc[df_cch_AE_giss['CODIGO_LVC'].str.contains(str(self.id_ct).zfill(5), regex=False, na=False) & (df_cch_AE_giss['FECHA'] == fecha)].reset_index(drop=True)
+            AS_medida_ct = df_cch_AS_giss.loc[df_cch_AS_giss['CODIGO_LVC'].str.contains(str(self.id_ct).zfill(5), regex=False, na=False) & (df_cch_AS_giss['FECHA'] == fecha)].reset_index(drop=True)
+            #Medidas del CT de cada nodo de resultados, sumadas para todas las horas del día.
+            AE_medida_nodo = medida_nodos(AE_medida_ct)
+            AS_medida_nodo = medida_nodos(AS_medida_ct)
+            
+            #Curvas de carga agrupadas por CUPS para todas las horas del día. Se agrupan una sola vez por día y no en cada hora.
+            cch_AE_cups = self.agrupa_cch_cups(df_AE_fecha, list(diccionario_horas.keys()))
+            cch_AS_cups = self.agrupa_cch_cups(df_AS_fecha, list(diccionario_horas.keys()))
+            
             #Se recorre el diccionario de horas para aplicar sobre el grafo los valores de potencia de cada hora por separado y hacer los cálculos.
             for colum_hora in diccionario_horas.keys():
                 # colum_hora = clave     
                 
                 #Función para agregar al grafo las curvas de carga de leídas.
-                G = self.add_cch_grafo(G, colum_hora, df_AE_fecha, df_AS_fecha)#, cups_agregado_CT, self.id_ct)                
-                
-                #Se crea una lista con todos los nodos que pueden ser terminación de línea y/o tener CUPs conectados
-                end_nodes_cups = []
-                end_nodes_cups = end_nodes_sin_cups + nodos_cups_conectados
-                end_nodes_cups = list(dict.fromkeys(end_nodes_cups))
-                #Posible caso del id_ct en la lista end_nodes. Hay que eliminarlo. Caso donde solo salga una línea del CT
-                if self.id_ct in end_nodes_cups:
-                    end_nodes_cups.remove(self.id_ct)
-                
-                #Se elimina el id_ct de splitting nodes para no iterar sobre él.
-                #No tendría que ser necesario eliminarlo
-                if self.id_ct in splitting_nodes_sin_cups:
-                    splitting_nodes_sin_cups.remove(self.id_ct)
+                G = self.add_cch_grafo(G, colum_hora, cch_AE_cups, cch_AS_cups)#, cups_agregado_CT, self.id_ct)                
                 
                 #Parámetro para evaluar si el resultado numérico obtenido es adecuado.
                 CCH_Data_Error = 3
@@ -3061,50 +3327,16 @@ def main(self):
                     break
                 
                 
-                ##############################################################################
-                ## Conexión con la BBDD SQL.
-                ##############################################################################
-                #Se define el nombre de dos de las tablas SQL, las que contendrán todos los datos del grafo
-                tabla_ct_nodos = "OUTPUT_" + str(self.id_ct) + "_" + str(self.Nombre_CT).replace(' ','_') + "_NODOS"
-                tabla_ct_trazas = "OUTPUT_" + str(self.id_ct) + "_" + str(self.Nombre_CT).replace(' ','_') + "_TRAZAS" 
-                
-                if (self.save_ddbb == 0) or (self.save_ddbb == 1) or (self.save_ddbb == 2):
-                    try:
-                        conn = pyodbc.connect('Driver={SQL Server};'
-                                              'Server=' + ip_server + ';'
-                                              'Database=' + db_server + ';'
-                                              'UID=' + usr_server + ';'
-                                              'PWD=' + pwd_server)
-                                             #'Trusted_Connection=yes;')
-                        cursor = conn.cursor()
-                    except:
-                        logger.error('Error de conexión con la BBDD. Ejecución abortada.')
-                        raise
-                
-                
                 ##############################################################################
                 ## Obtención de los parámetros finales para el escenario definido y guardado de datos.
                 ##############################################################################
                 
                 logger.debug('Cálculo realizado para: ' + self.Nombre_CT + ' ' + str(fecha) + ' ' + colum_hora)
                 
-                #Importante el .zfill(5), es necesario que el número tenga los 0 delante necesarios para no ser confundido con otro CT que contenga número similares. (Ej. 00832 y 08323)
-                AE_medida_ct = df_cch_AE_giss.loc[(df_cch_AE_giss['CODIGO_LVC'].str.find(str(self.id_ct).zfill(5)) >= 0) & (df_cch_AE_giss['FECHA'] == fecha)].reset_index(drop=True)
-                AS_medida_ct = df_cch_AS_giss.loc[(df_cch_AS_giss['CODIGO_LVC'].str.find(str(self.id_ct).zfill(5)) >= 0) & (df_cch_AS_giss['FECHA'] == fecha)].reset_index(drop=True)
-                
-                #Método para obtener los resultados requeridos según CT, TR y nivel de tensión (05-2021)
-                lista_nodos_resultados = [str(self.id_ct)]
-                lista_temp = list(np.unique(list(G.edges(str(self.id_ct)))))
-                lista_temp.remove(str(self.id_ct))
-                lista_nodos_resultados = lista_nodos_resultados + lista_temp
-                for i in lista_temp:
-                    lista_temp2 = list(np.unique(list(G.edges(i))))
-                    lista_temp2.remove(i)
-                    lista_temp2.remove(str(self.id_ct))
-                    for j in lista_temp2:
-                        if G.nodes[j]['Tipo_Nodo'] != 'CUPS_TR':
-                            lista_nodos_resultados.append(j)
-                del lista_temp, lista_temp2
+                #Pérdidas de todos los enlaces sumadas en una sola pasada por el grafo: por TR y QBT_TENSION, por TR y total.
+                perdidas_tr_tension, perdidas_tr, perdidas_total = agrega_perdidas_enlaces(G)
+                #Cargas de los CUPS sumadas en una sola pasada: por TR y QBT_TENSION, por TR y total.
+                cargas_tr_tension, cargas_tr, cargas_total = agrega_cargas_cups()
                 
                 #Se recorren los nodos de la lista hallada para ir calculando las cargas conectadas, pérdidas y el medido en el CT aguas abajo de cada uno de ellos.
                 for row in lista_nodos_resultados:
@@ -3135,212 +3367,43 @@ def main(self):
                     P_T_CT_tot = G.nodes[str(row)]['P_T_0']
                     Q_T_CT_tot = G.nodes[str(row)]['Q_T_0']
                     
-                    #Pérdidas medidas en el CT/trafo/nivel de tensión
+                    #Pérdidas medidas en el CT/trafo/nivel de tensión. Ya están sumadas por hora para cada nodo al inicio del día.
                     AE_cch_ct = 0
                     AS_cch_ct = 0
+                    if row in AE_medida_nodo:
+                        AE_cch_ct = AE_medida_nodo[row][colum_hora]
+                    if row in AS_medida_nodo:
+                        AS_cch_ct = AS_medida_nodo[row][colum_hora]
             
                     #Si es un nodo de salida de tensión de trafo
                     if str(row).find('_230') >= 0 or str(row).find('_400') >= 0:
-                        #Se localiza el valor medido en el CT.
-                        if int(G.nodes[row]['QBT_TENSION']) == 230:
-                            try:
-                                AE_cch_ct = AE_medida_ct.loc[AE_medida_ct.CODIGO_LVC.str.find(str(G.nodes[row]['TR'].replace('R','') + '1')) >= 0][colum_hora].sum()
-                                if AE_cch_ct > 0:
-                                    aa = 'Todo ok'
-                                    del aa
-                            except:
-                                AE_cch_ct = 0
-                            try:
-                                AS_cch_ct = AS_medida_ct.loc[AS_medida_ct.CODIGO_LVC.str.find(str(G.nodes[row]['TR'].replace('R','') + '1')) >= 0][colum_hora].sum()
-                                if AS_cch_ct > 0:
-                                    aa = 'Todo ok'
-                                    del aa
-                            except:
-                                AS_cch_ct = 0
-                                
-                            # codigo_LVC = AE_medida_ct.loc[AE_medida_ct.CODIGO_LVC.str.find(str(G.nodes[row]['TR'].replace('R','') + '1')) >= 0]['CODIGO_LVC'][0]
-                        elif int(G.nodes[row]['QBT_TENSION']) == 400:
-                            try:
-                                AE_cch_ct = AE_medida_ct.loc[AE_medida_ct.CODIGO_LVC.str.find(str(G.nodes[row]['TR'].replace('R','') + '2')) >= 0][colum_hora].sum()
-                                if AE_cch_ct > 0:
-                                    aa = 'Todo ok'
-                                    del aa
-                            except:
-                                AE_cch_ct = 0
-                            try:
-                                AS_cch_ct = AS_medida_ct.loc[AS_medida_ct.CODIGO_LVC.str.find(str(G.nodes[row]['TR'].replace('R','') + '2')) >= 0][colum_hora].sum()
-                                if AS_cch_ct > 0:
-                                    aa = 'Todo ok'
-                                    del aa
-                            except:
-                                AS_cch_ct = 0
-                                
-                            # codigo_LVC = AE_medida_ct.loc[AE_medida_ct.CODIGO_LVC.str.find(str(G.nodes[row]['TR'].replace('R','') + '1')) >= 0]['CODIGO_LVC'][0]
-                            
-                        
-                        
-                        #Para obtener todas las pérdidas asociadas:
-                        for nodo1, nodo2, keys, data in G.edges(data = True, default = 0, keys=True): 
-                            #Se filtran para considerar solo las trazas con TR y QBT_TENSION oportuno
-                            if data['TR'] == G.nodes[row]['TR'] and data['QBT_TENSION'] == G.nodes[row]['QBT_TENSION']:
-                                #Se suman las pérdidas de todos los vanos asociados
-                                #Hay que considerar que desde la última arqueta hasta el CUPS solo está definida la P y Q de la fase correspondiente, sin los try da error.
-                                try:
-                                    if G.edges[nodo1, nodo2, keys]['P_R_Linea'] >= 0:
-                                        AE_R_vanos_tot += G.edges[nodo1, nodo2, keys]['P_R_Linea']
-                                        Q_R_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_R_Linea']
-                                    else:
-                                        AS_R_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_R_Linea'])
-                                except:
-                                    pass
-                                try:
-                                    if G.edges[nodo1, nodo2, keys]['P_S_Linea'] >= 0:
-                                        AE_S_vanos_tot += G.edges[nodo1, nodo2, keys]['P_S_Linea']
-                                        Q_S_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_S_Linea']
-                                    else:
-                                        AS_S_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_S_Linea'])
-                                except:
-                                    pass
-                                try:
-                                    if G.edges[nodo1, nodo2, keys]['P_T_Linea'] >= 0:
-                                        AE_T_vanos_tot += G.edges[nodo1, nodo2, keys]['P_T_Linea']
-                                        Q_T_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_T_Linea']
-                                    else:
-                                        AS_T_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_T_Linea'])
-                                except:
-                                    pass
+                        #Para obtener todas las pérdidas asociadas: trazas con TR y QBT_TENSION oportuno, ya sumadas para la hora.
+                        AE_R_vanos_tot, Q_R_vanos_tot, AE_S_vanos_tot, Q_S_vanos_tot, AE_T_vanos_tot, Q_T_vanos_tot, AS_R_vanos_tot, AS_S_vanos_tot, AS_T_vanos_tot = perdidas_tr_tension.get((G.nodes[row]['TR'], G.nodes[row]['QBT_TENSION']), perdidas_vacias)
                                 
-                        #Para obtener la carga conectada:
-                        for nodo, data in G.nodes(data = True, default = 0):
-                            #Se filtran para considerar solo nodos con TR y QBT_TENSION oportuno y que solo sean CUPS.
-                            if data['TR'] ==  G.nodes[row]['TR'] and data['QBT_TENSION'] == G.nodes[row]['QBT_TENSION'] and data['Tipo_Nodo'] == 'CUPS':
-                                P_R_carga_tot += data['P_R_0']
-                                Q_R_carga_tot += data['Q_R_0']
-                                P_S_carga_tot += data['P_S_0']
-                                Q_S_carga_tot += data['Q_S_0']
-                                P_T_carga_tot += data['P_T_0']
-                                Q_T_carga_tot += data['Q_T_0']
+                        #Para obtener la carga conectada: CUPS con TR y QBT_TENSION oportuno, ya sumados para la hora.
+                        P_R_carga_tot, Q_R_carga_tot, P_S_carga_tot, Q_S_carga_tot, P_T_carga_tot, Q_T_carga_tot = cargas_tr_tension.get((G.nodes[row]['TR'], G.nodes[row]['QBT_TENSION']), cargas_vacias)
                         
                         codigo_LVC = row
                                 
                     #Si es el CT con el agregado total
                     elif G.nodes[str(row)]['TR'] == 'CT':
-                        try:
-                            AE_cch_ct =  AE_medida_ct[colum_hora].sum()
-                            if AE_cch_ct > 0:
-                                aa = 'Todo ok'
-                                del aa
-                        except:
-                            AE_cch_ct = 0
-                        try:
-                            AS_cch_ct = AS_medida_ct[colum_hora].sum()
-                            if AS_cch_ct > 0:
-                                aa = 'Todo ok'
-                                del aa
-                        except:
-                            AS_cch_ct = 0
-                                
                         # codigo_LVC = self.id_ct
-                        #Para obtener todas las pérdidas asociadas:
-                        for nodo1, nodo2, keys, data in G.edges(data = True, default = 0, keys=True): 
-                            #No hay que aplicar filtro, se quieren todas las pérdidas del grafo.
-                            #Hay que considerar que desde la última arqueta hasta el CUPS solo está definida la P y Q de la fase correspondiente, sin los try da error.
-                            try:
-                                if G.edges[nodo1, nodo2, keys]['P_R_Linea'] >= 0:
-                                    AE_R_vanos_tot += G.edges[nodo1, nodo2, keys]['P_R_Linea']
-                                    Q_R_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_R_Linea']
-                                else:
-                                    AS_R_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_R_Linea'])
-                            except:
-                                pass
-                            try:
-                                if G.edges[nodo1, nodo2, keys]['P_S_Linea'] >= 0:
-                                    AE_S_vanos_tot += G.edges[nodo1, nodo2, keys]['P_S_Linea']
-                                    Q_S_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_S_Linea']
-                                else:
-                                    AS_S_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_S_Linea'])
-                            except:
-                                pass
-                            try:
-                                if G.edges[nodo1, nodo2, keys]['P_T_Linea'] >= 0:
-                                    AE_T_vanos_tot += G.edges[nodo1, nodo2, keys]['P_T_Linea']
-                                    Q_T_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_T_Linea']
-                                else:
-                                    AS_T_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_T_Linea'])
-                            except:
-                                pass
+                        #Para obtener todas las pérdidas asociadas: no hay que aplicar filtro, se quieren todas las pérdidas del grafo.
+                        AE_R_vanos_tot, Q_R_vanos_tot, AE_S_vanos_tot, Q_S_vanos_tot, AE_T_vanos_tot, Q_T_vanos_tot, AS_R_vanos_tot, AS_S_vanos_tot, AS_T_vanos_tot = perdidas_total
                             
-                        #Para obtener la carga conectada:
-                        for nodo, data in G.nodes(data = True, default = 0):
-                            #Se filtran solo para considerar los CUPS
-                            if data['Tipo_Nodo'] == 'CUPS':
-                                P_R_carga_tot += data['P_R_0']
-                                Q_R_carga_tot += data['Q_R_0']
-                                P_S_carga_tot += data['P_S_0']
-                                Q_S_carga_tot += data['Q_S_0']
-                                P_T_carga_tot += data['P_T_0']
-                                Q_T_carga_tot += data['Q_T_0']   
+                        #Para obtener la carga conectada: todos los CUPS.
+                        P_R_carga_tot, Q_R_carga_tot, P_S_carga_tot, Q_S_carga_tot, P_T_carga_tot, Q_T_carga_tot = cargas_total
                                 
                         codigo_LVC = 'CT'    
                     
                     #Si es un nodo que representa a un trafo (ni tendrá _230 o _400 ni TR=='CT')
                     else:
-                        try:
-                            AE_cch_ct = AE_medida_ct.loc[AE_medida_ct.CODIGO_LVC.str.find(str(row).replace('_TR','T')) >= 0][colum_hora].sum()
-                            if AE_cch_ct > 0:
-                                aa = 'Todo ok'
-                                del aa
-                        except:
-                            AE_cch_ct = 0
-                        try:
-                            AS_cch_ct = AS_medida_ct.loc[AS_medida_ct.CODIGO_LVC.str.find(str(row).replace('_TR','T')) >= 0][colum_hora].sum()
-                            if AS_cch_ct > 0:
-                                aa = 'Todo ok'
-                                del aa
-                        except:
-                            AS_cch_ct = 0
-                            
                         # codigo_LVC = row
-                        #Para obtener todas las pérdidas asociadas:
-                        for nodo1, nodo2, keys, data in G.edges(data = True, default = 0, keys=True):
-                            #Se filtran para considerar solo las trazas de este trafo, pero obviando los niveles de tensión.
-                            if data['TR'] == G.nodes[row]['TR']:
-                                #Hay que considerar que desde la última arqueta hasta el CUPS solo está definida la P y Q de la fase correspondiente, sin los try da error.
-                                try:
-                                    if G.edges[nodo1, nodo2, keys]['P_R_Linea'] >= 0:
-                                        AE_R_vanos_tot += G.edges[nodo1, nodo2, keys]['P_R_Linea']
-                                        Q_R_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_R_Linea']
-                                    else:
-                                        AS_R_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_R_Linea'])
-                                except:
-                                    pass
-                                try:
-                                    if G.edges[nodo1, nodo2, keys]['P_S_Linea'] >= 0:
-                                        AE_S_vanos_tot += G.edges[nodo1, nodo2, keys]['P_S_Linea']
-                                        Q_S_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_S_Linea']
-                                    else:
-                                        AS_S_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_S_Linea'])
-                                except:
-                                    pass
-                                try:
-                                    if G.edges[nodo1, nodo2, keys]['P_T_Linea'] >= 0:
-                                        AE_T_vanos_tot += G.edges[nodo1, nodo2, keys]['P_T_Linea']
-                                        Q_T_vanos_tot += G.edges[nodo1, nodo2, keys]['Q_T_Linea']
-                                    else:
-                                        AS_T_vanos_tot += abs(G.edges[nodo1, nodo2, keys]['P_T_Linea'])
-                                except:
-                                    pass
+                        #Para obtener todas las pérdidas asociadas: trazas de este trafo, pero obviando los niveles de tensión.
+                        AE_R_vanos_tot, Q_R_vanos_tot, AE_S_vanos_tot, Q_S_vanos_tot, AE_T_vanos_tot, Q_T_vanos_tot, AS_R_vanos_tot, AS_S_vanos_tot, AS_T_vanos_tot = perdidas_tr.get(G.nodes[row]['TR'], perdidas_vacias)
                                 
-                        #Para obtener la carga conectada:
-                        for nodo, data in G.nodes(data = True, default = 0):
-                            #Se consideran solo los nodos de ese TR que son CUPS, obviando el QBT_TENSION.
-                            if data['TR'] ==  G.nodes[row]['TR']  and data['Tipo_Nodo'] == 'CUPS':
-                                P_R_carga_tot += data['P_R_0']
-                                Q_R_carga_tot += data['Q_R_0']
-                                P_S_carga_tot += data['P_S_0']
-                                Q_S_carga_tot += data['Q_S_0']
-                                P_T_carga_tot += data['P_T_0']
-                                Q_T_carga_tot += data['Q_T_0']
+                        #Para obtener la carga conectada: CUPS de ese TR, obviando el QBT_TENSION.
+                        P_R_carga_tot, Q_R_carga_tot, P_S_carga_tot, Q_S_carga_tot, P_T_carga_tot, Q_T_carga_tot = cargas_tr.get(G.nodes[row]['TR'], cargas_vacias)
                                 
                         codigo_LVC = row #'TRAFO'
                         
@@ -3375,7 +3438,8 @@ def main(self):
                     if colum_hora == 'VALOR_H24':
                     #     fecha_datetime = fecha_datetime + datetime.timedelta(days=1)
                     #     fecha = int(str(fecha_datetime.strftime("%Y")) + str(fecha_datetime.strftime("%m")) + str(fecha_datetime.strftime("%d")))
-                        fecha_sql = int(str((fecha_datetime + datetime.timedelta(days=1)).strftime("%Y")) + str((fecha_datetime + datetime.timedelta(days=1)).strftime("%m")) + str((fecha_datetime + datetime.timedelta(days=1)).strftime("%d")))
+                        dia_siguiente = fecha_datetime + datetime.timedelta(days=1)
+                        fecha_sql = dia_siguiente.year*10000 + dia_siguiente.month*100 + dia_siguiente.day
                         # id_caso = int(str(int(str((fecha_datetime + datetime.timedelta(days=1)).strftime("%Y")) + str((fecha_datetime + datetime.timedelta(days=1)).strftime("%m")) + str((fecha_datetime + datetime.timedelta(days=1)).strftime("%d")))) + str(diccionario_horas.get(colum_hora)))
                         id_caso = int(str(fecha_sql) + str(diccionario_horas.get(colum_hora)))
 
@@ -3398,28 +3462,14 @@ def main(self):
                     ## Guardado de datos en la BBDD SQL.
                     ##############################################################################
                     if (self.save_ddbb == 0) or (self.save_ddbb == 1):
-                        #Se comprueba que exista la tabla en la BBDD
-                        SQL_Query = pd.read_sql_query("SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE table_name = '" + str(self.tabla_cts_general) + "'", conn)
-                        df_table_exist = pd.DataFrame(SQL_Query, columns=['TABLE_CATALOG','TABLE_SCHEMA','TABLE_NAME','TABLE_TYPE'])
-                
-                        if len(df_table_exist) > 0:
-                            try:
-                                #instruccion_insert = "INSERT INTO " + self.tabla_cts_general + " (ID_Caso, ID_CT, CT_NOMBRE, TRAFO, CODIGO_LVC, CCH_Data_Error, Fecha, Hora, P_R_CT_KW, Q_R_CT_KVAR, P_S_CT_KW, Q_S_CT_KVAR,P_T_CT_KW, Q_T_CT_KVAR, P_CT_MEDIDO_KW, Q_CT_MEDIDO_KVAR, P_R_LINEAS_KW, Q_R_LINEAS_KVAR, P_S_LINEAS_KW, Q_S_LINEAS_KVAR, P_T_LINEAS_KW, Q_T_LINEAS_KVAR) VALUES (" + str(id_caso) + ", " + str(self.id_ct) + ", '" + self.Nombre_CT + "', '" + str(row.TRAFO) + "','"+ str(id_trafo_cch) + "',"  + str(int(CCH_Data_Error)) + ",'" + str(fecha) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(float(P_R_CT_tot)) + ", " + str(float(Q_R_CT_tot)) + ", " + str(float(P_S_CT_tot)) + ", " + str(float(Q_S_CT_tot)) + ", " + str(float(P_T_CT_tot)) + ", " + str(float(Q_T_CT_tot)) + ", " + str(float(AE_cch_ct)) + ", 0, " + str(float(AE_R_vanos_tot)) + ", " + str(float(Q_R_vanos_tot)) + ", " + str(float(AE_S_vanos_tot)) + ", " + str(float(Q_S_vanos_tot)) + ", " + str(float(AE_T_vanos_tot)) + ", " + str(float(Q_T_vanos_tot)) + ");"
-                                # instruccion_insert = "INSERT INTO " + self.tabla_cts_general + " (ID_Caso, ID_CT, CT_NOMBRE, ID_TRAFO, CODIGO_LVC, CCH_Data_Error, Fecha, Hora, P_R_CT_KW, Q_R_CT_KVAR, P_S_CT_KW, Q_S_CT_KVAR,P_T_CT_KW, Q_T_CT_KVAR, P_CT_MEDIDO_KW, Q_CT_MEDIDO_KVAR, P_R_LINEAS_KW, Q_R_LINEAS_KVAR, P_S_LINEAS_KW, Q_S_LINEAS_KVAR, P_T_LINEAS_KW, Q_T_LINEAS_KVAR) VALUES (" + str(id_caso) + ", " + str(self.id_ct) + ", '" + self.Nombre_CT + "', '" + str(row) + "','"+ str(codigo_LVC) + "',"  + str(int(CCH_Data_Error)) + ",'" + str(fecha_sql) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(float(P_R_CT_tot)) + ", " + str(float(Q_R_CT_tot)) + ", " + str(float(P_S_CT_tot)) + ", " + str(float(Q_S_CT_tot)) + ", " + str(float(P_T_CT_tot)) + ", " + str(float(Q_T_CT_tot)) + ", " + str(float(AE_cch_ct)) + ", 0, " + str(float(AE_R_vanos_tot)) + ", " + str(float(Q_R_vanos_tot)) + ", " + str(float(AE_S_vanos_tot)) + ", " + str(float(Q_S_vanos_tot)) + ", " + str(float(AE_T_vanos_tot)) + ", " + str(float(Q_T_vanos_tot)) + ");"
-                                #La reactiva está definida a 0 porque no se ha desarrollado un método de cálculo, aunque el grafo está preparado para asumirlo.
-                                #Columnas P_R_CT_KW, P_S_CT_KW, P_T_CT_KW representan el valor CALCULADO de POTENCIA en los nodos del CT (CT, trafo, nivel de tensión). Implica la suma de las CCH de clientes (AE-AS) + pérdidas en la red dependientes del nodo en cuestión (CT, trafo, nivel de tensión)
-                                #AE_CT_MEDIDO_KW y AS_CT_MEDIDO_KW son los valores AE y AS medidos en el CT para ese nivel (CT, trafo y nivel de tensión)
-                                #AE_R_LINEAS_KW, AE_S_LINEAS_KW, AE_T_LINEAS_KW son las pérdidas totales aguas abajo desde cada nodo del CT (CT, trafo, nivel de tensión) asociadas A LA POTENCIA ETNREGADA POR EL TRAFO, no al posible autoconsumo vertido a la red.
-                                #AS_R_LINEAS_KW, AS_S_LINEAS_KW, AS_T_LINEAS_KW son las pérdidas totales aguas abajo desde cada nodo del CT (CT, trafo, nivel de tensión) asociadas AL AUTOCONSUMO, y por lo tanto no aplicables a la potencia vertida por el trafo.
-                                # instruccion_insert = "INSERT INTO " + self.tabla_cts_general + " (ID_Caso, ID_CT, CT_NOMBRE, ID_TRAFO, CODIGO_LVC, CCH_Data_Error, Fecha, Hora, P_R_CT_KW, P_S_CT_KW, P_T_CT_KW, AE_CT_MEDIDO_KW, AS_CT_MEDIDO_KW, AE_R_LINEAS_KW, AE_S_LINEAS_KW, AE_T_LINEAS_KW, AS_R_LINEAS_KW, AS_S_LINEAS_KW, AS_T_LINEAS_KW) VALUES (" + str(id_caso) + ", " + str(self.id_ct) + ", '" + self.Nombre_CT + "', '" + str(row) + "','"+ str(codigo_LVC) + "',"  + str(int(CCH_Data_Error)) + ",'" + str(fecha_sql) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(float(P_R_CT_tot)) + ", " + str(float(P_S_CT_tot)) + ", " + str(float(P_T_CT_tot)) + ", " + str(float(AE_cch_ct)) + ", " + str(float(AS_cch_ct)) + ", " + str(float(AE_R_vanos_tot)) + ", " + str(float(AE_S_vanos_tot)) + ", " + str(float(AE_T_vanos_tot)) + ", " + str(float(AS_R_vanos_tot)) + ", " + str(float(AS_S_vanos_tot)) + ", " + str(float(AS_T_vanos_tot)) + ");"
-                                instruccion_insert = "INSERT INTO " + self.tabla_cts_general + " (ID_Caso, ID_CT, CT_NOMBRE, ID_NODO, CCH_Data_Error, Fecha, Hora, P_R_CT_KW, P_S_CT_KW, P_T_CT_KW, AE_CT_MEDIDO_KW, AS_CT_MEDIDO_KW, AE_R_LINEAS_KW, AE_S_LINEAS_KW, AE_T_LINEAS_KW, AS_R_LINEAS_KW, AS_S_LINEAS_KW, AS_T_LINEAS_KW) VALUES (" + str(id_caso) + ", " + str(self.id_ct) + ", '" + self.Nombre_CT + "', '" + str(codigo_LVC) + "',"  + str(int(CCH_Data_Error)) + ",'" + str(fecha_sql) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(float(P_R_CT_tot)) + ", " + str(float(P_S_CT_tot)) + ", " + str(float(P_T_CT_tot)) + ", " + str(float(AE_cch_ct)) + ", " + str(float(AS_cch_ct)) + ", " + str(float(AE_R_vanos_tot)) + ", " + str(float(AE_S_vanos_tot)) + ", " + str(float(AE_T_vanos_tot)) + ", " + str(float(AS_R_vanos_tot)) + ", " + str(float(AS_S_vanos_tot)) + ", " + str(float(AS_T_vanos_tot)) + ");"
-                                # print(instruccion_insert)
-                                cursor.execute(instruccion_insert)
-                                conn.commit()
-                                # logger.debug(str(colum_hora) + ' guardado correctamente en la tabla general de la BBDD.')
-                            except:
-                                logger.error('Error al guardar en la BBDD. ' + instruccion_insert)
-                                continue
+                        #Se comprueba que exista la tabla en la BBDD (consultado una sola vez al abrir la conexión)
+                        if existe_tabla_general:
+                            #La reactiva está definida a 0 porque no se ha desarrollado un método de cálculo, aunque el grafo está preparado para asumirlo.
+                            #Columnas P_R_CT_KW, P_S_CT_KW, P_T_CT_KW representan el valor CALCULADO de POTENCIA en los nodos del CT (CT, trafo, nivel de tensión). Implica la suma de las CCH de clientes (AE-AS) + pérdidas en la red dependientes del nodo en cuestión (CT, trafo, nivel de tensión)
+                            #AE_CT_MEDIDO_KW y AS_CT_MEDIDO_KW son los valores AE y AS medidos en el CT para ese nivel (CT, trafo y nivel de tensión)
+                            #AE_R_LINEAS_KW, AE_S_LINEAS_KW, AE_T_LINEAS_KW son las pérdidas totales aguas abajo desde cada nodo del CT (CT, trafo, nivel de tensión) asociadas A LA POTENCIA ETNREGADA POR EL TRAFO, no al posible autoconsumo vertido a la red.
+                            #AS_R_LINEAS_KW, AS_S_LINEAS_KW, AS_T_LINEAS_KW son las pérdidas totales aguas abajo desde cada nodo del CT (CT, trafo, nivel de tensión) asociadas AL AUTOCONSUMO, y por lo tanto no aplicables a la potencia vertida por el trafo.
+                            filas_general.append((id_caso, self.id_ct, self.Nombre_CT, str(codigo_LVC), int(CCH_Data_Error), str(fecha_sql), diccionario_horas.get(colum_hora) + ":00:00", float(P_R_CT_tot), float(P_S_CT_tot), float(P_T_CT_tot), float(AE_cch_ct), float(AS_cch_ct), float(AE_R_vanos_tot), float(AE_S_vanos_tot), float(AE_T_vanos_tot), float(AS_R_vanos_tot), float(AS_S_vanos_tot), float(AS_T_vanos_tot)))
                         else:
                             logger.error('No existe ninguna tabla con nombre ' + str(self.tabla_cts_general) + ' en la BBDD. Ejecutar en el SQL el comando: ' + "CREATE TABLE [DEPERTEC].[dbo].[" + str(self.tabla_cts_general) + "] (ID_Caso INT, ID_CT INT, CT_NOMBRE VARCHAR(45), ID_TRAFO VARCHAR(15), CODIGO_LVC VARCHAR(15), CCH_Data_Error INT, Fecha DATE, Hora TIME(7), P_R_CT_KW FLOAT, P_S_CT_KW FLOAT, P_T_CT_KW FLOAT, AE_CT_MEDIDO_KW FLOAT, AS_CT_MEDIDO_KW FLOAT, AE_R_LINEAS_KW FLOAT, AE_S_LINEAS_KW FLOAT, AE_T_LINEAS_KW FLOAT, AS_R_LINEAS_KW FLOAT, AS_S_LINEAS_KW FLOAT, AS_T_LINEAS_KW FLOAT);")
                             # instruccion_create = "CREATE TABLE [DEPERTEC].[dbo].[" + str(self.tabla_cts_general) + "] (ID_Caso INT, ID_CT INT, CT_NOMBRE VARCHAR(45), ID_TRAFO VARCHAR(15), CODIGO_LVC VARCHAR(15), CCH_Data_Error INT, Fecha DATE, Hora TIME(7), P_R_CT_KW FLOAT, P_S_CT_KW FLOAT, P_T_CT_KW FLOAT, AE_CT_MEDIDO_KW FLOAT, AS_CT_MEDIDO_KW FLOAT, AE_R_LINEAS_KW FLOAT, AE_S_LINEAS_KW FLOAT, AE_T_LINEAS_KW FLOAT, AS_R_LINEAS_KW FLOAT, AS_S_LINEAS_KW FLOAT, AS_T_LINEAS_KW FLOAT);"
@@ -3429,24 +3479,13 @@ def main(self):
                 #Se guarda el agregado total de potencia por fase en cada nodo, no se guardan todos los datos para facilitar la gestión de la BBDD.
                 #Hay que hacerlo fuera del ciclo de lista_nodos_resultados para que no lo guarde varias veces.
                 if (self.save_ddbb == 0) or (self.save_ddbb == 2):
-                    #Se comprueba que existe la tabla de nodos y de trazas e la BBDD
-                    SQL_Query = pd.read_sql_query("SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE table_name = '" + str(tabla_ct_nodos) + "'", conn)
-                    df_table_exist = pd.DataFrame(SQL_Query, columns=['TABLE_CATALOG','TABLE_SCHEMA','TABLE_NAME','TABLE_TYPE'])
-                    
-                    if len(df_table_exist) > 0:
+                    #Se comprueba que existe la tabla de nodos y de trazas e la BBDD (consultado una sola vez al abrir la conexión)
+                    if existe_tabla_nodos:
                         #Se recorren todos los nodos y se guardan en el SQL las P y Q calculadas.
                         for nodo, data in G.nodes(data=True, default = 0):                                
                             #Se guarda la información de los nodos, sin contar los CUPS para no guardar demasiados datos.
                             if (data['Tipo_Nodo'] != 'CUPS' and data['Tipo_Nodo'] != 'CUPS_TR'):
-                                try:
-                                    # instruccion_insert = "INSERT INTO " + tabla_ct_nodos + " (ID_Caso, ID_NODO_LBT_ID, Fecha, Hora, P_R_KW, Q_R_KVAR, P_S_KW, Q_S_KVAR, P_T_KW, Q_T_KVAR) VALUES (" + str(id_caso) + ", '" + str(nodo) + "', '" + str(fecha) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(data_P_R) + ", " + str(data_Q_R) + ", " + str(data_P_S) + ", " + str(data_Q_S) + ", " + str(data_P_T) + ", " + str(data_Q_T) + ");"
-                                    instruccion_insert = "INSERT INTO " + tabla_ct_nodos + " (ID_Caso, ID_NODO_LBT_ID, Fecha, Hora, P_R_KW, P_S_KW, P_T_KW) VALUES (" + str(id_caso) + ", '" + str(nodo) + "', '" + str(fecha_sql) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(data['P_R_0']) + ", " + str(data['P_S_0']) + ", " + str(data['P_T_0']) + ");"
-                                    cursor.execute(instruccion_insert)
-                                    conn.commit()
-                                    logger.debug(str(colum_hora) + ' guardado correctamente en la tabla de nodos de la BBDD.')
-                                except:
-                                    logger.error('Error al guardar en la BBDD. ' + instruccion_insert)
-                                    continue
+                                filas_nodos.append((id_caso, str(nodo), str(fecha_sql), diccionario_horas.get(colum_hora) + ":00:00", float(data['P_R_0']), float(data['P_S_0']), float(data['P_T_0'])))
                     else:
                         # logger.error('No existe ninguna tabla con nombre ' + tabla_ct_nodos + ' en la BBDD. Ejecutar en el SQL el comando: ' + "CREATE TABLE [DEPERTEC].[dbo].[" + str(tabla_ct_nodos) + "] (ID_Caso INT, ID_NODO_LBT_ID VARCHAR(45), Fecha DATE, Hora TIME(7), P_R_KW FLOAT, Q_R_KVAR FLOAT, P_S_KW FLOAT, Q_S_KVAR FLOAT, P_T_KW FLOAT, Q_T_KVAR FLOAT);")
                         logger.error('No existe ninguna tabla con nombre ' + str(tabla_ct_nodos) + ' en la BBDD. Ejecutar en el SQL el comando: ' + "CREATE TABLE [DEPERTEC].[dbo].[" + str(tabla_ct_nodos) + "] (ID_Caso INT, ID_NODO_LBT_ID VARCHAR(45), Fecha DATE, Hora TIME(7), P_R_KW FLOAT, P_S_KW FLOAT, P_T_KW FLOAT);")
@@ -3454,38 +3493,19 @@ def main(self):
                         # instruccion_create = "CREATE TABLE [DEPERTEC].[dbo].[" + str(tabla_ct_nodos) + "] (ID_Caso INT, ID_NODO_LBT_ID VARCHAR(45), Fecha DATE, Hora TIME(7), P_R_KW FLOAT, P_S_KW FLOAT, P_T_KW FLOAT);"
                         #cursor.execute(instruccion_create)
                     
-                    del df_table_exist
-                    
                     #Ahora para la tabla de trazas
-                    SQL_Query = pd.read_sql_query("SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE table_name = '" + str(tabla_ct_trazas) + "'", conn)
-                    df_table_exist = pd.DataFrame(SQL_Query, columns=['TABLE_CATALOG','TABLE_SCHEMA','TABLE_NAME','TABLE_TYPE'])
-            
-                    if len(df_table_exist) > 0:
+                    if existe_tabla_trazas:
                         for nodo1, nodo2, keys, data in G.edges(data = True, default = 0, keys=True):         
                             #Se guarda la información de las trazas, sin contar los enlaces con los CUPS. Los CUPS darían error porque solo tienen P y Q de una fase (si son monofásicos)
                             if (G.nodes[nodo1]['Tipo_Nodo'] != 'CUPS') and (G.nodes[nodo2]['Tipo_Nodo'] != 'CUPS') and (G.nodes[nodo1]['Tipo_Nodo'] != 'CUPS_TR') and (G.nodes[nodo2]['Tipo_Nodo'] != 'CUPS_TR'):
-                                try:
-                                    # instruccion_insert = "INSERT INTO " + tabla_ct_trazas + " (ID_Caso, ID_NODO_LBT_ID_INI, ID_NODO_LBT_ID_FIN, ID_TRAZA, Fecha, Hora, P_R_LINEA_KW, Q_R_LINEA_KVAR, P_S_LINEA_KW, Q_S_LINEA_KVAR, P_T_LINEA_KW, Q_T_LINEA_KVAR) VALUES (" + str(id_caso) + ", '" + str(nodo1) + "', '" + str(nodo2) + "', " + str(keys) + ", '" + str(fecha) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(float(data['P_R_Linea'])) + ", " + str(float(data['Q_R_Linea'])) + ", " + str(float(data['P_S_Linea'])) + ", " + str(float(data['Q_S_Linea'])) + ", " + str(float(data['P_T_Linea'])) + ", " + str(float(data['Q_T_Linea'])) + ");"
-                                    instruccion_insert = "INSERT INTO " + tabla_ct_trazas + " (ID_Caso, ID_NODO_LBT_ID_INI, ID_NODO_LBT_ID_FIN, ID_TRAZA, Fecha, Hora, P_R_LINEA_KW, P_S_LINEA_KW, P_T_LINEA_KW) VALUES (" + str(id_caso) + ", '" + str(nodo1) + "', '" + str(nodo2) + "', " + str(keys) + ", '" + str(fecha_sql) + "', '" + diccionario_horas.get(colum_hora) + ":00:00" + "', " + str(float(data['P_R_Linea'])) + ", " + str(float(data['P_S_Linea'])) + ", " + str(float(data['P_T_Linea'])) + ");"
-                #                   print(instruccion_insert)
-                                    cursor.execute(instruccion_insert)
-                                    conn.commit()
-                                    logger.debug(str(colum_hora) + ' guardado correctamente en la tabla de trazas de la BBDD.')
-                                except:
-                                    logger.error('Error al guardar en la BBDD. ' + instruccion_insert)
-                                    continue
+                                filas_trazas.append((id_caso, str(nodo1), str(nodo2), keys, str(fecha_sql), diccionario_horas.get(colum_hora) + ":00:00", float(data['P_R_Linea']), float(data['P_S_Linea']), float(data['P_T_Linea'])))
                     else:
                         # logger.error('No existe ninguna tabla con nombre ' + tabla_ct_trazas + ' en la BBDD. Ejecutar en el SQL el comando: ' + "CREATE TABLE [DEPERTEC].[dbo].[" + tabla_ct_trazas + "] (ID_Caso INT, ID_NODO_LBT_ID_INI VARCHAR(45), ID_NODO_LBT_ID_FIN VARCHAR(45), ID_TRAZA INT, Fecha DATE, Hora TIME(7), P_R_LINEA_KW FLOAT, Q_R_LINEA_KVAR FLOAT, P_S_LINEA_KW FLOAT, Q_S_LINEA_KVAR FLOAT, P_T_LINEA_KW FLOAT, Q_T_LINEA_KVAR FLOAT);")
                         logger.error('No existe ninguna tabla con nombre ' + str(tabla_ct_trazas) + ' en la BBDD. Ejecutar en el SQL el comando: ' + "CREATE TABLE [DEPERTEC].[dbo].[" + tabla_ct_trazas + "] (ID_Caso INT, ID_NODO_LBT_ID_INI VARCHAR(45), ID_NODO_LBT_ID_FIN VARCHAR(45), ID_TRAZA INT, Fecha DATE, Hora TIME(7), P_R_LINEA_KW FLOAT, Q_R_LINEA_KVAR FLOAT, P_S_LINEA_KW FLOAT, Q_S_LINEA_KVAR FLOAT, P_T_LINEA_KW FLOAT, Q_T_LINEA_KVAR FLOAT);")
                         #instruccion_create = "CREATE TABLE [DEPERTEC].[dbo].[" + str(tabla_ct_trazas) + "] (ID_Caso INT, ID_NODO_LBT_ID_INI VARCHAR(45), ID_NODO_LBT_ID_FIN VARCHAR(45), Fecha DATE, Hora TIME(7), P_R_LINEA_KW FLOAT, Q_R_LINEA_KVAR FLOAT, P_S_LINEA_KW FLOAT, Q_S_LINEA_KVAR FLOAT, P_T_LINEA_KW FLOAT, Q_T_LINEA_KVAR FLOAT);"
                         instruccion_create = "CREATE TABLE [DEPERTEC].[dbo].[" + str(tabla_ct_trazas) + "] (ID_Caso INT, ID_NODO_LBT_ID_INI VARCHAR(45), ID_NODO_LBT_ID_FIN VARCHAR(45), Fecha DATE, Hora TIME(7), P_R_LINEA_KW FLOAT, P_S_LINEA_KW FLOAT, P_T_LINEA_KW FLOAT);"
                         #cursor.execute(instruccion_create)
-                    del df_table_exist
                         
-                #Se cierra la conexión SQL
-                if (self.save_ddbb == 0) or (self.save_ddbb == 1) or (self.save_ddbb == 2):
-                    cursor.close()
-                    del cursor
         
                 # if (self.save_ddbb == 0):
                 #     logger.debug(str(colum_hora) + ' guardado correctamente en la BBDD en todas las tablas.')
@@ -3496,8 +3516,22 @@ def main(self):
                 # if (self.save_ddbb >= 3) or (self.save_ddbb < 0):
                 #     logger.warning('Ningún dato guardado en la BBDD. Cambiar variable "save_ddbb" para guardar.')
 
+        #Se guardan en la BBDD todas las filas del día, con una inserción por lotes y un commit por tabla.
+        if (self.save_ddbb == 0) or (self.save_ddbb == 1) or (self.save_ddbb == 2):
+            inserta_filas(instruccion_insert_general, filas_general)
+            inserta_filas(instruccion_insert_nodos, filas_nodos)
+            inserta_filas(instruccion_insert_trazas, filas_trazas)
+            logger.debug('Guardadas en la BBDD ' + str(len(filas_general)) + ', ' + str(len(filas_nodos)) + ' y ' + str(len(filas_trazas)) + ' filas en las tablas ' + str(self.tabla_cts_general) + ', ' + str(tabla_ct_nodos) + ' y ' + str(tabla_ct_trazas) + ' para la fecha ' + str(fecha))
+        del filas_general, filas_nodos, filas_trazas
+        
         fecha_datetime = fecha_datetime + datetime.timedelta(days=1)
     
+    #Se cierra la conexión SQL
+    if (self.save_ddbb == 0) or (self.save_ddbb == 1) or (self.save_ddbb == 2):
+        cursor.close()
+        conn.close()
+        del cursor, conn
+    
     logger.info('Fin de la ejecución: ' + str(time.strftime("%d/%m/%y")) + ' a las ' + str(time.strftime("%H:%M:%S")))
     logger.info('###################################################################')
     # self.update_graph_data_error(graph_data_error)